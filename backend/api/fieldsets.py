@@ -0,0 +1,152 @@
+"""
+Sparse fieldsets and opt-in expansion for the API resources.
+
+    ?fields=name,total_emissions_tco2e   only serialize these fields
+    ?expand=scope                        nest these relations instead of their ID
+
+The requested fields drive both the serializer and the queryset: relations that
+end up nested are loaded with select_related/prefetch_related (and only then),
+and with ?fields= the columns are restricted with only().
+
+Serializers opt in with DynamicFieldsMixin, declaring the relations that can be
+expanded in expandable_fields. Viewsets opt in with SparseFieldsetMixin and call
+apply_fieldset() on their queryset, declaring in field_relations what each field
+needs loaded and in field_dependencies the model fields that computed fields read.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+
+
+def _query_list(request, name):
+    """Comma-separated query parameter as a list, or None when absent"""
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin applying the 'fields' and 'expand' entries of the context.
+    expandable_fields: {field name: (serializer class, kwargs)} nested on ?expand=,
+    replacing the field declared under the same name (usually a primary key).
+    Only the top-level serializer is affected: nested serializers are created
+    without the request context.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        for name in self.context.get('expand') or ():
+            if name in self.expandable_fields:
+                serializer_class, options = self.expandable_fields[name]
+                self.fields[name] = serializer_class(**options)
+
+        requested = self.context.get('fields')
+        if requested is not None:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset mixin for ?fields= and ?expand= (read requests only).
+    field_relations: {field name: {'select_related': [...], 'prefetch_related': [...],
+    'annotate': {...}}}, what the queryset needs to serialize the field (override
+    get_field_relations when it depends on the field's serializer).
+    field_dependencies: {field name: [model fields]} for fields whose source isn't a
+    model field (method fields, properties, annotations); without it only() isn't used.
+    """
+    field_relations = {}
+    field_dependencies = {}
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request is not None and self.request.method in permissions.SAFE_METHODS:
+            context['fields'] = _query_list(self.request, 'fields')
+            context['expand'] = _query_list(self.request, 'expand')
+        return context
+
+    def get_fieldset_serializer(self):
+        """Serializer with the requested fieldset, validating the query parameters"""
+        serializer = self.get_serializer()
+        context = serializer.context
+        known = set(serializer.__class__(context={}).fields) | set(serializer.expandable_fields)
+
+        unknown_fields = set(context.get('fields') or ()) - known
+        if unknown_fields:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown_fields))}"})
+        unknown_expand = set(context.get('expand') or ()) - set(serializer.expandable_fields)
+        if unknown_expand:
+            raise ValidationError({'expand': f"Cannot expand: {', '.join(sorted(unknown_expand))}"})
+        return serializer
+
+    def get_field_relations(self, name, field):
+        """Query plan needed to serialize the field (see field_relations)"""
+        return self.field_relations.get(name, {})
+
+    def apply_fieldset(self, queryset):
+        """Load what the requested fieldset serializes, and only that"""
+        if self.request is None or self.request.method not in permissions.SAFE_METHODS:
+            return queryset
+
+        serializer = self.get_fieldset_serializer()
+        fields = {name: field for name, field in serializer.fields.items() if not field.write_only}
+
+        select_related, prefetch_related, annotations = [], [], {}
+        for name, field in fields.items():
+            relations = self.get_field_relations(name, field)
+            # Several fields can need the same relation: each lookup is added once
+            select_related += [lookup for lookup in relations.get('select_related', ()) if lookup not in select_related]
+            prefetch_related += [lookup for lookup in relations.get('prefetch_related', ()) if lookup not in prefetch_related]
+            annotations.update(relations.get('annotate', {}))
+
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+
+        if serializer.context.get('fields') is not None:
+            columns = self.fieldset_columns(queryset.model, fields)
+            if columns is not None:
+                # Fields traversed by select_related can't be deferred, and the
+                # ordering fields are read back by keyset pagination
+                columns.update(lookup.split('__')[0] for lookup in select_related)
+                columns.update(self.ordering_columns(queryset))
+                queryset = queryset.only(*columns)
+        return queryset
+
+    @staticmethod
+    def ordering_columns(queryset):
+        """Model fields the queryset is ordered by"""
+        query = queryset.query
+        order_by = query.order_by or (queryset.model._meta.ordering if query.default_ordering else ())
+        names = {term.lstrip('-') for term in order_by if isinstance(term, str)}
+        return {
+            name for name in names
+            if name != 'pk' and '__' not in name and name not in query.annotations and name != '?'
+        }
+
+    def fieldset_columns(self, model, fields):
+        """Model fields to load for the serialized fields, or None if they can't be determined"""
+        columns = {model._meta.pk.name}
+        for name, field in fields.items():
+            if name in self.field_dependencies:
+                columns.update(self.field_dependencies[name])
+                continue
+            source = field.source.split('.')[0] if field.source != '*' else None
+            try:
+                model_field = model._meta.get_field(source) if source else None
+            except FieldDoesNotExist:
+                model_field = None
+            if model_field is None:
+                return None
+            # Reverse relations are prefetched by primary key
+            if model_field.concrete:
+                columns.add(model_field.name)
+        return columns
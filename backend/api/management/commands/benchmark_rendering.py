@@ -0,0 +1,124 @@
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.middleware import BROTLI_QUALITY, brotli
+from api.models import EmissionActivity, EmissionFactor, EmissionScope, LCAProduct, Project, ProductExchange
+from api.renderers import FastJSONRenderer, orjson
+from api.serializer import EmissionFactorSerializer
+from api.views import ProjectViewSet
+from api.views_visualization import GlobeDataView
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the render time and response size of DRF's JSON renderer and the orjson renderer, "
+        "uncompressed, gzipped and with Brotli, on a seeded large project (rolled back afterwards)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--activities', type=int, default=5000, help="Emission activities in the project")
+        parser.add_argument('--factors', type=int, default=2000, help="Emission factors in the factor list")
+        parser.add_argument('--products', type=int, default=200, help="LCA products, with 10 exchanges each")
+        parser.add_argument('--repeat', type=int, default=5, help="Renders per payload (the fastest is reported)")
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed: FastJSONRenderer falls back to JSONRenderer"))
+
+        with transaction.atomic():
+            project = self.seed(options)
+            payloads = self.payloads(project)
+            transaction.set_rollback(True)
+
+        header = f"{'payload':<16}{'renderer':<10}{'render ms':>11}{'bytes':>12}{'gzip':>11}{'brotli':>11}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, data in payloads.items():
+            rendered = {}
+            for label, renderer in (('drf', JSONRenderer()), ('orjson', FastJSONRenderer())):
+                seconds, content = self.render(renderer, data, options['repeat'])
+                rendered[label] = content
+                gzipped = len(compress_string(content))
+                brotli_size = len(brotli.compress(content, mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)) if brotli else '-'
+                self.stdout.write(
+                    f"{name:<16}{label:<10}{seconds * 1000:>11.1f}{len(content):>12}{gzipped:>11}{brotli_size:>11}"
+                )
+            if json.loads(rendered['drf']) != json.loads(rendered['orjson']):
+                self.stdout.write(self.style.ERROR(f"{name}: the renderers produced different documents"))
+
+    @staticmethod
+    def render(renderer, data, repeat):
+        best, content = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            content = renderer.render(data)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, content
+
+    def seed(self, options):
+        rng = random.Random(0)
+        factors = EmissionFactor.objects.bulk_create([
+            EmissionFactor(
+                name=f"Benchmark factor {number}", category='purchased_goods_services',
+                emission_factor_value=Decimal(rng.randint(1, 10**6)) / 1000, unit='kg', source='Benchmark',
+                year=2024, description="Synthetic emission factor for the rendering benchmark",
+                applicable_scopes=[3], uncertainty_type=2, uncertainty_params={'loc': 1.0, 'scale': 0.1},
+            )
+            for number in range(options['factors'])
+        ])
+
+        project = Project.objects.create(
+            name='Rendering benchmark', location='Singapore', latitude=Decimal('1.352083'), longitude=Decimal('103.819836'),
+        )
+        scopes = [EmissionScope.objects.create(project=project, scope_number=number) for number in (1, 2, 3)]
+
+        activities = []
+        for number in range(options['activities']):
+            factor = rng.choice(factors)
+            quantity = Decimal(rng.randint(1, 10**6)) / 100
+            activities.append(EmissionActivity(
+                project=project, scope=rng.choice(scopes), activity_name=f"Shipment {number}",
+                quantity=quantity, unit=factor.unit, emission_factor=factor,
+                calculated_emissions=(quantity * factor.emission_factor_value / 1000).quantize(Decimal('0.000001')),
+                origin_location='Port', origin_latitude=Decimal(rng.uniform(-60, 60)).quantize(Decimal('0.000001')),
+                origin_longitude=Decimal(rng.uniform(-180, 180)).quantize(Decimal('0.000001')),
+                destination_latitude=project.latitude, destination_longitude=project.longitude,
+            ))
+        EmissionActivity.objects.bulk_create(activities, batch_size=1000)
+
+        products = LCAProduct.objects.bulk_create([
+            LCAProduct(project=project, name=f"Component {number}", functional_unit='1 unit')
+            for number in range(options['products'])
+        ])
+        ProductExchange.objects.bulk_create([
+            ProductExchange(
+                product=product, emission_factor=factor, name=factor.name, quantity=Decimal('2.5'), unit=factor.unit,
+                calculated_impact=Decimal('2.5') * factor.emission_factor_value,
+            )
+            for product in products for factor in rng.sample(factors, min(10, len(factors)))
+        ], batch_size=1000)
+        return project
+
+    @staticmethod
+    def payloads(project):
+        """The data of the heavy responses, before rendering"""
+        factory = APIRequestFactory()
+        project_detail = ProjectViewSet.as_view({'get': 'retrieve'})(
+            factory.get(f'/api/projects/{project.pk}/'), project_id=project.pk
+        )
+        globe = GlobeDataView.as_view()(factory.get(f'/api/globe-data/{project.pk}/'), project_id=project.pk)
+        factors = EmissionFactorSerializer(EmissionFactor.objects.all(), many=True)
+        return {
+            'project detail': project_detail.data,
+            'globe data': globe.data,
+            'factor list': factors.data,
+        }
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Project
+from api.utils.ledger import rebuild_ledger
+from api.utils.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly emission ledger and rollup table from the activity tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            action='append',
+            dest='projects',
+            help="Only rebuild rollups for this project ID (can be given multiple times)"
+        )
+
+    def handle(self, *args, **options):
+        projects = None
+        if options['projects']:
+            projects = Project.objects.filter(pk__in=options['projects'])
+
+        entries = rebuild_ledger(projects)
+        count = rebuild_rollups(projects)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {entries} emission ledger rows and {count} monthly emission rollup rows"
+        ))
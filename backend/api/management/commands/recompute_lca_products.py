@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.utils.lca_graph import recompute_all_products
+
+
+class Command(BaseCommand):
+    help = "Recompute the footprint of every LCA product and its exchanges with one network solve"
+
+    def handle(self, *args, **options):
+        count = recompute_all_products()
+        self.stdout.write(self.style.SUCCESS(f"Updated the footprint of {count} LCA products"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.utils.ledger import refresh_projections
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-expand the projected repetitions of recurring activities up to the horizon counted from "
+        "today (run daily, projections otherwise stay where the activity's last save left them)"
+    )
+
+    def handle(self, *args, **options):
+        count = refresh_projections()
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {count} projected emission ledger rows"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.models import FactorImportJob
+from api.utils.import_jobs import interrupted_jobs, run_import_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the queued and interrupted factor import jobs in this process, each resuming after its "
+        "last committed chunk (or the given jobs, including failed ones)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_ids', nargs='*', help="Jobs to run (default: queued and interrupted jobs)")
+
+    def handle(self, *args, **options):
+        job_ids = options['job_ids'] or list(interrupted_jobs().values_list('job_id', flat=True))
+        for job_id in job_ids:
+            if not run_import_job(job_id):
+                self.stdout.write(self.style.WARNING(f"{job_id}: not found, finished or running elsewhere"))
+                continue
+            job = FactorImportJob.objects.get(pk=job_id)
+            style = self.style.SUCCESS if job.status == FactorImportJob.STATUS_COMPLETED else self.style.ERROR
+            self.stdout.write(style(
+                f"{job_id} {job.status}: {job.rows_parsed} rows, {job.rows_inserted} inserted, "
+                f"{job.rows_skipped} skipped, {job.rows_errored} errors"
+                + (f", {job.rows_updated} updated, {job.factors_retired} retired" if job.delta else "")
+            ))
@@ -0,0 +1,56 @@
+"""
+Response compression negotiated by Accept-Encoding.
+
+CompressionMiddleware is Django's GZipMiddleware with Brotli added for JSON API
+responses: clients that accept 'br' get Brotli, which compresses JSON better than
+gzip, when the brotli package is installed; the others get gzip. Other
+responses (admin pages with CSRF tokens, streaming) keep GZipMiddleware's
+behaviour, including its BREACH mitigation.
+"""
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+# Quality 11 is for static assets; 4-6 compress dynamic responses better than gzip at similar speed
+BROTLI_QUALITY = 5
+
+# Not worth compressing below this size (as GZipMiddleware)
+MIN_LENGTH = 200
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith('application/json')
+            or not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        if len(response.content) < MIN_LENGTH:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        compressed = brotli.compress(response.content, mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+
+        # Compressed bodies differ per encoding, so a strong ETag becomes weak (as GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:08
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_emissionactivity_destination_latitude_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Scenario',
+            fields=[
+                ('scenario_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('adjustments', models.JSONField(blank=True, default=dict, help_text="Percent change per activity, e.g. {'activity_id': -20}")),
+                ('timeline_years', models.IntegerField(default=5)),
+                ('growth_rate', models.FloatField(default=0.0, help_text='Constant annual growth rate (e.g. 0.03 for 3%)')),
+                ('growth_curve', models.JSONField(blank=True, default=list, help_text='Optional list of annual growth rates, overrides growth_rate when provided')),
+                ('baseline_snapshot', models.JSONField(blank=True, default=dict)),
+                ('baseline_total', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('adjusted_total', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('baseline_date', models.DateTimeField(blank=True, help_text='When the baseline snapshot was last fully rebuilt', null=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scenarios', to='api.project')),
+            ],
+            options={
+                'ordering': ['-created_date'],
+            },
+        ),
+    ]
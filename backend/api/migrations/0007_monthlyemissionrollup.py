@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:11
+
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Trunc, TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Aggregate existing activities into the new rollup table"""
+    MonthlyEmissionRollup = apps.get_model('api', 'MonthlyEmissionRollup')
+    sources = (
+        (apps.get_model('api', 'EmissionActivity'), 'emission_factor', Decimal('1')),
+        (apps.get_model('api', 'LCAActivity'), 'lca', Decimal('0.001')),
+    )
+
+    rows = defaultdict(Decimal)
+    for model, source_type, to_tco2e in sources:
+        totals = (
+            model.objects
+            .annotate(activity_date=Coalesce('period_start', TruncDate('created_date')))
+            .annotate(month=Trunc('activity_date', 'month', output_field=models.DateField()))
+            .values('project_id', 'scope__scope_number', 'scope3_category', 'month')
+            .annotate(total=models.Sum('calculated_emissions'))
+            .order_by()
+        )
+        for row in totals:
+            key = (row['project_id'], row['scope__scope_number'], row['scope3_category'] or '', row['month'], source_type)
+            rows[key] += Decimal(str(row['total'] or 0)) * to_tco2e
+
+    MonthlyEmissionRollup.objects.bulk_create([
+        MonthlyEmissionRollup(
+            project_id=project_id,
+            scope_number=scope_number,
+            scope3_category=scope3_category,
+            month=month,
+            source_type=source_type,
+            emissions_tco2e=total,
+        )
+        for (project_id, scope_number, scope3_category, month, source_type), total in rows.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_scenario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyEmissionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope_number', models.IntegerField(choices=[(1, 'Scope 1'), (2, 'Scope 2'), (3, 'Scope 3')])),
+                ('scope3_category', models.CharField(blank=True, default='', max_length=64)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('source_type', models.CharField(choices=[('emission_factor', 'Emission factor activity'), ('lca', 'LCA activity')], max_length=20)),
+                ('emissions_tco2e', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='api.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'month'], name='api_monthly_project_01c330_idx'), models.Index(fields=['month'], name='api_monthly_month_cc0344_idx')],
+                'constraints': [models.UniqueConstraint(fields=('project', 'scope_number', 'scope3_category', 'month', 'source_type'), name='unique_monthly_emission_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,160 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:14
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+# The ledger expansion as of this migration (api.utils.ledger may change later)
+
+MICRO = 10 ** 6
+HORIZON_MONTHS = 12
+LEDGER_FIELDS = ('activity_id', 'source_type', 'project_id', 'scope_number', 'scope3_category')
+
+
+def _to_day(value):
+    from django.utils import timezone
+    if value is None:
+        return None
+    if hasattr(value, 'tzinfo'):
+        value = timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _segments(counts):
+    import numpy as np
+    owners = np.repeat(np.arange(counts.size), counts)
+    first = np.cumsum(counts) - counts
+    positions = np.arange(owners.size) - np.repeat(first, counts)
+    return owners, positions, first
+
+
+def expand_activities(records):
+    """Monthly ledger rows of activity records: prorated actual rows, then projections of recurring ones"""
+    import numpy as np
+    from django.utils import timezone
+
+    if not records:
+        return []
+
+    horizon = np.datetime64(timezone.localdate(), 'M') + HORIZON_MONTHS
+    start = np.array(
+        [_to_day(r['period_start']) or _to_day(r['created_date']) or timezone.localdate() for r in records],
+        dtype='datetime64[D]'
+    )
+    end = np.array(
+        [_to_day(r['period_end']) if r['period_end'] else np.datetime64('NaT') for r in records],
+        dtype='datetime64[D]'
+    )
+    micro = np.array([int(Decimal(r['emissions_tco2e'] or 0) * MICRO) for r in records], dtype=np.int64)
+    recurring = np.array([bool(r['is_recurring']) for r in records])
+
+    start_month = start.astype('datetime64[M]')
+    no_end = np.isnat(end) | (end < start)
+    end = np.where(no_end, (start_month + 1).astype('datetime64[D]') - 1, end)
+    end_month = end.astype('datetime64[M]')
+    n_months = (end_month - start_month).astype(np.int64) + 1
+    period_days = (end - start).astype(np.int64) + 1
+
+    owners, positions, first = _segments(n_months)
+    months = start_month[owners] + positions
+    bucket_start = np.maximum(months.astype('datetime64[D]'), start[owners])
+    bucket_end = np.minimum((months + 1).astype('datetime64[D]') - 1, end[owners])
+    days = (bucket_end - bucket_start).astype(np.int64) + 1
+    allocated = np.floor(micro[owners] * (days / period_days[owners])).astype(np.int64)
+    allocated[first + n_months - 1] += micro - np.add.reduceat(allocated, first)
+
+    projected_counts = np.where(recurring, np.maximum((horizon - end_month).astype(np.int64), 0), 0)
+    proj_owners, proj_positions, _ = _segments(projected_counts)
+    proj_months = end_month[proj_owners] + 1 + proj_positions
+    proj_amounts = (micro // n_months)[proj_owners]
+
+    rows = []
+    for owner_array, month_array, amount_array, is_projection in (
+        (owners, months, allocated, False),
+        (proj_owners, proj_months, proj_amounts, True),
+    ):
+        for owner, month, amount in zip(owner_array.tolist(), month_array.astype('datetime64[D]').tolist(), amount_array.tolist()):
+            if amount == 0:
+                continue
+            record = records[owner]
+            row = {field: record[field] for field in LEDGER_FIELDS}
+            row['scope3_category'] = row['scope3_category'] or ''
+            row['month'] = month
+            row['emissions_tco2e'] = Decimal(amount).scaleb(-6)
+            row['is_projection'] = is_projection
+            rows.append(row)
+    return rows
+
+
+def backfill_ledger(apps, schema_editor):
+    """Expand existing activities into the ledger and re-aggregate the rollup from it"""
+    EmissionLedgerEntry = apps.get_model('api', 'EmissionLedgerEntry')
+    MonthlyEmissionRollup = apps.get_model('api', 'MonthlyEmissionRollup')
+    sources = (
+        (apps.get_model('api', 'EmissionActivity'), 'emission_factor', Decimal('1')),
+        (apps.get_model('api', 'LCAActivity'), 'lca', Decimal('0.001')),
+    )
+
+    records = []
+    for model, source_type, to_tco2e in sources:
+        for row in model.objects.values(
+            'activity_id', 'project_id', 'scope__scope_number', 'scope3_category', 'calculated_emissions',
+            'period_start', 'period_end', 'is_recurring', 'created_date'
+        ).order_by():
+            records.append({
+                'activity_id': row['activity_id'],
+                'source_type': source_type,
+                'project_id': row['project_id'],
+                'scope_number': row['scope__scope_number'],
+                'scope3_category': row['scope3_category'],
+                'emissions_tco2e': Decimal(str(row['calculated_emissions'] or 0)) * to_tco2e,
+                'period_start': row['period_start'],
+                'period_end': row['period_end'],
+                'is_recurring': row['is_recurring'],
+                'created_date': row['created_date'],
+            })
+
+    EmissionLedgerEntry.objects.bulk_create(
+        [EmissionLedgerEntry(**row) for row in expand_activities(records)], batch_size=2000
+    )
+
+    # Prorated periods move emissions between months, so rebuild the rollup from the ledger
+    MonthlyEmissionRollup.objects.all().delete()
+    totals = (
+        EmissionLedgerEntry.objects.filter(is_projection=False)
+        .values('project_id', 'scope_number', 'scope3_category', 'month', 'source_type')
+        .annotate(total=models.Sum('emissions_tco2e'))
+        .order_by()
+    )
+    MonthlyEmissionRollup.objects.bulk_create(
+        [MonthlyEmissionRollup(emissions_tco2e=row.pop('total'), **row) for row in totals], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_monthlyemissionrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmissionLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activity_id', models.UUIDField(help_text='EmissionActivity or LCAActivity ID, see source_type')),
+                ('source_type', models.CharField(choices=[('emission_factor', 'Emission factor activity'), ('lca', 'LCA activity')], max_length=20)),
+                ('scope_number', models.IntegerField(choices=[(1, 'Scope 1'), (2, 'Scope 2'), (3, 'Scope 3')])),
+                ('scope3_category', models.CharField(blank=True, default='', max_length=64)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('emissions_tco2e', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('is_projection', models.BooleanField(default=False, help_text='Projected repetition of a recurring activity')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='api.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'is_projection', 'month'], name='api_emissio_project_34700f_idx'), models.Index(fields=['activity_id', 'source_type'], name='api_emissio_activit_e75de1_idx'), models.Index(fields=['month'], name='api_emissio_month_b3372a_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_emissionledgerentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmissionFactorRevision',
+            fields=[
+                ('revision_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('old_value', models.DecimalField(decimal_places=6, max_digits=20)),
+                ('new_value', models.DecimalField(decimal_places=6, max_digits=20)),
+                ('source', models.CharField(choices=[('edit', 'Edited'), ('bulk', 'Bulk update'), ('import', 'Re-import')], default='edit', max_length=20)),
+                ('activities_updated', models.IntegerField(default=0)),
+                ('exchanges_updated', models.IntegerField(default=0)),
+                ('products_updated', models.IntegerField(default=0)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('factor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='api.emissionfactor')),
+            ],
+            options={
+                'ordering': ['-created_date'],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:35
+
+from django.db import migrations, models
+
+
+# Text columns searched with icontains (UPPER(col::text) LIKE UPPER(%s) on PostgreSQL)
+FACTOR_SEARCH_COLUMNS = ('name', 'description', 'source', 'unit', 'imported_category', 'imported_sub_category')
+
+
+def create_postgres_indexes(apps, schema_editor):
+    """GIN indexes for JSON containment and trigram icontains, PostgreSQL only"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS api_emissionfactor_scopes_gin "
+        "ON api_emissionfactor USING gin (applicable_scopes jsonb_path_ops)"
+    )
+    for column in FACTOR_SEARCH_COLUMNS:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS api_emissionfactor_{column}_trgm "
+            f"ON api_emissionfactor USING gin ((UPPER({column}::text)) gin_trgm_ops)"
+        )
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS api_emissionfactor_scopes_gin")
+    for column in FACTOR_SEARCH_COLUMNS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS api_emissionfactor_{column}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_emissionfactorrevision'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='emissionfactor',
+            name='api_emissio_categor_6fa7ec_idx',
+        ),
+        migrations.AddIndex(
+            model_name='emissionactivity',
+            index=models.Index(fields=['project', 'period_start'], name='api_emissio_project_0fd2ea_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emissionactivity',
+            index=models.Index(condition=models.Q(('period_start__isnull', True)), fields=['project', 'created_date'], name='api_emissionactivity_undated'),
+        ),
+        migrations.AddIndex(
+            model_name='emissionfactor',
+            index=models.Index(fields=['category', 'name'], name='api_emissio_categor_b497af_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lcaactivity',
+            index=models.Index(fields=['project', 'period_start'], name='api_lcaacti_project_ee3781_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lcaactivity',
+            index=models.Index(condition=models.Q(('period_start__isnull', True)), fields=['project', 'created_date'], name='api_lcaactivity_undated'),
+        ),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:41
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(NEW.imported_category, '') || ' ' || coalesce(NEW.imported_sub_category, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(NEW.source, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(NEW.description, '')), 'D')
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    """Keep search_vector current on every write, backfill it and index it (PostgreSQL only)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"""
+        CREATE OR REPLACE FUNCTION api_emissionfactor_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {SEARCH_VECTOR_SQL};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    schema_editor.execute("""
+        CREATE TRIGGER api_emissionfactor_search_vector
+        BEFORE INSERT OR UPDATE OF name, description, source, imported_category, imported_sub_category, search_vector
+        ON api_emissionfactor
+        FOR EACH ROW EXECUTE FUNCTION api_emissionfactor_search_vector_update()
+    """)
+    # Fires the trigger for the existing rows
+    schema_editor.execute("UPDATE api_emissionfactor SET name = name")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS api_emissionfactor_search_gin ON api_emissionfactor USING gin (search_vector)"
+    )
+    # Word similarity on the name (typo tolerance); pg_trgm is created by migration 0011
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS api_emissionfactor_name_word_trgm ON api_emissionfactor USING gin (name gin_trgm_ops)"
+    )
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS api_emissionfactor_name_word_trgm")
+    schema_editor.execute("DROP INDEX IF EXISTS api_emissionfactor_search_gin")
+    schema_editor.execute("DROP TRIGGER IF EXISTS api_emissionfactor_search_vector ON api_emissionfactor")
+    schema_editor.execute("DROP FUNCTION IF EXISTS api_emissionfactor_search_vector_update()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_activity_range_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emissionfactor',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_emissionfactor_search_vector'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='emissionfactor',
+            name='api_emissio_categor_b497af_idx',
+        ),
+        migrations.AddIndex(
+            model_name='emissionactivity',
+            index=models.Index(fields=['created_date', 'activity_id'], name='api_emissio_created_27de67_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emissionfactor',
+            index=models.Index(fields=['category', 'name', 'factor_id'], name='api_emissio_categor_607ffc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lcaactivity',
+            index=models.Index(fields=['created_date', 'activity_id'], name='api_lcaacti_created_57aee7_idx'),
+        ),
+    ]
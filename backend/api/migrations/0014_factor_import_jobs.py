@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 23:10
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FactorImportJob',
+            fields=[
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(help_text='Name of the uploaded file', max_length=255)),
+                ('file_format', models.CharField(help_text='xlsx, xls or csv', max_length=10)),
+                ('file_path', models.CharField(help_text='Stored copy of the upload, removed when the job completes', max_length=500)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('chunk_size', models.IntegerField()),
+                ('chunks_committed', models.IntegerField(default=0)),
+                ('rows_parsed', models.IntegerField(default=0)),
+                ('rows_inserted', models.IntegerField(default=0)),
+                ('rows_skipped', models.IntegerField(default=0)),
+                ('rows_errored', models.IntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list, help_text='First row errors, for display')),
+                ('imported_factors', models.JSONField(blank=True, default=list, help_text='First imported factor names, for display')),
+                ('failure', models.TextField(blank=True, help_text='Why the job failed', null=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_date'],
+                'indexes': [models.Index(fields=['status', 'heartbeat_at'], name='api_factori_status_c59ef1_idx')],
+            },
+        ),
+    ]
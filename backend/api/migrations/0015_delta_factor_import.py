@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_factor_import_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emissionfactor',
+            name='retired_date',
+            field=models.DateTimeField(blank=True, help_text='When the source library dropped this factor (kept for the activities using it)', null=True),
+        ),
+        migrations.AddField(
+            model_name='emissionfactor',
+            name='source_row_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='factorimportjob',
+            name='delta',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='factorimportjob',
+            name='factors_retired',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='factorimportjob',
+            name='rows_unchanged',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='factorimportjob',
+            name='rows_updated',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='factorimportjob',
+            name='value_changes',
+            field=models.JSONField(blank=True, default=list, help_text='First value changes of a delta import'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 23:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_delta_factor_import'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='factorimportjob',
+            name='claim_token',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
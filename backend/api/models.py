@@ -1,6 +1,7 @@
 import uuid
 from django.utils import timezone
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from decimal import Decimal
@@ -48,25 +49,15 @@ class EmissionScope(models.Model):
         unique_together = ['project', 'scope_number']  # One scope per number per project
 
     def calculate_total_emissions(self):
-        """Calculate total from all activities (both emission factor and LCA activities) in this scope"""
-        from decimal import Decimal
-        
-        # Sum from regular emission activities (already in tCO₂e)
-        emission_total = self.activities.aggregate(
-            total=models.Sum('calculated_emissions')
-        )['total'] or Decimal('0')
-        
-        # Sum from LCA activities (in kgCO₂e, need to convert to tCO₂e)
-        lca_total_kg = self.lca_activities.aggregate(
-            total=models.Sum('calculated_emissions')
-        )['total'] or Decimal('0')
-        lca_total_tco2e = lca_total_kg / Decimal('1000')
-        
-        # Combine both
-        total = emission_total + lca_total_tco2e
-        self.total_emissions_tco2e = total
-        self.save()
-        return total
+        """
+        Calculate total from all activities (both emission factor and LCA activities) in this scope.
+        Activity writes don't call this: they mark the scope dirty (see utils.scope_totals).
+        """
+        from .utils.scope_totals import recompute_scope_totals
+
+        recompute_scope_totals([self.pk])
+        self.refresh_from_db(fields=['total_emissions_tco2e'])
+        return self.total_emissions_tco2e
 
     def __str__(self):
         return f"Scope {self.scope_number} for {self.project.name}"
@@ -206,14 +197,29 @@ class EmissionFactor(models.Model):
         help_text="Specific Scope 3 category (required if any of applicable scopes is 3)"
     )
     
+    # Library imports (see utils.sefr_importer): hash of the source row the factor was
+    # imported from, compared by delta re-imports, and when a re-import no longer found it
+    source_row_hash = models.CharField(max_length=40, blank=True, null=True, editable=False)
+    retired_date = models.DateTimeField(
+        blank=True, null=True,
+        help_text="When the source library dropped this factor (kept for the activities using it)"
+    )
+
     # System fields
     created_date = models.DateTimeField(auto_now_add=True)
     last_modified = models.DateTimeField(auto_now=True)
 
+    # Weighted full-text vector, maintained by a database trigger on PostgreSQL
+    # (see utils.factor_search); always empty elsewhere
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         ordering = ['category', 'name']
+        # PostgreSQL additionally gets GIN indexes for applicable_scopes containment,
+        # icontains and ranked searches (migrations 0011 and 0012)
         indexes = [
-            models.Index(fields=['category']),
+            # Default listing order, with the keyset pagination tiebreaker
+            models.Index(fields=['category', 'name', 'factor_id']),
             models.Index(fields=['year']),
             models.Index(fields=['source']),
         ]
@@ -271,9 +277,19 @@ class EmissionFactor(models.Model):
         return param_requirements.get(uncertainty_type, [])
     
     def save(self, *args, **kwargs):
-        """Save with validation"""
+        """Save with validation, recalculating dependents when the value changes"""
         self.full_clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            previous_value = None
+            if not self._state.adding:
+                previous_value = EmissionFactor.objects.filter(pk=self.pk).values_list(
+                    'emission_factor_value', flat=True
+                ).first()
+            super().save(*args, **kwargs)
+
+            if previous_value is not None and previous_value != self.emission_factor_value:
+                from .utils.factor_propagation import propagate_factor_changes
+                propagate_factor_changes({self.pk: (previous_value, self.emission_factor_value)})
     
     def has_uncertainty(self):
         """Check if this emission factor has uncertainty data"""
@@ -351,6 +367,19 @@ class EmissionActivity(models.Model):
     created_date = models.DateTimeField(auto_now_add=True)
     last_modified = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Date range filters bucket activities by period_start, or created_date when it is missing;
+        # listings page through (created_date, activity_id)
+        indexes = [
+            models.Index(fields=['created_date', 'activity_id']),
+            models.Index(fields=['project', 'period_start']),
+            models.Index(
+                fields=['project', 'created_date'],
+                condition=models.Q(period_start__isnull=True),
+                name='api_emissionactivity_undated',
+            ),
+        ]
+
     def save(self, *args, **kwargs):
         if self.unit != self.emission_factor.unit:
             raise ValueError(
@@ -379,11 +408,22 @@ class EmissionActivity(models.Model):
                 if not self.destination_location:
                     self.destination_location = self.project.location
 
-        super().save(*args, **kwargs)
+        # The ledger and rollups are updated by the post_save receiver inside the same transaction
+        with transaction.atomic():
+            # The post_save receivers read _previous_project_id (saved scenarios of a project it left)
+            previous_scope_id, self._previous_project_id = self.get_previous_ids()
+            super().save(*args, **kwargs)
+
+            # The post_save receiver marks the new scope; a scope the activity moved out of needs it too
+            if previous_scope_id != self.scope_id:
+                from .utils.scope_totals import mark_scope_dirty
+                mark_scope_dirty(previous_scope_id)
 
-        # update scope total
-        if self.scope:
-            self.scope.calculate_total_emissions()
+    def get_previous_ids(self):
+        """(scope_id, project_id) stored in the database before this save ((None, None) for new activities)"""
+        if self._state.adding:
+            return None, None
+        return type(self).objects.filter(pk=self.pk).values_list('scope_id', 'project_id').first() or (None, None)
 
     def __str__(self):
         return f"{self.activity_name} - {self.calculated_emissions} tCO₂e"
@@ -401,11 +441,11 @@ class LCAProduct(models.Model):
     last_modified = models.DateTimeField(auto_now=True)
     
     def calculate_total_footprint(self):
-        """Sum of all exchanges"""
-        total = sum(ex.calculated_impact for ex in self.exchanges.all())
-        self.total_carbon_footprint_per_unit = total
-        self.save()
-        return total
+        """Sum of all exchanges, propagated to the products using this one"""
+        from .utils.lca_graph import recompute_products
+        recompute_products([self.pk])
+        self.refresh_from_db(fields=['total_carbon_footprint_per_unit', 'last_modified'])
+        return self.total_carbon_footprint_per_unit
 
     def __str__(self):
         return f"{self.name} ({self.project.name})"
@@ -445,11 +485,12 @@ class ProductExchange(models.Model):
             self.calculated_impact = self.quantity * factor
             self.unit = self.input_product.functional_unit
             self.name = self.input_product.name
-            
-        super().save(*args, **kwargs)
-        
-        # Update parent product
-        self.product.calculate_total_footprint()
+
+        from .utils.lca_graph import recompute_products
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Update the product and every product using it (a cycle rolls the save back)
+            recompute_products([self.product_id])
 
     def __str__(self):
         return f"{self.name} -> {self.product.name}"
@@ -537,6 +578,15 @@ class LCAActivity(models.Model):
         verbose_name = "LCA Activity"
         verbose_name_plural = "LCA Activities"
         ordering = ['-created_date']
+        indexes = [
+            models.Index(fields=['created_date', 'activity_id']),
+            models.Index(fields=['project', 'period_start']),
+            models.Index(
+                fields=['project', 'created_date'],
+                condition=models.Q(period_start__isnull=True),
+                name='api_lcaactivity_undated',
+            ),
+        ]
     
     def calculate_lca_impact(self):
         """
@@ -632,26 +682,346 @@ class LCAActivity(models.Model):
                 if not self.destination_location:
                     self.destination_location = self.project.location
 
-        super().save(*args, **kwargs)
-        
-        # Update scope total after saving
-        if self.scope:
-            self.scope.calculate_total_emissions()
+        # The ledger and rollups are updated by the post_save receiver inside the same transaction
+        with transaction.atomic():
+            # The post_save receivers read _previous_project_id (saved scenarios of a project it left)
+            previous_scope_id, self._previous_project_id = self.get_previous_ids()
+            super().save(*args, **kwargs)
+            
+            # The post_save receiver marks the new scope; a scope the activity moved out of needs it too
+            if previous_scope_id != self.scope_id:
+                from .utils.scope_totals import mark_scope_dirty
+                mark_scope_dirty(previous_scope_id)
+    
+    def get_previous_ids(self):
+        """(scope_id, project_id) stored in the database before this save ((None, None) for new activities)"""
+        if self._state.adding:
+            return None, None
+        return type(self).objects.filter(pk=self.pk).values_list('scope_id', 'project_id').first() or (None, None)
     
     def __str__(self):
         return f"{self.activity_name} - {self.get_emissions_tco2e()} tCO₂e (LCA)"
 
 
+class Scenario(models.Model):
+    """
+    A saved sensitivity scenario for a project.
+    Keeps a snapshot of every activity's baseline contribution (tCO₂e) so that
+    activity edits are applied as deltas instead of re-running the analysis.
+    """
+    scenario_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="scenarios")
+    name = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+
+    # Scenario inputs
+    adjustments = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Percent change per activity, e.g. {'activity_id': -20}"
+    )
+    timeline_years = models.IntegerField(default=5)
+    growth_rate = models.FloatField(default=0.0, help_text="Constant annual growth rate (e.g. 0.03 for 3%)")
+    growth_curve = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Optional list of annual growth rates, overrides growth_rate when provided"
+    )
+
+    # Baseline snapshot: {activity_id: {'name', 'baseline', 'type', 'scope'}}
+    baseline_snapshot = models.JSONField(default=dict, blank=True)
+    baseline_total = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    adjusted_total = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+
+    # Tracking
+    created_date = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+    baseline_date = models.DateTimeField(null=True, blank=True, help_text="When the baseline snapshot was last fully rebuilt")
+
+    class Meta:
+        ordering = ['-created_date']
+
+    def rebuild_baseline(self):
+        """Rebuild the baseline snapshot from the project's current activities"""
+        from .utils.scenarios import collect_baseline_contributions
+
+        self.baseline_snapshot = collect_baseline_contributions(self.project)
+        self.baseline_date = timezone.now()
+        self.recalculate_totals()
+        self.save()
+
+    def recalculate_totals(self):
+        """Recalculate totals from the stored snapshot (no activity queries)"""
+        from .utils.scenarios import adjustment_factor
+
+        baseline_total = Decimal('0')
+        adjusted_total = Decimal('0')
+        for activity_id, entry in self.baseline_snapshot.items():
+            baseline = Decimal(str(entry['baseline']))
+            baseline_total += baseline
+            adjusted_total += baseline * Decimal(str(adjustment_factor(self.adjustments, activity_id)))
+
+        self.baseline_total = baseline_total
+        self.adjusted_total = adjusted_total
+
+    def get_analysis(self):
+        """Sensitivity analysis payload computed from the stored snapshot"""
+        from .utils.scenarios import build_analysis
+
+        return build_analysis(
+            self.baseline_snapshot,
+            self.adjustments,
+            timeline_years=self.timeline_years,
+            growth_rate=self.growth_rate,
+            growth_curve=self.growth_curve,
+        )
+
+    def __str__(self):
+        return f"{self.name} ({self.project.name})"
+
+
+class MonthlyEmissionRollup(models.Model):
+    """
+    Pre-aggregated emissions per project, scope, Scope 3 category, month and source type.
+    Maintained incrementally on every activity save/delete so dashboards and reports
+    don't have to scan the activity tables. Rebuild with `manage.py rebuild_emission_rollup`.
+    """
+    SOURCE_EMISSION_FACTOR = 'emission_factor'
+    SOURCE_LCA = 'lca'
+    SOURCE_TYPE_CHOICES = [
+        (SOURCE_EMISSION_FACTOR, 'Emission factor activity'),
+        (SOURCE_LCA, 'LCA activity'),
+    ]
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="monthly_rollups")
+    scope_number = models.IntegerField(choices=[(1, "Scope 1"), (2, "Scope 2"), (3, "Scope 3")])
+    scope3_category = models.CharField(max_length=64, blank=True, default='')
+    month = models.DateField(help_text="First day of the month")
+    source_type = models.CharField(max_length=20, choices=SOURCE_TYPE_CHOICES)
+    emissions_tco2e = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['project', 'scope_number', 'scope3_category', 'month', 'source_type'],
+                name='unique_monthly_emission_rollup'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['project', 'month']),
+            models.Index(fields=['month']),
+        ]
+
+    def __str__(self):
+        return f"{self.project_id} Scope {self.scope_number} {self.month:%Y-%m}: {self.emissions_tco2e} tCO₂e"
+
+
+class EmissionLedgerEntry(models.Model):
+    """
+    One activity's emissions in one month.
+    Activities are prorated over their period_start/period_end; recurring activities are
+    also repeated after their period up to a horizon as projection rows. The actual rows
+    of an activity sum to its calculated emissions. Built by utils.ledger.
+    """
+    activity_id = models.UUIDField(help_text="EmissionActivity or LCAActivity ID, see source_type")
+    source_type = models.CharField(max_length=20, choices=MonthlyEmissionRollup.SOURCE_TYPE_CHOICES)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="ledger_entries")
+    scope_number = models.IntegerField(choices=[(1, "Scope 1"), (2, "Scope 2"), (3, "Scope 3")])
+    scope3_category = models.CharField(max_length=64, blank=True, default='')
+    month = models.DateField(help_text="First day of the month")
+    emissions_tco2e = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    is_projection = models.BooleanField(default=False, help_text="Projected repetition of a recurring activity")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'is_projection', 'month']),
+            models.Index(fields=['activity_id', 'source_type']),
+            models.Index(fields=['month']),
+        ]
+
+    def __str__(self):
+        return f"{self.activity_id} {self.month:%Y-%m}: {self.emissions_tco2e} tCO₂e"
+
+
+class DataVersion(models.Model):
+    """
+    Change counter for a slice of data, bumped on every write to it.
+    Keys are 'project:<project_id>' per project and 'reference' for emission factors
+    and LCA products. Cached responses are keyed by these versions (see
+    utils.response_cache).
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
+class EmissionFactorRevision(models.Model):
+    """
+    Audit of an emission factor value change and of the dependent rows it recalculated
+    (see utils.factor_propagation).
+    """
+    SOURCE_EDIT = 'edit'
+    SOURCE_BULK = 'bulk'
+    SOURCE_IMPORT = 'import'
+    SOURCE_CHOICES = [
+        (SOURCE_EDIT, 'Edited'),
+        (SOURCE_BULK, 'Bulk update'),
+        (SOURCE_IMPORT, 'Re-import'),
+    ]
+
+    revision_id = models.BigAutoField(primary_key=True)
+    factor = models.ForeignKey(EmissionFactor, on_delete=models.SET_NULL, null=True, related_name="revisions")
+    old_value = models.DecimalField(max_digits=20, decimal_places=6)
+    new_value = models.DecimalField(max_digits=20, decimal_places=6)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default=SOURCE_EDIT)
+
+    # Rows recalculated
+    activities_updated = models.IntegerField(default=0)
+    exchanges_updated = models.IntegerField(default=0)
+    products_updated = models.IntegerField(default=0)
+
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_date']
+
+    def __str__(self):
+        return f"{self.factor_id}: {self.old_value} → {self.new_value} ({self.activities_updated} activities)"
+
+
+class FactorImportJob(models.Model):
+    """
+    A factor library import running in the background (see utils.import_jobs).
+    Each chunk of rows is committed together with the progress counters and
+    chunks_committed, so an interrupted job resumes after its last committed chunk.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255, help_text="Name of the uploaded file")
+    file_format = models.CharField(max_length=10, help_text="xlsx, xls or csv")
+    file_path = models.CharField(max_length=500, help_text="Stored copy of the upload, removed when the job completes")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+
+    # Delta imports also update changed factors and retire the ones the file dropped
+    delta = models.BooleanField(default=False)
+
+    # Progress, committed with each chunk
+    chunk_size = models.IntegerField()
+    chunks_committed = models.IntegerField(default=0)
+    rows_parsed = models.IntegerField(default=0)
+    rows_inserted = models.IntegerField(default=0)
+    rows_skipped = models.IntegerField(default=0)
+    rows_errored = models.IntegerField(default=0)
+    rows_updated = models.IntegerField(default=0)
+    rows_unchanged = models.IntegerField(default=0)
+    factors_retired = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True, help_text="First row errors, for display")
+    value_changes = models.JSONField(default=list, blank=True, help_text="First value changes of a delta import")
+    imported_factors = models.JSONField(default=list, blank=True, help_text="First imported factor names, for display")
+    failure = models.TextField(blank=True, null=True, help_text="Why the job failed")
+
+    created_date = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed while the job runs; a running job whose heartbeat is stale was interrupted
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # Set by each claim; progress is only written by the runner holding the current token
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ['-created_date']
+        indexes = [
+            models.Index(fields=['status', 'heartbeat_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status}, {self.rows_parsed} rows)"
+
+
 # Signal handlers to automatically update scope totals
 @receiver([post_save, post_delete], sender=EmissionActivity)
 def update_scope_total_emission_activity(sender, instance, **kwargs):
-    """Automatically recalculate scope total when emission activity changes"""
-    if hasattr(instance, 'scope') and instance.scope:
-        instance.scope.calculate_total_emissions()
+    """Recalculate the scope total when the transaction commits"""
+    from .utils.scope_totals import mark_scope_dirty
+    mark_scope_dirty(instance.scope_id)
 
 
 @receiver([post_save, post_delete], sender=LCAActivity)
 def update_scope_total_lca_activity(sender, instance, **kwargs):
-    """Automatically recalculate scope total when LCA activity changes"""
-    if hasattr(instance, 'scope') and instance.scope:
-        instance.scope.calculate_total_emissions()
+    """Recalculate the scope total when the transaction commits"""
+    from .utils.scope_totals import mark_scope_dirty
+    mark_scope_dirty(instance.scope_id)
+
+
+@receiver(post_save, sender=EmissionActivity)
+@receiver(post_save, sender=LCAActivity)
+def update_scenarios_on_activity_save(sender, instance, **kwargs):
+    """Apply the activity's delta to the project's saved scenarios"""
+    from .utils.scenarios import apply_activity_delta
+    apply_activity_delta(instance, previous_project_id=getattr(instance, '_previous_project_id', None))
+
+
+@receiver(post_delete, sender=EmissionActivity)
+@receiver(post_delete, sender=LCAActivity)
+def update_scenarios_on_activity_delete(sender, instance, **kwargs):
+    """Remove the activity's contribution from the project's saved scenarios"""
+    from .utils.scenarios import apply_activity_delta
+    apply_activity_delta(instance, deleted=True)
+
+
+@receiver(post_save, sender=EmissionActivity)
+@receiver(post_save, sender=LCAActivity)
+def update_ledger_on_activity_save(sender, instance, **kwargs):
+    """Re-expand the activity into the monthly ledger and apply the difference to the rollup"""
+    from .utils.ledger import sync_activity_ledger
+    sync_activity_ledger(instance)
+
+
+@receiver(post_delete, sender=EmissionActivity)
+@receiver(post_delete, sender=LCAActivity)
+def update_ledger_on_activity_delete(sender, instance, **kwargs):
+    """Remove the activity's ledger rows and their contribution to the rollup"""
+    from .utils.ledger import sync_activity_ledger
+    sync_activity_ledger(instance, deleted=True)
+
+
+@receiver([post_save, post_delete], sender=Project)
+@receiver([post_save, post_delete], sender=EmissionScope)
+@receiver([post_save, post_delete], sender=EmissionActivity)
+@receiver([post_save, post_delete], sender=LCAActivity)
+def bump_project_data_version(sender, instance, **kwargs):
+    """Invalidate cached responses for the project (on commit)"""
+    from .utils.response_cache import bump_project_versions
+    bump_project_versions(instance.pk if sender is Project else instance.project_id)
+
+
+@receiver(post_delete, sender=ProductExchange)
+def update_product_footprint_on_exchange_delete(sender, instance, **kwargs):
+    """Recompute the product that lost the exchange and the products using it"""
+    from .utils.lca_graph import recompute_products
+    recompute_products([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=EmissionFactor)
+@receiver([post_save, post_delete], sender=LCAProduct)
+@receiver([post_save, post_delete], sender=ProductExchange)
+def bump_reference_data_version(sender, instance, **kwargs):
+    """Invalidate cached responses that depend on factors or products"""
+    from .utils.response_cache import bump_data_version, FACTORS_KEY, REFERENCE_KEY
+    if sender is EmissionFactor:
+        bump_data_version(REFERENCE_KEY, FACTORS_KEY)
+    else:
+        bump_data_version(REFERENCE_KEY)
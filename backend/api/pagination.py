@@ -0,0 +1,245 @@
+"""
+Keyset (cursor) pagination for the large collections.
+
+Page numbers make the database count every matching row and skip all rows
+before the page (OFFSET), so deep pages get slower as tables grow. Rows inserted
+while someone is browsing also shift the later pages. KeysetPagination encodes
+the sort key of the last row of a page in an opaque ?cursor= token instead.
+The next page is then "the rows after that key". This is a range condition an
+index on the sort fields can seek to, so every page costs the same as the first.
+
+    GET /api/emission-factors/?sort=-year
+    {"next": ".../?sort=-year&cursor=...", "previous": null, "results": [...]}
+
+The order is the queryset's own (?sort=, relevance, the model's default). The
+primary key is appended as a tiebreaker, so that the key is unique. Totals are
+opt-in:
+
+    ?count=exact      "count": exact COUNT(*) of the matching rows
+    ?count=estimate   "count": the planner's row estimate (PostgreSQL, exact elsewhere)
+
+Requests with ?page= keep the PageNumberPagination behaviour, for clients that
+jump to numbered pages.
+"""
+
+import json
+from base64 import b64decode, b64encode
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_value(value):
+    # Full precision: an inexact key would skip or repeat rows
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def estimate_count(queryset):
+    """The query planner's estimate of the number of rows (exact count where there is no planner estimate)"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on the queryset's ordering plus the primary key (see module docstring).
+    Ordering fields must be fields of the model or annotations. Nullable fields
+    sort their nulls as the largest values (PostgreSQL's default) on every database.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        if PageNumberPagination.page_query_param in request.query_params:
+            self.legacy = PageNumberPagination()
+            return self.legacy.paginate_queryset(queryset, request, view)
+        self.legacy = None
+
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.ordering = self.get_ordering(queryset)
+
+        self.count = None
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode == 'exact':
+            self.count = queryset.count()
+        elif count_mode == 'estimate':
+            self.count = estimate_count(queryset)
+
+        position, reverse = self.decode_cursor(request)
+        ordering = [(name, descending != reverse, nullable) for name, descending, nullable in self.ordering]
+
+        queryset = queryset.order_by(*[self.order_expression(*key) for key in ordering])
+        if position is not None:
+            queryset = queryset.filter(self.after_position(ordering, position))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Going backwards, the row at the cursor position follows the page
+        self.has_next = (has_more and not reverse) or (reverse and position is not None)
+        self.has_previous = (has_more and reverse) or (not reverse and position is not None)
+        self.rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        body = {}
+        if self.count is not None:
+            body['count'] = self.count
+        body.update({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+        return Response(body)
+
+    def get_ordering(self, queryset):
+        """[(field name, descending, nullable)] of the queryset's ordering, ending with the primary key"""
+        model = queryset.model
+        pk_name = model._meta.pk.name
+        order_by = queryset.query.order_by or (model._meta.ordering if queryset.query.default_ordering else ())
+
+        ordering = []
+        for term in order_by:
+            if not isinstance(term, str) or term == '?' or '__' in term:
+                raise ImproperlyConfigured(f"KeysetPagination can't paginate on the ordering {term!r}")
+            descending = term.startswith('-')
+            name = term.lstrip('-')
+            if name == 'pk':
+                name = pk_name
+            if name in queryset.query.annotations:
+                nullable = False
+            else:
+                try:
+                    nullable = model._meta.get_field(name).null
+                except FieldDoesNotExist:
+                    raise ImproperlyConfigured(f"KeysetPagination can't paginate on the ordering {term!r}")
+            ordering.append((name, descending, nullable))
+            if name == pk_name:
+                # Unique: later terms never apply
+                return ordering
+
+        # The tiebreaker follows the last term's direction so one index can serve both
+        ordering.append((pk_name, ordering[-1][1] if ordering else False, False))
+        return ordering
+
+    @staticmethod
+    def order_expression(name, descending, nullable):
+        if not nullable:
+            return f"-{name}" if descending else name
+        return F(name).desc(nulls_first=True) if descending else F(name).asc(nulls_last=True)
+
+    @staticmethod
+    def after_position(ordering, position):
+        """
+        Rows after position in the ordering: the first differing field is past the
+        position's value, all earlier fields equal it. A redundant bound on the
+        first field lets the database seek the index to the position.
+        """
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, nullable), value in zip(ordering, position):
+            if value is None:
+                # Nulls sort last ascending, first descending
+                after = Q(**{f"{name}__isnull": False}) if descending else None
+                same = Q(**{f"{name}__isnull": True})
+            else:
+                after = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+                if nullable and not descending:
+                    after |= Q(**{f"{name}__isnull": True})
+                same = Q(**{name: value})
+            if after is not None:
+                condition |= equal & after
+            equal &= same
+
+        name, descending, nullable = ordering[0]
+        value = position[0]
+        if value is not None:
+            bound = Q(**{f"{name}__{'lte' if descending else 'gte'}": value})
+            if nullable and not descending:
+                bound |= Q(**{f"{name}__isnull": True})
+            condition &= bound
+        return condition
+
+    def position_of(self, row):
+        return [_encode_value(getattr(row, name)) for name, _, _ in self.ordering]
+
+    def encode_cursor(self, position, reverse):
+        payload = {'o': [name for name, _, _ in self.ordering], 'p': position, 'r': int(reverse)}
+        token = b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        """(position values converted to the fields' types, reverse) of the requested cursor, or (None, False)"""
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(b64decode(token.encode(), validate=True))
+            names = [name for name, _, _ in self.ordering]
+            if payload['o'] != names or len(payload['p']) != len(names):
+                raise ValueError
+            position = [self.to_python(name, value) for name, value in zip(names, payload['p'])]
+            return position, bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, name, value):
+        if value is None:
+            return None
+        try:
+            field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations (e.g. search_rank) are numbers
+            if not isinstance(value, (int, float)):
+                raise ValueError
+            return value
+        try:
+            return field.to_python(value)
+        except Exception:
+            raise ValueError
+
+    def get_next_link(self):
+        if self.legacy is not None:
+            return self.legacy.get_next_link()
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(self.position_of(self.rows[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if self.legacy is not None:
+            return self.legacy.get_previous_link()
+        if not self.has_previous:
+            return None
+        if not self.rows:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.position_of(self.rows[0]), reverse=True)
@@ -0,0 +1,44 @@
+"""
+JSON rendering with orjson.
+
+The API's large documents (project details, globe data, factor lists) are mostly
+Decimals, UUIDs and floats, which the json module encodes in Python one value at
+a time. FastJSONRenderer encodes them with orjson when it is installed, producing
+the same JSON as DRF's JSONRenderer (compact, Decimals as numbers, non-string
+keys as strings, U+2028/U+2029 escaped). It falls back to JSONRenderer without
+orjson or when an indented response is requested.
+"""
+
+from decimal import Decimal
+
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    """Types orjson doesn't encode natively, as DRF's encoder does"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        # Escaped like JSONRenderer, for a strict JavaScript subset
+        return orjson.dumps(data, default=_default, option=self.options).replace(
+            b'\xe2\x80\xa8', b'\\u2028'
+        ).replace(b'\xe2\x80\xa9', b'\\u2029')
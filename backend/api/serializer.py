@@ -1,8 +1,9 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 from .models import Project
-from .models import EmissionScope, EmissionFactor, EmissionActivity
-from .models import LCAProduct, LCAActivity, ProductExchange
+from .models import EmissionScope, EmissionFactor, EmissionActivity, EmissionFactorRevision, FactorImportJob
+from .models import LCAProduct, LCAActivity, ProductExchange, Scenario
+from .fieldsets import DynamicFieldsMixin
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,7 +15,7 @@ class UserSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data) # ** Splits keywords
         return user       
 
-class EmissionFactorSerializer(serializers.ModelSerializer):
+class EmissionFactorSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Base serializer for emission factors with full validation and Brightway2 uncertainty support"""
     category_display = serializers.CharField(source='get_category_display', read_only=True)
     uncertainty_type_display = serializers.CharField(source='get_uncertainty_type_display', read_only=True)
@@ -30,9 +31,9 @@ class EmissionFactorSerializer(serializers.ModelSerializer):
             'source', 'year', 'description', 'sub_category', 'uncertainty_type', 
             'uncertainty_type_display', 'uncertainty_params', 'has_uncertainty', 
             'uncertainty_description', 'imported_category', 'imported_sub_category',
-            'created_date', 'last_modified'
+            'retired_date', 'created_date', 'last_modified'
         ]
-        read_only_fields = ['factor_id', 'created_date', 'last_modified']
+        read_only_fields = ['factor_id', 'retired_date', 'created_date', 'last_modified']
 
     def validate(self, attrs):
         """Comprehensive validation including uncertainty parameters"""
@@ -89,7 +90,54 @@ class EmissionScopeSerializer(serializers.ModelSerializer):
         model = EmissionScope
         fields = ["scope_id", "scope_number", "total_emissions_tco2e"]
 
-class EmissionActivitySerializer(serializers.ModelSerializer):
+class EmissionFactorRevisionSerializer(serializers.ModelSerializer):
+    source_display = serializers.CharField(source='get_source_display', read_only=True)
+
+    class Meta:
+        model = EmissionFactorRevision
+        fields = [
+            'revision_id', 'factor', 'old_value', 'new_value', 'source', 'source_display',
+            'activities_updated', 'exchanges_updated', 'products_updated', 'created_date'
+        ]
+        read_only_fields = fields
+
+
+class FactorImportJobSerializer(serializers.ModelSerializer):
+    """Progress of a factor import job, with the import summary the upload used to return"""
+    interrupted = serializers.SerializerMethodField()
+    summary = serializers.SerializerMethodField()
+
+    class Meta:
+        model = FactorImportJob
+        fields = [
+            'job_id', 'file_name', 'status', 'delta', 'interrupted', 'chunks_committed', 'rows_parsed',
+            'rows_inserted', 'rows_skipped', 'rows_errored', 'rows_updated', 'rows_unchanged', 'factors_retired',
+            'failure', 'summary', 'created_date', 'started_at', 'finished_at',
+            'heartbeat_at',
+        ]
+        read_only_fields = fields
+
+    def get_interrupted(self, job):
+        """Running, but no chunk committed for STALE_AFTER: the process running it stopped"""
+        from .utils.import_jobs import is_interrupted
+        return is_interrupted(job)
+
+    def get_summary(self, job):
+        return {
+            'total_rows': job.rows_parsed,
+            'success_count': job.rows_inserted,
+            'skipped_count': job.rows_skipped,
+            'error_count': job.rows_errored,
+            'errors': job.errors[:10],
+            'imported_factors': job.imported_factors[:20],
+            'updated_count': job.rows_updated,
+            'unchanged_count': job.rows_unchanged,
+            'retired_count': job.factors_retired,
+            'value_changes': job.value_changes[:20],
+        }
+
+
+class EmissionActivitySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     emission_factor = EmissionFactorSerializer(read_only=True)
     emission_factor_id = serializers.UUIDField(write_only=True)
     scope_number = serializers.IntegerField(write_only=True, required=False)
@@ -98,6 +146,8 @@ class EmissionActivitySerializer(serializers.ModelSerializer):
     quantity = serializers.DecimalField(max_digits=15, decimal_places=6)
     calculated_emissions = serializers.DecimalField(max_digits=15, decimal_places=6, read_only=True)
 
+    expandable_fields = {'scope': (EmissionScopeSerializer, {'read_only': True})}
+
     class Meta:
         model = EmissionActivity
         fields = [
@@ -188,7 +238,7 @@ class ProductExchangeSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["exchange_id", "calculated_impact", "name", "unit"]
 
-class LCAProductSerializer(serializers.ModelSerializer):
+class LCAProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     exchanges = ProductExchangeSerializer(many=True, read_only=True)
 
     class Meta:
@@ -201,12 +251,14 @@ class LCAProductSerializer(serializers.ModelSerializer):
         read_only_fields = ["lca_id", "created_date", "last_modified", "total_carbon_footprint_per_unit"]
 
 
-class LCAActivitySerializer(serializers.ModelSerializer):
+class LCAActivitySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for LCA activities using Brightway2 processes"""
     scope_number = serializers.IntegerField(write_only=True, required=False)
     scope = serializers.PrimaryKeyRelatedField(read_only=True)
     emissions_tco2e = serializers.SerializerMethodField(read_only=True)
     impact_method_display = serializers.SerializerMethodField(read_only=True)
+
+    expandable_fields = {'scope': (EmissionScopeSerializer, {'read_only': True})}
     
     class Meta:
         model = LCAActivity
@@ -361,7 +413,7 @@ class LCAActivityListSerializer(serializers.ModelSerializer):
 
 
 # This serialiser is dependent on the the other two serialisers
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class ScopeWithActivitiesSerializer(serializers.ModelSerializer):
         activities = EmissionActivityListSerializer(many=True, read_only=True)
         lca_activities = LCAActivityListSerializer(many=True, read_only=True)
@@ -381,3 +433,82 @@ class ProjectSerializer(serializers.ModelSerializer):
             "scopes", "lca_products"
         ]
         read_only_fields = ['project_id', 'created_date', 'last_modified']  # Add last_modified to read-only
+
+
+class ProjectSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Project list representation: scope totals and activity counts instead of nested rows"""
+    class ScopeSummarySerializer(serializers.ModelSerializer):
+        activity_count = serializers.IntegerField(read_only=True)
+        lca_activity_count = serializers.IntegerField(read_only=True)
+
+        class Meta:
+            model = EmissionScope
+            fields = ["scope_id", "scope_number", "total_emissions_tco2e", "activity_count", "lca_activity_count"]
+
+    scopes = ScopeSummarySerializer(many=True, read_only=True)
+    total_emissions_tco2e = serializers.SerializerMethodField()
+    activity_count = serializers.SerializerMethodField()
+    lca_product_count = serializers.IntegerField(read_only=True)
+
+    # Nested as on the detail endpoint
+    expandable_fields = {
+        'scopes': (ProjectSerializer.ScopeWithActivitiesSerializer, {'many': True, 'read_only': True}),
+        'lca_products': (LCAProductSerializer, {'many': True, 'read_only': True}),
+    }
+
+    class Meta:
+        model = Project
+        fields = [
+            "project_id", "name", "description", "created_date", "last_modified",
+            "location", "latitude", "longitude",
+            "scopes", "total_emissions_tco2e", "activity_count", "lca_product_count"
+        ]
+        read_only_fields = fields
+
+    # Computed from the prefetched scopes
+    def get_total_emissions_tco2e(self, obj):
+        return float(sum(scope.total_emissions_tco2e for scope in obj.scopes.all()))
+
+    def get_activity_count(self, obj):
+        return sum(scope.activity_count + scope.lca_activity_count for scope in obj.scopes.all())
+
+
+class ScenarioSerializer(serializers.ModelSerializer):
+    """Saved sensitivity scenario. The baseline snapshot and totals are maintained server-side."""
+    activity_count = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = Scenario
+        fields = [
+            "scenario_id", "project", "name", "description",
+            "adjustments", "timeline_years", "growth_rate", "growth_curve",
+            "baseline_total", "adjusted_total", "activity_count",
+            "created_date", "last_modified", "baseline_date"
+        ]
+        read_only_fields = [
+            "scenario_id", "baseline_total", "adjusted_total",
+            "created_date", "last_modified", "baseline_date"
+        ]
+
+    def get_activity_count(self, obj):
+        return len(obj.baseline_snapshot or {})
+
+    def validate_adjustments(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Adjustments must be an object of {activity_id: percent_change}.")
+        for activity_id, pct in value.items():
+            try:
+                float(pct)
+            except (TypeError, ValueError):
+                raise serializers.ValidationError(f"Invalid percent change for activity {activity_id}: {pct}")
+        return value
+
+    def validate_growth_curve(self, value):
+        if not isinstance(value, list):
+            raise serializers.ValidationError("Growth curve must be a list of annual growth rates.")
+        for rate in value:
+            try:
+                float(rate)
+            except (TypeError, ValueError):
+                raise serializers.ValidationError(f"Invalid growth rate: {rate}")
+        return value
@@ -1,3 +1,1234 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+from scipy.sparse import linalg as sparse_linalg
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .models import (
+    Project, EmissionScope, EmissionFactor, EmissionActivity, LCAActivity, MonthlyEmissionRollup,
+    EmissionLedgerEntry, LCAProduct, ProductExchange, EmissionFactorRevision, FactorImportJob, Scenario,
+)
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .utils import autocomplete
+from .utils.import_jobs import interrupted_jobs, Heartbeat, JobImporter, run_import_job
+from .utils.factor_propagation import update_factor_values
+from .utils.factor_search import search_factors
+from .utils.lca_graph import ProductGraphCycleError, recompute_all_products
+from .utils.ledger import expand_activities, rebuild_ledger, refresh_projections
+from .utils.response_cache import BRIGHTWAY_KEY, bump_data_version, project_key
+from .utils.rollups import rebuild_rollups, rollup_totals_by_scope
+from .utils.scope_totals import suspend_scope_totals
+from .utils.sefr_importer import SEFRExcelImporter
+from .views_dashboard import activities_in_range, calculate_monthly_emissions, parse_date_range
+
+
+def create_factor(value='2.5', unit='kWh', **kwargs):
+    defaults = {
+        'name': 'Grid electricity',
+        'category': 'purchased_electricity',
+        'source': 'SEFR',
+        'year': 2024,
+        'applicable_scopes': [2],
+    }
+    defaults.update(kwargs)
+    return EmissionFactor.objects.create(emission_factor_value=Decimal(value), unit=unit, **defaults)
+
+
+class ScenarioTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name='Plant A')
+        self.scope = EmissionScope.objects.create(project=self.project, scope_number=2)
+        self.factor = create_factor()
+        # 1000 kWh * 2.5 kg/kWh = 2.5 t
+        self.activity = self.create_activity(Decimal('1000'))
+
+    def create_activity(self, quantity, project=None, scope=None):
+        return EmissionActivity.objects.create(
+            project=project or self.project, scope=scope or self.scope, activity_name='Electricity',
+            quantity=quantity, unit='kWh', emission_factor=self.factor,
+        )
+
+    def create_scenario(self, adjustments=None):
+        response = self.client.post('/api/scenarios/', {
+            'project': str(self.project.pk), 'name': 'Efficiency',
+            'adjustments': adjustments or {}, 'growth_curve': [0.1, 0.2],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return Scenario.objects.get(pk=response.json()['scenario_id'])
+
+    def test_activity_changes_apply_deltas(self):
+        scenario = self.create_scenario({str(self.activity.pk): -20})
+        self.assertEqual((scenario.baseline_total, scenario.adjusted_total), (Decimal('2.5'), Decimal('2')))
+
+        # Created, updated and deleted activities move the totals by their difference only
+        other = self.create_activity(Decimal('400'))
+        self.activity.quantity = Decimal('2000')
+        self.activity.save()
+        scenario.refresh_from_db()
+        self.assertEqual((scenario.baseline_total, scenario.adjusted_total), (Decimal('6'), Decimal('5')))
+
+        other.delete()
+        scenario.refresh_from_db()
+        self.assertEqual((scenario.baseline_total, scenario.adjusted_total), (Decimal('5'), Decimal('4')))
+        self.assertEqual(list(scenario.baseline_snapshot), [str(self.activity.pk)])
+
+        # Adjustments and growth curve: year 1 grows 10 %, year 2 and later 20 %
+        analysis = self.client.get(f'/api/scenarios/{scenario.pk}/analysis/').json()
+        self.assertEqual((analysis['baseline_total'], analysis['adjusted_total'], analysis['impact_change_pct']), (5.0, 4.0, -20.0))
+        self.assertEqual([year['adjusted'] for year in analysis['timeline'][:4]], [4.0, 4.4, 5.28, 6.336])
+
+    def test_activity_moved_to_another_project(self):
+        scenario = self.create_scenario()
+        other_project = Project.objects.create(name='Plant B')
+        other_scenario = Scenario.objects.create(project=other_project, name='Growth')
+        unrelated = Scenario.objects.create(project=Project.objects.create(name='Plant C'), name='Unrelated')
+        new_scope = EmissionScope.objects.create(project=other_project, scope_number=2)
+
+        self.activity.project = other_project
+        self.activity.scope = new_scope
+        with CaptureQueriesContext(connection) as queries:
+            self.activity.save()
+
+        # Only the scenarios of the former and new projects are locked, by project
+        scenario_reads = [query['sql'] for query in queries if query['sql'].startswith('SELECT') and '"api_scenario"' in query['sql']]
+        self.assertEqual(len(scenario_reads), 1)
+        self.assertIn('"project_id" IN', scenario_reads[0])
+        self.assertNotIn('baseline_snapshot', scenario_reads[0].split(' WHERE ', 1)[1])
+        self.assertEqual(Scenario.objects.get(pk=unrelated.pk).last_modified, unrelated.last_modified)
+
+        scenario.refresh_from_db()
+        other_scenario.refresh_from_db()
+        self.assertEqual((scenario.baseline_snapshot, scenario.baseline_total), ({}, Decimal('0')))
+        self.assertEqual(list(other_scenario.baseline_snapshot), [str(self.activity.pk)])
+        self.assertEqual(other_scenario.baseline_total, Decimal('2.5'))
+
+    def test_rebaseline_picks_up_unsignalled_changes(self):
+        scenario = self.create_scenario()
+        # Queryset updates send no signals, so the snapshot goes stale until it is rebuilt
+        EmissionActivity.objects.filter(pk=self.activity.pk).update(quantity=Decimal('3000'))
+        scenario.refresh_from_db()
+        self.assertEqual(scenario.baseline_total, Decimal('2.5'))
+
+        response = self.client.post(f'/api/scenarios/{scenario.pk}/rebaseline/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.json()['baseline_total']), Decimal('7.5'))
+        self.assertEqual(response.json()['activity_count'], 1)
+
+
+class MonthlyEmissionsAggregationTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name='Plant A')
+        self.scope = EmissionScope.objects.create(project=self.project, scope_number=2)
+        self.factor = create_factor()
+
+        # 1000 kWh * 2.5 kg/kWh = 2.5 t in January and again in February
+        for period_start in (date(2025, 1, 15), date(2025, 2, 3)):
+            EmissionActivity.objects.create(
+                project=self.project, scope=self.scope, activity_name='Electricity',
+                quantity=Decimal('1000'), unit='kWh', emission_factor=self.factor,
+                period_start=period_start,
+            )
+
+        # No period_start: bucketed by created_date (March)
+        no_period = EmissionActivity.objects.create(
+            project=self.project, scope=self.scope, activity_name='Electricity (undated)',
+            quantity=Decimal('400'), unit='kWh', emission_factor=self.factor,
+        )
+        EmissionActivity.objects.filter(pk=no_period.pk).update(
+            created_date=timezone.make_aware(datetime(2025, 3, 10, 12, 0))
+        )
+        # Queryset updates bypass the incremental ledger and rollup maintenance
+        rebuild_ledger()
+        rebuild_rollups()
+
+        # LCA results are stored in kgCO₂e: 500 kg = 0.5 t in February
+        LCAActivity.objects.create(
+            project=self.project, scope=self.scope, activity_name='Steel',
+            bw2_database='db', bw2_activity_code='code', quantity=Decimal('1'),
+            calculated_emissions=Decimal('500'), period_start=date(2025, 2, 20),
+        )
+
+    def test_month_buckets_use_fixed_query_count(self):
+        projects = Project.objects.filter(pk=self.project.pk)
+        with self.assertNumQueries(1):
+            buckets = calculate_monthly_emissions(date(2025, 1, 1), date(2025, 12, 31), projects)
+
+        self.assertEqual(len(buckets), 12)
+        self.assertEqual([b['emissions'] for b in buckets[:4]], [2.5, 3.0, 1.0, 0.0])
+        self.assertEqual(buckets[0]['month_name'], 'Jan')
+        self.assertEqual(buckets[0]['period_start'], '2025-01-01')
+
+    def test_quarter_buckets(self):
+        buckets = calculate_monthly_emissions(date(2025, 1, 1), date(2025, 6, 30), granularity='quarter')
+
+        self.assertEqual([b['month_name'] for b in buckets], ['Q1 2025', 'Q2 2025'])
+        self.assertEqual([b['emissions'] for b in buckets], [6.5, 0.0])
+
+    def test_week_buckets_start_on_monday(self):
+        with self.assertNumQueries(2):
+            buckets = calculate_monthly_emissions(date(2025, 1, 15), date(2025, 1, 31), granularity='week')
+
+        self.assertEqual(buckets[0]['period_start'], '2025-01-13')
+        self.assertEqual(buckets[0]['emissions'], 2.5)
+        self.assertEqual(sum(b['emissions'] for b in buckets), 2.5)
+
+    def test_invalid_granularity(self):
+        with self.assertRaises(ValueError):
+            calculate_monthly_emissions(date(2025, 1, 1), date(2025, 3, 31), granularity='day')
+
+    def test_default_range_covers_whole_months(self):
+        factory = APIRequestFactory()
+        now = timezone.make_aware(datetime(2025, 3, 10, 12, 0))
+        with mock.patch('api.views_dashboard.timezone.now', return_value=now):
+            self.assertEqual(parse_date_range(factory.get('/')), (date(2024, 10, 1), date(2025, 3, 31), '6months'))
+            self.assertEqual(parse_date_range(factory.get('/', {'period': '3months'}))[:2], (date(2025, 1, 1), date(2025, 3, 31)))
+            self.assertEqual(
+                parse_date_range(factory.get('/', {'start': '2025-02-01', 'end': '2025-02-14'})),
+                (date(2025, 2, 1), date(2025, 2, 14), 'custom')
+            )
+
+
+class MonthlyEmissionRollupTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name='Plant A')
+        self.scope = EmissionScope.objects.create(project=self.project, scope_number=1)
+        self.factor = create_factor(value='3', unit='L', name='Diesel', category='stationary_combustion', applicable_scopes=[1])
+
+    def rollup(self):
+        return {
+            (row.month, row.source_type): row.emissions_tco2e
+            for row in MonthlyEmissionRollup.objects.filter(project=self.project).exclude(emissions_tco2e=0)
+        }
+
+    def test_deltas_follow_activity_saves_and_deletes(self):
+        activity = EmissionActivity.objects.create(
+            project=self.project, scope=self.scope, activity_name='Generator',
+            quantity=Decimal('1000'), unit='L', emission_factor=self.factor,
+            period_start=date(2025, 1, 10),
+        )
+        self.assertEqual(self.rollup(), {(date(2025, 1, 1), 'emission_factor'): Decimal('3')})
+
+        # Move to February
+        activity.quantity = Decimal('500')
+        activity.period_start = date(2025, 2, 1)
+        activity.save()
+        self.assertEqual(self.rollup(), {(date(2025, 2, 1), 'emission_factor'): Decimal('1.5')})
+
+        activity.delete()
+        self.assertEqual(self.rollup(), {})
+
+    def test_year_long_activity_updates_rollup_in_one_statement(self):
+        # 1200 L * 3 kg/L = 3.6 t over 12 months
+        activity = EmissionActivity.objects.create(
+            project=self.project, scope=self.scope, activity_name='Generator',
+            quantity=Decimal('1200'), unit='L', emission_factor=self.factor,
+            period_start=date(2025, 1, 1), period_end=date(2025, 12, 31), is_recurring=False,
+        )
+        activity.quantity = Decimal('2400')
+        with CaptureQueriesContext(connection) as queries:
+            activity.save()
+
+        rollup_statements = [query['sql'] for query in queries if 'monthlyemissionrollup' in query['sql'].lower()]
+        self.assertEqual(len(rollup_statements), 1)
+        rollup = self.rollup()
+        self.assertEqual(len(rollup), 12)
+        self.assertEqual(sum(rollup.values()), Decimal('7.2'))
+
+    def test_report_totals_match_all_time_details(self):
+        # Older than any reporting period: the report is all-time, totals and details alike
+        EmissionActivity.objects.create(
+            project=self.project, scope=self.scope, activity_name='Generator',
+            quantity=Decimal('1000'), unit='L', emission_factor=self.factor,
+            period_start=date(2020, 1, 10),
+        )
+        cache.clear()
+        report = self.client.get(
+            '/api/reports/generate/', {'project_id': self.project.pk, 'standard': 'ghg', 'period': '3months'}
+        ).json()
+
+        self.assertEqual(report['summary']['scope_1_total'], 3.0)
+        self.assertEqual(report['details']['1'], [{'name': 'Generator', 'emissions': 3.0}])
+
+    def test_rebuild_matches_incremental_rollup(self):
+        EmissionActivity.objects.create(
+            project=self.project, scope=self.scope, activity_name='Generator',
+            quantity=Decimal('1000'), unit='L', emission_factor=self.factor,
+            period_start=date(2025, 1, 10),
+        )
+        LCAActivity.objects.create(
+            project=self.project, scope=self.scope, activity_name='Steel',
+            bw2_database='db', bw2_activity_code='code', quantity=Decimal('1'),
+            calculated_emissions=Decimal('250'), period_start=date(2025, 1, 20),
+        )
+        incremental = self.rollup()
+
+        MonthlyEmissionRollup.objects.all().delete()
+        rebuild_ledger()
+        rebuild_rollups()
+
+        self.assertEqual(self.rollup(), incremental)
+        self.assertEqual(incremental[(date(2025, 1, 1), 'lca')], Decimal('0.25'))
+
+
+class EmissionLedgerTests(TestCase):
+    def record(self, **kwargs):
+        record = {
+            'activity_id': 'a1', 'source_type': 'emission_factor', 'project_id': 'p1',
+            'scope_number': 2, 'scope3_category': None, 'emissions_tco2e': Decimal('10'),
+            'period_start': None, 'period_end': None, 'is_recurring': False,
+            'created_date': date(2025, 1, 1),
+        }
+        record.update(kwargs)
+        return record
+
+    def test_period_is_prorated_by_day(self):
+        rows = expand_activities([self.record(
+            emissions_tco2e=Decimal('3.1'), period_start=date(2025, 1, 17), period_end=date(2025, 2, 16),
+        )])
+
+        # 15 days in January, 16 in February out of 31
+        self.assertEqual([(r['month'], r['emissions_tco2e']) for r in rows], [
+            (date(2025, 1, 1), Decimal('1.5')),
+            (date(2025, 2, 1), Decimal('1.6')),
+        ])
+
+    def test_rounding_remainder_keeps_total_exact(self):
+        rows = expand_activities([self.record(period_start=date(2025, 1, 1), period_end=date(2025, 3, 31))])
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(sum(r['emissions_tco2e'] for r in rows), Decimal('10'))
+
+    def test_recurring_activity_is_projected_to_horizon(self):
+        rows = expand_activities(
+            [self.record(is_recurring=True, period_start=date(2025, 1, 1), period_end=date(2025, 1, 31))],
+            horizon=date(2025, 4, 1),
+        )
+
+        actual = [r for r in rows if not r['is_projection']]
+        projected = [r for r in rows if r['is_projection']]
+        self.assertEqual(len(actual), 1)
+        self.assertEqual([r['month'] for r in projected], [date(2025, 2, 1), date(2025, 3, 1), date(2025, 4, 1)])
+        self.assertTrue(all(r['emissions_tco2e'] == Decimal('10') for r in projected))
+
+    def test_ledger_follows_activity_saves(self):
+        project = Project.objects.create(name='Plant A')
+        scope = EmissionScope.objects.create(project=project, scope_number=2)
+        activity = EmissionActivity.objects.create(
+            project=project, scope=scope, activity_name='Electricity',
+            quantity=Decimal('1200'), unit='kWh', emission_factor=create_factor(),
+            period_start=date(2025, 1, 1), period_end=date(2025, 12, 31),
+        )
+        entries = EmissionLedgerEntry.objects.filter(activity_id=activity.activity_id, is_projection=False)
+        self.assertEqual(entries.count(), 12)
+        self.assertEqual(sum(e.emissions_tco2e for e in entries), Decimal('3'))
+
+        activity.delete()
+        self.assertFalse(EmissionLedgerEntry.objects.exists())
+
+    def test_week_and_month_buckets_agree(self):
+        project = Project.objects.create(name='Plant A')
+        scope = EmissionScope.objects.create(project=project, scope_number=2)
+        # 3650 kWh * 2.5 kg/kWh over 2025 = 0.025 t a day
+        EmissionActivity.objects.create(
+            project=project, scope=scope, activity_name='Electricity', is_recurring=False,
+            quantity=Decimal('3650'), unit='kWh', emission_factor=create_factor(),
+            period_start=date(2025, 1, 1), period_end=date(2025, 12, 31),
+        )
+
+        weeks = calculate_monthly_emissions(date(2025, 2, 1), date(2025, 3, 31), granularity='week')
+        months = calculate_monthly_emissions(date(2025, 2, 1), date(2025, 3, 31))
+        # The week of Jan 27 only counts its February days
+        self.assertEqual((weeks[0]['period_start'], weeks[0]['emissions']), ('2025-01-27', 0.05))
+        self.assertEqual(weeks[1]['emissions'], 0.18)
+        self.assertAlmostEqual(sum(b['emissions'] for b in weeks), sum(b['emissions'] for b in months), places=1)
+        self.assertEqual([b['emissions'] for b in months], [0.7, 0.78])
+
+    def test_refresh_moves_projections_forward(self):
+        project = Project.objects.create(name='Plant A')
+        scope = EmissionScope.objects.create(project=project, scope_number=2)
+        activity = EmissionActivity.objects.create(
+            project=project, scope=scope, activity_name='Electricity', is_recurring=True,
+            quantity=Decimal('1000'), unit='kWh', emission_factor=create_factor(),
+            period_start=date(2025, 1, 1), period_end=date(2025, 1, 31),
+        )
+        projections = EmissionLedgerEntry.objects.filter(activity_id=activity.activity_id, is_projection=True)
+        rollup = rollup_totals_by_scope()
+
+        self.assertEqual(refresh_projections(horizon=date(2025, 3, 1)), 2)
+        self.assertEqual(list(projections.order_by('month').values_list('month', flat=True)), [date(2025, 2, 1), date(2025, 3, 1)])
+        # Six months later the projections reach further
+        refresh_projections(horizon=date(2025, 9, 1))
+        self.assertEqual(projections.count(), 8)
+        self.assertEqual(rollup_totals_by_scope(), rollup)
+
+
+class VersionedResponseCacheTests(TestCase):
+    def setUp(self):
+        # Versions restart with every test database, so don't reuse earlier responses
+        cache.clear()
+        self.project = Project.objects.create(name='Plant A')
+        self.scope = EmissionScope.objects.create(project=self.project, scope_number=2)
+        self.factor = create_factor()
+        self.url = f'/api/dashboard/stats/{self.project.pk}/'
+
+    def test_matching_etag_returns_304_after_one_query(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'].startswith('"'))
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], first['ETag'])
+
+        # Other parameters are a different response
+        self.assertNotEqual(self.client.get(self.url, {'period': '1year'})['ETag'], first['ETag'])
+
+    def test_activity_write_invalidates_response(self):
+        first = self.client.get(self.url)
+        portfolio = self.client.get('/api/dashboard/stats/')
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            EmissionActivity.objects.create(
+                project=self.project, scope=self.scope, activity_name='Electricity',
+                quantity=Decimal('1000'), unit='kWh', emission_factor=self.factor,
+            )
+
+        # Only the project's counter is written, after the scope totals
+        version_writes = [
+            index for index, query in enumerate(queries)
+            if 'api_dataversion' in query['sql'] and not query['sql'].startswith('SELECT')
+        ]
+        scope_updates = [index for index, query in enumerate(queries) if query['sql'].startswith('UPDATE "api_emissionscope"')]
+        self.assertTrue(version_writes)
+        self.assertLess(max(scope_updates), min(version_writes))
+        for index in version_writes:
+            self.assertIn(project_key(self.project.pk), queries[index]['sql'])
+
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.json()['total_emissions'], 2.5)
+        # Responses covering every project follow the project counters
+        self.assertEqual(self.client.get('/api/dashboard/stats/', HTTP_IF_NONE_MATCH=portfolio['ETag']).status_code, 200)
+
+
+class ReferenceDataBundleTests(TestCase):
+    url = '/api/reference-data/'
+
+    def setUp(self):
+        cache.clear()
+        self.databases = [{'name': 'biosphere3', 'num_activities': 4000}]
+        for name, value in (('notable_impact_methods', lambda: []), ('brightway_databases', lambda: self.databases)):
+            patcher = mock.patch(f'api.utils.reference_bundle.{name}', side_effect=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_etag_changes_only_with_content(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        version = first.json()['version']
+        self.assertEqual(first['ETag'], f'"{version}"')
+        self.assertEqual(first.json()['databases'], self.databases)
+        self.assertEqual(len(first.json()['categories']), len(EmissionFactor.CATEGORY_CHOICES))
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        immutable = self.client.get(self.url, {'v': version})
+        self.assertIn('immutable', immutable['Cache-Control'])
+
+        # A Brightway write rebuilds the bundle, the hash follows the content
+        bump_data_version(BRIGHTWAY_KEY)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.databases = self.databases + [{'name': 'ecoinvent-3.9.1-cutoff', 'num_activities': 21000}]
+        bump_data_version(BRIGHTWAY_KEY)
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertNotIn('immutable', self.client.get(self.url, {'v': version})['Cache-Control'])
+
+
+class PortfolioDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        factor = create_factor()
+        for index, quantity in enumerate(('1000', '3000', '2000')):
+            project = Project.objects.create(name=f'Plant {index}')
+            scope = EmissionScope.objects.create(project=project, scope_number=2)
+            EmissionActivity.objects.create(
+                project=project, scope=scope, activity_name='Electricity',
+                quantity=Decimal(quantity), unit='kWh', emission_factor=factor,
+            )
+
+    def test_constant_query_count(self):
+        with self.assertNumQueries(6):
+            first = self.client.get('/api/dashboard/portfolio/', {'page_size': 2, 'top': 1}).json()
+
+        self.assertEqual(first['total_projects'], 3)
+        self.assertEqual(first['total_emissions'], 15.0)
+        self.assertEqual(first['emissions_by_scope'], {'2': 15.0})
+        self.assertEqual([p['name'] for p in first['top_projects']], ['Plant 1'])
+        self.assertEqual([p['total_emissions'] for p in first['projects']['results']], [7.5, 5.0])
+        self.assertIsNotNone(first['projects']['next'])
+
+        # Adding projects doesn't add queries (their versions are bumped at commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(3, 8):
+                Project.objects.create(name=f'Plant {index}')
+        with self.assertNumQueries(6):
+            self.client.get('/api/dashboard/portfolio/', {'page_size': 2, 'top': 1})
+
+    def test_sorting_and_validation(self):
+        response = self.client.get('/api/dashboard/portfolio/', {'sort': 'name'}).json()
+        self.assertEqual([p['name'] for p in response['projects']['results']], ['Plant 0', 'Plant 1', 'Plant 2'])
+
+        self.assertEqual(self.client.get('/api/dashboard/portfolio/', {'sort': 'bogus'}).status_code, 400)
+
+
+class ScopeTotalTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name='Plant A')
+        self.scope1 = EmissionScope.objects.create(project=self.project, scope_number=1)
+        self.scope2 = EmissionScope.objects.create(project=self.project, scope_number=2)
+        self.factor = create_factor(applicable_scopes=[1, 2])
+
+    def create_activity(self, scope, quantity='1000'):
+        return EmissionActivity.objects.create(
+            project=self.project, scope=scope, activity_name='Electricity',
+            quantity=Decimal(quantity), unit='kWh', emission_factor=self.factor,
+        )
+
+    def totals(self):
+        return [
+            EmissionScope.objects.get(pk=scope.pk).total_emissions_tco2e
+            for scope in (self.scope1, self.scope2)
+        ]
+
+    def test_totals_are_recomputed_once_at_commit(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    activity = self.create_activity(self.scope1)
+                    self.create_activity(self.scope1, '2000')
+                    LCAActivity.objects.create(
+                        project=self.project, scope=self.scope2, activity_name='Steel',
+                        bw2_database='db', bw2_activity_code='code', quantity=Decimal('1'),
+                        calculated_emissions=Decimal('500'),
+                    )
+                    self.assertEqual(self.totals(), [Decimal('0'), Decimal('0')])
+
+        scope_updates = [query for query in queries if query['sql'].startswith('UPDATE "api_emissionscope"')]
+        self.assertEqual(len(scope_updates), 1)
+        self.assertEqual(self.totals(), [Decimal('7.5'), Decimal('0.5')])
+
+        # Moving an activity updates both the old and the new scope
+        with self.captureOnCommitCallbacks(execute=True):
+            activity.scope = self.scope2
+            activity.save()
+        self.assertEqual(self.totals(), [Decimal('5'), Decimal('3')])
+
+    def test_rolled_back_flush_is_registered_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.create_activity(self.scope1)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            self.create_activity(self.scope2)
+        self.assertEqual(self.totals(), [Decimal('0'), Decimal('2.5')])
+
+    def test_suspend_collects_scopes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with suspend_scope_totals():
+                for _ in range(3):
+                    self.create_activity(self.scope1)
+                self.assertEqual(self.totals(), [Decimal('0'), Decimal('0')])
+        self.assertEqual(self.totals(), [Decimal('7.5'), Decimal('0')])
+
+
+class BulkActivityIngestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.project = Project.objects.create(name='Plant A')
+        self.factor = create_factor()
+
+    def test_csv_upload_creates_valid_rows_and_reports_errors(self):
+        csv = (
+            "scope_number,emission_factor_id,activity_name,quantity,unit,period_start\n"
+            f"2,{self.factor.pk},January,1000,kWh,2025-01-10\n"
+            f"2,{self.factor.pk},February,2000,kWh,2025-02-10\n"
+            f"2,{self.factor.pk},Wrong unit,5,L,2025-02-10\n"
+            f"3,{self.factor.pk},No category,abc,kWh,\n"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/emission-activities/bulk/?project={self.project.pk}', csv, content_type='text/csv'
+            )
+
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (2, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4])
+        self.assertIn('unit', report['errors'][0]['errors'])
+        self.assertEqual(set(report['errors'][1]['errors']), {'quantity', 'scope3_category'})
+
+        # The scope is created, and totals, ledger and rollup include the new rows
+        scope = EmissionScope.objects.get(project=self.project, scope_number=2)
+        self.assertEqual(scope.total_emissions_tco2e, Decimal('7.5'))
+        self.assertEqual(
+            EmissionActivity.objects.get(activity_name='February').calculated_emissions, Decimal('5')
+        )
+        self.assertEqual(rollup_totals_by_scope(), {2: Decimal('7.5')})
+
+    def test_atomic_upload_creates_nothing_on_errors(self):
+        rows = [
+            {'project': str(self.project.pk), 'scope_number': 2, 'emission_factor_id': str(self.factor.pk),
+             'activity_name': 'Ok', 'quantity': 10, 'unit': 'kWh'},
+            {'project': str(self.project.pk), 'scope_number': 2, 'emission_factor_id': 'nope',
+             'activity_name': 'Bad', 'quantity': 10, 'unit': 'kWh'},
+        ]
+        response = self.client.post(
+            '/api/emission-activities/bulk/?atomic=true', rows, content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['errors'], {'emission_factor_id': 'Emission factor not found.'})
+        self.assertFalse(EmissionActivity.objects.exists())
+
+
+class SEFRImportTests(TestCase):
+    def test_import_skips_duplicates_and_reports_invalid_rows(self):
+        create_factor(name='Diesel', category='stationary_combustion', value='2.7', unit='L', year=2024)
+        sheet = pd.DataFrame([
+            {'Category': 'Purchased Energy', 'Activity': 'Grid electricity', 'EF (kg CO2-eq per unit)': 0.41, 'Unit': 'kWh', 'Year': 2024},
+            {'Category': 'Purchased Energy', 'Activity': 'Grid electricity', 'EF (kg CO2-eq per unit)': 0.41, 'Unit': 'kWh', 'Year': 2024},
+            {'Category': 'Fuel', 'Activity': 'Diesel', 'EF (kg CO2-eq per unit)': 2.7, 'Unit': 'L', 'Year': 2024},
+            {'Category': 'Fuel', 'Activity': 'Broken', 'EF (kg CO2-eq per unit)': -1, 'Unit': 'L', 'Year': 2024},
+            {'Category': 'Building Materials', 'Activity': 'Steel', 'EF (kg CO2-eq per unit)': 1.9, 'Unit': 'kg', 'Year': None},
+        ])
+        excel = io.BytesIO()
+        sheet.to_excel(excel, index=False)
+        excel.seek(0)
+
+        importer = SEFRExcelImporter(excel)
+        with CaptureQueriesContext(connection) as queries, mock.patch('builtins.print'):
+            self.assertTrue(importer.import_data())
+
+        summary = importer.get_import_summary()
+        self.assertEqual((summary['success_count'], summary['skipped_count'], summary['error_count']), (2, 2, 1))
+        self.assertIn("'Broken'", summary['errors'][0])
+        self.assertEqual(summary['imported_factors'], ['Grid electricity', 'Steel'])
+        # One duplicate lookup and one INSERT, whatever the sheet size (plus the version bump)
+        self.assertLessEqual(len(queries), 8)
+
+        steel = EmissionFactor.objects.get(name='Steel')
+        self.assertEqual((steel.category, steel.year, steel.applicable_scopes), ('purchased_goods_services', 2023, [3]))
+        self.assertEqual(EmissionFactor.objects.get(name='Grid electricity').emission_factor_value, Decimal('0.41'))
+
+    def test_files_are_imported_in_chunks(self):
+        rows = "\n".join(f"Fuel,Fuel {number % 5},{number + 1},L,2024" for number in range(12))
+        csv = f"Category,Activity,EF (kg CO2-eq per unit),Unit,Year\n{rows}\n".encode()
+        sheet = pd.read_csv(io.BytesIO(csv))
+        excel = io.BytesIO()
+        sheet.to_excel(excel, index=False)
+
+        for content, file_format in ((csv, 'csv'), (excel.getvalue(), 'xlsx')):
+            EmissionFactor.objects.all().delete()
+            importer = SEFRExcelImporter(io.BytesIO(content), file_format=file_format)
+            # Duplicates in later chunks are found against the factors of earlier ones
+            with mock.patch.object(SEFRExcelImporter, 'CHUNK_SIZE', 4), mock.patch('builtins.print'):
+                self.assertTrue(importer.import_data())
+
+            summary = importer.get_import_summary()
+            self.assertEqual((summary['total_rows'], summary['success_count'], summary['skipped_count']), (12, 5, 7))
+            self.assertEqual(EmissionFactor.objects.get(name='Fuel 4').emission_factor_value, Decimal('5'))
+
+
+class FactorImportJobTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(FACTOR_IMPORT_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for patcher in (
+            # Run the job inline, the test transaction isn't visible to another thread
+            mock.patch('api.utils.import_jobs.start_import_job', side_effect=run_import_job),
+            mock.patch.object(SEFRExcelImporter, 'CHUNK_SIZE', 4),
+            mock.patch('builtins.print'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        rows = "\n".join(f"Fuel,Fuel {number},{number + 1},L,2024" for number in range(10))
+        self.csv = f"Category,Activity,EF (kg CO2-eq per unit),Unit,Year\n{rows}\nFuel,Broken,-1,L,2024\n".encode()
+
+    def upload(self, delta=False):
+        data = {'file': SimpleUploadedFile('library.csv', self.csv)}
+        if delta:
+            data['mode'] = 'delta'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/emission-factors/import_excel/', data)
+        self.assertEqual(response.status_code, 202)
+        return FactorImportJob.objects.get(pk=response.json()['job']['job_id'])
+
+    def test_upload_returns_job_with_progress(self):
+        job = self.upload()
+
+        progress = self.client.get(f'/api/factor-import-jobs/{job.pk}/').json()
+        self.assertEqual(progress['status'], 'completed')
+        self.assertEqual(
+            [progress[name] for name in ('rows_parsed', 'rows_inserted', 'rows_skipped', 'rows_errored', 'chunks_committed')],
+            [11, 10, 0, 1, 3]
+        )
+        self.assertEqual(progress['summary']['success_count'], 10)
+        self.assertFalse(os.path.exists(job.file_path))
+
+    def test_interrupted_job_resumes_after_last_committed_chunk(self):
+        commit = JobImporter.chunk_committed
+
+        def crash_on_second_chunk(importer, number):
+            if number == 1:
+                raise RuntimeError('worker stopped')
+            commit(importer, number)
+
+        with mock.patch.object(JobImporter, 'chunk_committed', crash_on_second_chunk):
+            job = self.upload()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.chunks_committed, job.rows_parsed, job.rows_inserted), ('failed', 1, 4, 4))
+        self.assertEqual(EmissionFactor.objects.count(), 4)
+
+        # A job left running by a dead process is picked up once its heartbeat is stale
+        FactorImportJob.objects.filter(pk=job.pk).update(status='running', heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(list(interrupted_jobs()), [job])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/factor-import-jobs/{job.pk}/resume/')
+        self.assertEqual(response.status_code, 202)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.chunks_committed), ('completed', 3))
+        self.assertEqual((job.rows_parsed, job.rows_inserted, job.rows_skipped, job.rows_errored), (11, 10, 0, 1))
+        self.assertEqual(EmissionFactor.objects.count(), 10)
+
+    def test_reclaimed_job_stops_writing_progress(self):
+        import_chunk = JobImporter.import_chunk
+
+        def reclaimed_before_second_chunk(importer, number):
+            if number == 1:
+                # Another runner took the job over (this one's heartbeat looked stale)
+                FactorImportJob.objects.filter(pk=importer.job.pk).update(claim_token=uuid.uuid4())
+            return import_chunk(importer, number)
+
+        with mock.patch.object(JobImporter, 'import_chunk', reclaimed_before_second_chunk):
+            job = self.upload()
+
+        # The second chunk was rolled back and the job and its file left to the new runner
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.chunks_committed, job.rows_inserted), ('running', 1, 4))
+        self.assertEqual(EmissionFactor.objects.count(), 4)
+        self.assertTrue(os.path.exists(job.file_path))
+
+    def test_heartbeat_is_refreshed_between_chunks(self):
+        refreshed = threading.Event()
+        job_id, token = uuid.uuid4(), uuid.uuid4()
+        with mock.patch('api.utils.import_jobs.update_claimed_job', side_effect=lambda *args, **kwargs: refreshed.set()) as update:
+            with Heartbeat(job_id, token, interval=timedelta(milliseconds=10)):
+                self.assertTrue(refreshed.wait(5))
+        self.assertEqual(update.call_args.args, (job_id, token))
+        self.assertEqual(list(update.call_args.kwargs), ['heartbeat_at'])
+
+    def test_delta_import_applies_changes_and_retires_dropped_factors(self):
+        self.upload()
+        project = Project.objects.create(name='Plant A')
+        scope = EmissionScope.objects.create(project=project, scope_number=1)
+        fuel = EmissionFactor.objects.get(name='Fuel 3')
+        with self.captureOnCommitCallbacks(execute=True):
+            activity = EmissionActivity.objects.create(
+                project=project, scope=scope, activity_name='Boilers', quantity=Decimal('1000'), unit='L',
+                emission_factor=fuel, period_start=date(2025, 1, 1), is_recurring=False,
+            )
+
+        # Next release: Fuel 3 changes value, Fuel 9 is dropped, Fuel 10 is new
+        rows = "\n".join(
+            f"Fuel,Fuel {number},{'9.5' if number == 3 else number + 1},L,2024" for number in range(11) if number != 9
+        )
+        self.csv = f"Category,Activity,EF (kg CO2-eq per unit),Unit,Year\n{rows}\n".encode()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/emission-factors/import_excel/', {'file': SimpleUploadedFile('library.csv', self.csv), 'mode': 'delta'}
+            )
+        job = FactorImportJob.objects.get(pk=response.json()['job']['job_id'])
+        self.assertTrue(job.delta)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(
+            (job.rows_inserted, job.rows_updated, job.rows_unchanged, job.factors_retired, job.rows_skipped),
+            (1, 1, 8, 1, 0)
+        )
+        self.assertEqual(job.value_changes, [
+            {'factor_id': str(fuel.pk), 'name': 'Fuel 3', 'old_value': '4.000000', 'new_value': '9.500000'}
+        ])
+
+        # The value change reached the activity, with its revision
+        activity.refresh_from_db()
+        self.assertEqual(activity.calculated_emissions, Decimal('9.5'))
+        self.assertTrue(fuel.revisions.filter(source=EmissionFactorRevision.SOURCE_IMPORT).exists())
+
+        # The dropped factor is kept for its activities but no longer listed
+        retired = EmissionFactor.objects.get(name='Fuel 9')
+        self.assertIsNotNone(retired.retired_date)
+        names = {factor['name'] for factor in self.client.get('/api/emission-factors/').json()['results']}
+        self.assertEqual(len(names), 10)
+        self.assertNotIn('Fuel 9', names)
+        self.assertEqual(self.client.get(f'/api/emission-factors/{retired.pk}/').status_code, 200)
+
+
+    def test_delta_import_of_next_year_updates_factors_in_place(self):
+        self.upload()
+        factor_ids = set(EmissionFactor.objects.values_list('pk', flat=True))
+
+        # Factors imported before row hashes were kept are compared on their stored fields
+        EmissionFactor.objects.filter(name__in=['Fuel 0', 'Fuel 1']).update(source_row_hash=None)
+        job = self.upload(delta=True)
+        self.assertEqual((job.rows_inserted, job.rows_updated, job.rows_unchanged, job.factors_retired), (0, 0, 10, 0))
+        self.assertFalse(EmissionFactor.objects.filter(source_row_hash__isnull=True).exists())
+
+        # The yearly republish updates the same factors instead of replacing them
+        self.csv = self.csv.replace(b',2024\n', b',2025\n')
+        job = self.upload(delta=True)
+        self.assertEqual((job.rows_inserted, job.rows_updated, job.rows_unchanged, job.factors_retired), (0, 10, 0, 0))
+        self.assertEqual(set(EmissionFactor.objects.values_list('pk', flat=True)), factor_ids)
+        self.assertEqual(set(EmissionFactor.objects.values_list('year', flat=True)), {2025})
+        self.assertEqual(job.value_changes, [])
+
+
+class FactorPropagationTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name='Plant A')
+        self.scope = EmissionScope.objects.create(project=self.project, scope_number=2)
+        self.factor = create_factor()
+        self.other_factor = create_factor(value='1', name='Other grid')
+        with self.captureOnCommitCallbacks(execute=True):
+            for quantity in ('1000', '3000'):
+                EmissionActivity.objects.create(
+                    project=self.project, scope=self.scope, activity_name='Electricity',
+                    quantity=Decimal(quantity), unit='kWh', emission_factor=self.factor,
+                    period_start=date(2025, 1, 1), is_recurring=False,
+                )
+        self.product = LCAProduct.objects.create(project=self.project, name='Widget', functional_unit='1 unit')
+        ProductExchange.objects.create(product=self.product, emission_factor=self.factor, quantity=Decimal('2'), unit='kWh')
+        ProductExchange.objects.create(product=self.product, emission_factor=self.other_factor, quantity=Decimal('1'), unit='kWh')
+
+    def test_factor_edit_recalculates_dependents(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.factor.emission_factor_value = Decimal('5')
+            self.factor.save()
+
+        emissions = sorted(EmissionActivity.objects.values_list('calculated_emissions', flat=True))
+        self.assertEqual(emissions, [Decimal('5'), Decimal('15')])
+        self.assertEqual(EmissionScope.objects.get(pk=self.scope.pk).total_emissions_tco2e, Decimal('20'))
+        self.assertEqual(rollup_totals_by_scope(), {2: Decimal('20')})
+        self.assertEqual(LCAProduct.objects.get(pk=self.product.pk).total_carbon_footprint_per_unit, Decimal('11'))
+
+        revision = EmissionFactorRevision.objects.get()
+        self.assertEqual((revision.old_value, revision.new_value), (Decimal('2.5'), Decimal('5')))
+        self.assertEqual((revision.activities_updated, revision.exchanges_updated, revision.products_updated), (2, 1, 1))
+
+    def test_bulk_update_skips_unchanged_factors(self):
+        revisions = update_factor_values({self.factor.pk: Decimal('2.5'), self.other_factor.pk: Decimal('3')})
+
+        self.assertEqual([revision.factor_id for revision in revisions], [self.other_factor.pk])
+        self.assertEqual(revisions[0].source, EmissionFactorRevision.SOURCE_BULK)
+        self.assertEqual(LCAProduct.objects.get(pk=self.product.pk).total_carbon_footprint_per_unit, Decimal('8'))
+
+    def test_bulk_upsert_endpoint(self):
+        row = {
+            'name': 'Grid electricity', 'category': 'purchased_electricity', 'emission_factor_value': '5',
+            'unit': 'kWh', 'source': 'SEFR', 'year': 2024, 'applicable_scopes': [2],
+        }
+        rows = [
+            {**row, 'factor_id': str(self.factor.pk)},
+            {**row, 'name': 'Solar PPA', 'emission_factor_value': 0.05, 'uncertainty_type': 2, 'uncertainty_params': {'sigma': 0.01}},
+            {**row, 'year': 1980, 'uncertainty_type': 1, 'uncertainty_params': {'loc': 1}},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/emission-factors/bulk/', rows, content_type='application/json')
+
+        body = response.json()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((body['created'], body['updated'], body['failed'], body['revisions']), (1, 1, 1, 1))
+        self.assertEqual(set(body['errors'][0]['errors']), {'year', 'uncertainty_params'})
+        self.assertEqual(EmissionFactor.objects.get(name='Solar PPA').emission_factor_value, Decimal('0.05'))
+        emissions = sorted(EmissionActivity.objects.values_list('calculated_emissions', flat=True))
+        self.assertEqual(emissions, [Decimal('5'), Decimal('15')])
+        self.assertEqual(EmissionFactorRevision.objects.get().source, EmissionFactorRevision.SOURCE_BULK)
+
+    def test_bulk_delete_keeps_factors_in_use(self):
+        unused = create_factor(name='Unused')
+        revision = EmissionFactorRevision.objects.create(factor=unused, old_value=Decimal('1'), new_value=Decimal('2'))
+        response = self.client.post(
+            '/api/emission-factors/bulk_delete/', {'factor_ids': [str(unused.pk), str(self.factor.pk)]},
+            content_type='application/json',
+        )
+
+        self.assertEqual((response.json()['deleted'], response.json()['failed']), (1, 1))
+        self.assertEqual(set(EmissionFactor.objects.values_list('name', flat=True)), {'Grid electricity', 'Other grid'})
+        # The revision audit is kept without its factor
+        revision.refresh_from_db()
+        self.assertIsNone(revision.factor_id)
+
+
+class ProductGraphTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name='Plant A')
+        self.factor = create_factor(value='2', name='Steel')
+        # 5-level bill of materials: each level uses 2 units of the level below
+        self.products = [LCAProduct.objects.create(project=self.project, name=f'Level {level}', functional_unit='1 unit') for level in range(5)]
+        self.base_exchange = ProductExchange.objects.create(product=self.products[0], emission_factor=self.factor, quantity=Decimal('1'), unit='kg')
+        for child, parent in zip(self.products, self.products[1:]):
+            ProductExchange.objects.create(product=parent, input_product=child, quantity=Decimal('2'), unit='unit')
+
+    def totals(self):
+        footprints = dict(LCAProduct.objects.values_list('lca_id', 'total_carbon_footprint_per_unit'))
+        return [footprints[product.pk] for product in self.products]
+
+    def test_base_component_change_propagates_through_all_levels(self):
+        self.assertEqual(self.totals(), [Decimal(value) for value in ('2', '4', '8', '16', '32')])
+
+        self.base_exchange.quantity = Decimal('3')
+        self.base_exchange.save()
+        self.assertEqual(self.totals(), [Decimal(value) for value in ('6', '12', '24', '48', '96')])
+
+        update_factor_values({self.factor.pk: Decimal('1')})
+        self.assertEqual(self.totals(), [Decimal(value) for value in ('3', '6', '12', '24', '48')])
+
+        self.base_exchange.delete()
+        self.assertEqual(self.totals(), [Decimal('0')] * 5)
+
+    def test_cycle_is_rejected(self):
+        with self.assertRaises(ProductGraphCycleError):
+            ProductExchange.objects.create(product=self.products[0], input_product=self.products[4], quantity=Decimal('1'), unit='unit')
+
+        self.assertFalse(ProductExchange.objects.filter(product=self.products[0], input_product__isnull=False).exists())
+        self.assertEqual(self.totals()[4], Decimal('32'))
+
+    def test_converging_recycling_loop_is_solved(self):
+        # Level 0 takes back 0.25 unit of recycled level 1 material: x0 = 2 + 0.25 * 2 * x0
+        ProductExchange.objects.create(product=self.products[0], input_product=self.products[1], quantity=Decimal('0.25'), unit='unit')
+
+        self.assertEqual(self.totals(), [Decimal(value) for value in ('4', '8', '16', '32', '64')])
+        self.assertEqual(recompute_all_products(), 0)
+
+    def test_sparse_eigensolver_failure_falls_back_to_dense(self):
+        no_convergence = sparse_linalg.ArpackNoConvergence('ARPACK error -1: No convergence', [], [])
+        with mock.patch('api.utils.lca_graph.DENSE_EIGEN_LIMIT', 0), \
+                mock.patch('api.utils.lca_graph.sparse_linalg.eigs', side_effect=no_convergence) as eigs:
+            ProductExchange.objects.create(product=self.products[0], input_product=self.products[1], quantity=Decimal('0.25'), unit='unit')
+            with self.assertRaises(ProductGraphCycleError):
+                ProductExchange.objects.create(product=self.products[0], input_product=self.products[4], quantity=Decimal('1'), unit='unit')
+
+        self.assertTrue(eigs.called)
+        self.assertEqual(self.totals(), [Decimal(value) for value in ('4', '8', '16', '32', '64')])
+
+    def test_update_graph_applies_only_the_differences(self):
+        widget = LCAProduct.objects.create(project=self.project, name='Widget', functional_unit='1 unit')
+        kept = ProductExchange.objects.create(product=widget, emission_factor=self.factor, quantity=Decimal('1'), unit='kg')
+        dropped = ProductExchange.objects.create(product=widget, input_product=self.products[0], quantity=Decimal('1'), unit='unit')
+        assembly = LCAProduct.objects.create(project=self.project, name='Assembly', functional_unit='1 unit')
+        ProductExchange.objects.create(product=assembly, input_product=widget, quantity=Decimal('10'), unit='unit')
+
+        url = f'/api/lca-products/{widget.pk}/update_graph/'
+        exchanges = [
+            {'exchange_id': str(kept.pk), 'emission_factor_id': str(self.factor.pk), 'quantity': 3},
+            {'input_product_id': str(self.products[1].pk), 'quantity': '0.5'},
+        ]
+        response = self.client.post(url, {'exchanges': exchanges}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.json()['total_carbon_footprint_per_unit']), Decimal('8'))
+        self.assertEqual(ProductExchange.objects.get(pk=kept.pk).calculated_impact, Decimal('6'))
+        self.assertFalse(ProductExchange.objects.filter(pk=dropped.pk).exists())
+        self.assertEqual(LCAProduct.objects.get(pk=assembly.pk).total_carbon_footprint_per_unit, Decimal('80'))
+
+        response = self.client.post(url, {'exchanges': [{'emission_factor_id': str(self.products[0].pk), 'quantity': 1}]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(widget.exchanges.count(), 2)
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN the hot filter queries on a seeded dataset and fail on sequential scans"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.factors = EmissionFactor.objects.bulk_create([
+            EmissionFactor(
+                name=f'Factor {number}', category='purchased_electricity', source='SEFR', year=2020 + number % 5,
+                emission_factor_value=Decimal('1'), unit='kWh', applicable_scopes=[number % 3 + 1],
+            )
+            for number in range(300)
+        ])
+        cls.projects = []
+        for number in range(5):
+            project = Project.objects.create(name=f'Plant {number}')
+            scope = EmissionScope.objects.create(project=project, scope_number=2)
+            # Bulk creates skip the ledger, rollup and scope total signals
+            EmissionActivity.objects.bulk_create([
+                EmissionActivity(
+                    project=project, scope=scope, activity_name='Electricity', quantity=Decimal('1'), unit='kWh',
+                    emission_factor=cls.factors[index], period_start=date(2024, index % 12 + 1, 1) if index % 3 else None,
+                )
+                for index in range(300)
+            ])
+            LCAActivity.objects.bulk_create([
+                LCAActivity(
+                    project=project, scope=scope, activity_name='Steel', bw2_database='db', bw2_activity_code='steel',
+                    quantity=Decimal('1'), period_start=date(2024, index % 12 + 1, 1) if index % 3 else None,
+                )
+                for index in range(300)
+            ])
+            cls.projects.append(project)
+        rebuild_ledger()
+        rebuild_rollups(None)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndexes(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Small tables are cheaper to scan: only fall back to a scan when no index applies
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            scans = re.findall(r'Seq Scan on (\w+)', plan)
+        else:
+            plan = queryset.explain()
+            scans = re.findall(r'\bSCAN (\w+)$', plan, re.MULTILINE)
+        self.assertEqual(scans, [], f"Sequential scan in query plan:\n{plan}")
+
+    def test_activity_date_range(self):
+        projects = Project.objects.filter(pk=self.projects[0].pk)
+        for model in (EmissionActivity, LCAActivity):
+            with self.subTest(model=model.__name__):
+                self.assertUsesIndexes(activities_in_range(model, date(2024, 2, 1), date(2024, 4, 30), projects))
+
+    def test_rollup_and_ledger_lookups(self):
+        projects = Project.objects.filter(pk=self.projects[0].pk)
+        self.assertUsesIndexes(MonthlyEmissionRollup.objects.filter(project__in=projects, month__gte=date(2024, 1, 1), month__lte=date(2024, 6, 1)))
+        activity_id = EmissionActivity.objects.values_list('activity_id', flat=True).first()
+        self.assertUsesIndexes(EmissionLedgerEntry.objects.filter(activity_id=activity_id, source_type=MonthlyEmissionRollup.SOURCE_EMISSION_FACTOR))
+
+    def test_factor_category_listing(self):
+        self.assertUsesIndexes(EmissionFactor.objects.filter(category__in=['purchased_electricity', 'stationary_combustion']))
+
+    @skipUnless(connection.vendor == 'postgresql', "GIN indexes are PostgreSQL only")
+    def test_factor_scope_and_text_filters(self):
+        self.assertUsesIndexes(EmissionFactor.objects.filter(applicable_scopes__contains=[2]))
+        self.assertUsesIndexes(EmissionFactor.objects.filter(name__icontains='factor 12'))
+        self.assertUsesIndexes(EmissionFactor.objects.filter(
+            Q(name__icontains='sefr') | Q(description__icontains='sefr') | Q(source__icontains='sefr') |
+            Q(imported_category__icontains='sefr') | Q(imported_sub_category__icontains='sefr')
+        ))
+        self.assertUsesIndexes(search_factors(EmissionFactor.objects.all(), 'factor 12'))
+
+
+class FactorSearchTests(TestCase):
+    def test_search_ranks_name_matches_first(self):
+        create_factor(name='Office paper', description='Electricity used in paper mills')
+        create_factor(name='Grid electricity')
+        create_factor(name='Electricity')
+        create_factor(name='Diesel')
+
+        response = self.client.get('/api/emission-factors/', {'search': 'electricity'})
+
+        names = [factor['name'] for factor in response.json()['results']]
+        self.assertEqual(names, ['Electricity', 'Grid electricity', 'Office paper'])
+
+
+class FactorAutocompleteTests(TestCase):
+    url = '/api/emission-factors/autocomplete/'
+
+    def setUp(self):
+        # Data versions restart with every test database, so start from an empty index
+        patcher = mock.patch.object(autocomplete, '_index', autocomplete.FactorIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        create_factor(name='Grid electricity')
+        create_factor(name='Electricity, solar PPA')
+        create_factor(name='Diesel', unit='L', category='stationary_combustion', applicable_scopes=[1])
+
+    def names(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [factor['name'] for factor in response.json()]
+
+    def test_name_prefix_matches_rank_first(self):
+        self.assertEqual(self.names(q='elec'), ['Electricity, solar PPA', 'Grid electricity'])
+        self.assertEqual(self.names(q='ELEC sol'), ['Electricity, solar PPA'])
+        self.assertEqual(self.names(q='elec', scope=2, limit=1), ['Electricity, solar PPA'])
+
+    def test_typos_match_similar_words(self):
+        self.assertEqual(self.names(q='dissel'), ['Diesel'])
+        self.assertEqual(self.names(q='xyzzy'), [])
+
+    def test_factor_writes_are_picked_up(self):
+        self.assertEqual(self.names(q='grid'), ['Grid electricity'])
+
+        factor = EmissionFactor.objects.get(name='Grid electricity')
+        factor.name = 'Grid mix electricity'
+        factor.save()
+        create_factor(name='Grid average')
+        EmissionFactor.objects.filter(name='Diesel').delete()
+
+        self.assertEqual(self.names(q='grid'), ['Grid average', 'Grid mix electricity'])
+        self.assertEqual(self.names(q='diesel'), [])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        # Repeated names and years exercise the primary key tiebreaker
+        for number in range(45):
+            create_factor(name=f'Factor {number % 20:02d}', year=2000 + number % 4)
+
+    def walk(self, params):
+        ids, response = [], self.client.get('/api/emission-factors/', params)
+        while True:
+            body = response.json()
+            ids += [factor['factor_id'] for factor in body['results']]
+            if not body['next']:
+                return ids
+            response = self.client.get(body['next'])
+
+    def test_pages_cover_every_row_once_in_order(self):
+        factors = list(EmissionFactor.objects.all())
+        for sort, key, reverse in (('name', 'name', False), ('-year', 'year', True), (None, 'category', False)):
+            ordered = sorted(factors, key=lambda factor: (getattr(factor, key), factor.name if sort is None else '', str(factor.pk)), reverse=reverse)
+            self.assertEqual(self.walk({'sort': sort} if sort else {}), [str(factor.pk) for factor in ordered], sort)
+
+    def test_nulls_sort_last(self):
+        project = Project.objects.create(name='Plant A')
+        scope = EmissionScope.objects.create(project=project, scope_number=3)
+        for number in range(7):
+            LCAActivity.objects.create(
+                project=project, scope=scope, activity_name=f'Steel {number}', bw2_database='db', bw2_activity_code='code',
+                quantity=Decimal('1'), period_start=date(2025, 1, 1 + number % 3) if number % 2 else None,
+            )
+        paginator = KeysetPagination()
+        paginator.page_size = 3
+        queryset = LCAActivity.objects.order_by('period_start')
+
+        names, url = [], '/api/lca-activities/'
+        while url:
+            names += [activity.activity_name for activity in paginator.paginate_queryset(queryset, Request(APIRequestFactory().get(url)))]
+            url = paginator.get_next_link()
+
+        self.assertEqual(names[:3], ['Steel 3', 'Steel 1', 'Steel 5'])
+        self.assertEqual(sorted(names[3:]), ['Steel 0', 'Steel 2', 'Steel 4', 'Steel 6'])
+
+    def test_cursor_pages_are_stable_and_previous_returns(self):
+        self.assertEqual(self.client.get('/api/emission-factors/', {'count': 'exact'}).json()['count'], 45)
+        first = self.client.get('/api/emission-factors/').json()
+        self.assertNotIn('count', first)
+
+        second = self.client.get(first['next']).json()
+        previous = self.client.get(second['previous']).json()
+        self.assertEqual(previous['results'], first['results'])
+        self.assertIsNone(previous['previous'])
+
+        # A row sorting before the cursor doesn't shift the next page
+        create_factor(name='Factor 00')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(first['next']).json()['results'], second['results'])
+        self.assertEqual(self.client.get('/api/emission-factors/', {'cursor': 'bogus'}).status_code, 404)
+
+    def test_page_numbers_still_supported(self):
+        body = self.client.get('/api/emission-factors/', {'page': 3}).json()
+        self.assertEqual((body['count'], len(body['results'])), (45, 5))
+
+
+class RenderingTests(TestCase):
+    def test_fast_renderer_matches_drf(self):
+        data = {
+            'value': Decimal('2.500000'), 'id': uuid.UUID(int=1), 'when': datetime(2025, 1, 2, 3, 4, 5, 6, tzinfo=dt_timezone.utc),
+            2: ['line\u2028separator', None, 1.5, date(2025, 1, 1)],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_json_responses_are_compressed(self):
+        for number in range(10):
+            create_factor(name=f'Factor {number}')
+
+        response = self.client.get('/api/emission-factors/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 10)
+
+
+class ProjectApiTests(TestCase):
+    def setUp(self):
+        factor = create_factor()
+        with self.captureOnCommitCallbacks(execute=True):
+            for number in range(3):
+                project = Project.objects.create(name=f'Plant {number}')
+                scope = EmissionScope.objects.create(project=project, scope_number=2)
+                for quantity in ('1000', '2000'):
+                    EmissionActivity.objects.create(
+                        project=project, scope=scope, activity_name='Electricity', quantity=Decimal(quantity),
+                        unit='kWh', emission_factor=factor, period_start=date(2025, 1, 1), is_recurring=False,
+                    )
+                product = LCAProduct.objects.create(project=project, name='Widget', functional_unit='1 unit')
+                ProductExchange.objects.create(product=product, emission_factor=factor, quantity=Decimal('1'), unit='kWh')
+        self.project = project
+
+    def test_list_returns_summaries_in_constant_queries(self):
+        # Page count, projects, scopes
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/projects/')
+
+        summary = response.json()['results'][0]
+        self.assertNotIn('lca_products', summary)
+        self.assertEqual((summary['total_emissions_tco2e'], summary['activity_count'], summary['lca_product_count']), (7.5, 2, 1))
+        self.assertEqual(summary['scopes'][0]['activity_count'], 2)
+
+    def test_detail_and_nested_list_in_constant_queries(self):
+        # Project, scopes, activities with their factors, LCA activities, products, exchanges
+        with self.assertNumQueries(6):
+            response = self.client.get(f'/api/projects/{self.project.pk}/')
+        self.assertEqual(len(response.json()['scopes'][0]['activities']), 2)
+
+        with self.assertNumQueries(7):
+            response = self.client.get('/api/projects/', {'nested': 'true'})
+        self.assertEqual(len(response.json()['results'][0]['lca_products'][0]['exchanges']), 1)
+
+    def test_sparse_fieldsets_and_expansion(self):
+        response = self.client.get('/api/projects/', {'fields': 'name,total_emissions_tco2e'})
+        self.assertEqual(set(response.json()['results'][0]), {'name', 'total_emissions_tco2e'})
+
+        # Activities joined to their scope, no page count
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/emission-activities/', {'fields': 'activity_name,scope', 'expand': 'scope'})
+        activity = response.json()['results'][0]
+        self.assertEqual(set(activity), {'activity_name', 'scope'})
+        self.assertEqual(activity['scope']['scope_number'], 2)
+
+        response = self.client.get('/api/emission-factors/', {'fields': 'name,unknown'})
+        self.assertEqual(response.status_code, 400)
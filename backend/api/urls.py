@@ -3,9 +3,10 @@ from rest_framework import routers
 from .views import (
     ProjectViewSet, EmissionScopeViewSet, EmissionFactorViewSet, EmissionActivityViewSet,
     LCAProductViewSet, LCAActivityViewSet, BW2AdminViewSet, UncertaintyAnalysisViewSet,
-    SensitivityAnalysisViewSet, get_settings, calculate_lca, ProductExchangeViewSet
+    SensitivityAnalysisViewSet, ScenarioViewSet, get_settings, reference_data, calculate_lca, ProductExchangeViewSet,
+    FactorImportJobViewSet,
 )
-from .views_dashboard import dashboard_stats
+from .views_dashboard import dashboard_stats, dashboard_portfolio
 from .views_reports import generate_report
 from .views_visualization import GlobeDataView
 
@@ -13,6 +14,7 @@ router = routers.DefaultRouter()
 router.register(r'projects', ProjectViewSet)
 router.register(r'emission-scopes', EmissionScopeViewSet)
 router.register(r'emission-factors', EmissionFactorViewSet)
+router.register(r'factor-import-jobs', FactorImportJobViewSet)
 router.register(r'emission-activities', EmissionActivityViewSet)
 router.register(r'lca-products', LCAProductViewSet)
 router.register(r'product-exchanges', ProductExchangeViewSet)
@@ -20,13 +22,16 @@ router.register(r'lca-activities', LCAActivityViewSet)
 router.register(r'brightway2', BW2AdminViewSet, basename='bw2')
 router.register(r'uncertainty', UncertaintyAnalysisViewSet, basename='uncertainty')
 router.register(r'sensitivity', SensitivityAnalysisViewSet, basename='sensitivity')
+router.register(r'scenarios', ScenarioViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
     path('settings/', get_settings, name='get_settings'),
+    path('reference-data/', reference_data, name='reference_data'),
     path('calculate-lca/', calculate_lca, name='calculate_lca'),
     path('dashboard/stats/', dashboard_stats, name='dashboard_stats_all'),
     path('dashboard/stats/<uuid:project_id>/', dashboard_stats, name='dashboard_stats'),
+    path('dashboard/portfolio/', dashboard_portfolio, name='dashboard_portfolio'),
     path('reports/generate/', generate_report, name='generate_report'),
     path('globe-data/<uuid:project_id>/', GlobeDataView.as_view(), name='globe_data'),
 ]
@@ -0,0 +1,334 @@
+"""
+Bulk emission activity ingestion.
+
+Reads activity rows from CSV, JSON lines or a JSON array, validates them against
+factors, projects and scopes preloaded in one query each, computes
+calculated_emissions for all rows at once and writes them with
+bulk_insert.insert_rows as plain column lists (multi-row INSERT statements, no
+model instances). Primary keys, coordinates and timestamps are filled in here
+because insert_rows applies no defaults and doesn't run EmissionActivity.save.
+
+insert_rows doesn't send signals, so the work the post_save receivers do for a
+single activity (ledger and rollup, saved scenarios, scope totals, data versions)
+is done here once for the whole batch.
+
+Columns (same names as the EmissionActivity serializer):
+- project: project ID (optional when a default project is given)
+- scope_number: 1, 2 or 3 (the scope is created if the project doesn't have it yet)
+- emission_factor_id, activity_name, quantity, unit: required
+- scope3_category: required for Scope 3
+- description, period_start, period_end (YYYY-MM-DD), is_recurring,
+  origin_location, destination_location: optional
+"""
+
+import io
+import json
+import uuid
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Project, EmissionScope, EmissionFactor, EmissionActivity, MonthlyEmissionRollup
+from .bulk_insert import insert_rows
+
+
+REQUIRED_COLUMNS = ('emission_factor_id', 'activity_name', 'quantity', 'unit', 'scope_number')
+OPTIONAL_COLUMNS = (
+    'project', 'description', 'scope3_category', 'period_start', 'period_end', 'is_recurring',
+    'origin_location', 'destination_location',
+)
+# Accepted alternative column names
+COLUMN_ALIASES = {'project_id': 'project', 'emission_factor': 'emission_factor_id', 'scope': 'scope_number'}
+
+# quantity and calculated_emissions are DecimalField(max_digits=15, decimal_places=6)
+MAX_DECIMAL = Decimal('1e9')
+
+TRUE_VALUES = {'true', '1', 'yes', 'y'}
+FALSE_VALUES = {'false', '0', 'no', 'n'}
+
+SCOPE3_CATEGORIES = {choice for choice, _ in EmissionActivity.SCOPE3_CATEGORY_CHOICES}
+
+DEFAULT_BATCH_SIZE = 2000
+
+
+class IngestFormatError(ValueError):
+    """The upload could not be parsed into rows"""
+
+
+def read_activity_rows(content, fmt):
+    """
+    Parse uploaded content into a DataFrame of strings/JSON values.
+    fmt: 'csv', 'jsonl' or 'json'
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+
+    try:
+        if fmt == 'csv':
+            frame = pd.read_csv(io.StringIO(content), dtype=str, keep_default_na=False, skipinitialspace=True)
+        elif fmt == 'jsonl':
+            frame = pd.DataFrame.from_records([json.loads(line) for line in content.splitlines() if line.strip()])
+        elif fmt == 'json':
+            data = json.loads(content)
+            if isinstance(data, dict):
+                data = data.get('rows', [])
+            if not isinstance(data, list):
+                raise IngestFormatError("JSON upload must be a list of rows or {'rows': [...]}")
+            frame = pd.DataFrame.from_records(data)
+        else:
+            raise IngestFormatError(f"Unsupported format '{fmt}', use csv, jsonl or json")
+    except (ValueError, pd.errors.ParserError) as e:
+        if isinstance(e, IngestFormatError):
+            raise
+        raise IngestFormatError(f"Could not parse {fmt} upload: {e}")
+
+    frame = frame.rename(columns=lambda name: COLUMN_ALIASES.get(str(name).strip(), str(name).strip()))
+    return frame.reset_index(drop=True)
+
+
+def _text(frame, column):
+    """Column as stripped strings ('' for missing values)"""
+    if column not in frame:
+        return pd.Series('', index=frame.index, dtype=object)
+    return frame[column].map(lambda value: '' if value is None or (isinstance(value, float) and pd.isna(value)) else str(value).strip())
+
+
+def _to_decimal(value):
+    try:
+        number = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return number if number.is_finite() else None
+
+
+def _to_uuid(value):
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _to_uuids(series):
+    """Parse a column of IDs, once per distinct value"""
+    return series.map({value: _to_uuid(value) for value in series.unique()})
+
+
+def _add_errors(errors, mask, field, message):
+    for index in mask[mask].index:
+        errors[index].setdefault(field, message)
+
+
+def ingest_activities(frame, default_project_id=None, dry_run=False, atomic=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Validate and insert activity rows.
+
+    default_project_id: project for rows without a project column/value
+    dry_run: validate only
+    atomic: insert nothing if any row is invalid
+
+    Returns {'created', 'failed', 'errors': [{'row', 'errors': {field: message}}], 'activity_ids'}
+    where row is the 1-based data row number.
+    """
+    errors = defaultdict(dict)
+    n_rows = len(frame)
+    if n_rows == 0:
+        return {'created': 0, 'failed': 0, 'errors': [], 'activity_ids': []}
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in frame]
+    if missing:
+        raise IngestFormatError(f"Missing required columns: {', '.join(missing)}")
+
+    columns = {column: _text(frame, column) for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS}
+
+    # --- Required text fields ---
+    _add_errors(errors, columns['activity_name'] == '', 'activity_name', 'This field is required.')
+    _add_errors(errors, columns['activity_name'].str.len() > 255, 'activity_name', 'Ensure this field has no more than 255 characters.')
+    _add_errors(errors, columns['unit'] == '', 'unit', 'This field is required.')
+
+    # --- Quantity ---
+    quantity = columns['quantity'].map(_to_decimal)
+    _add_errors(errors, quantity.isna(), 'quantity', 'A valid number is required.')
+    _add_errors(errors, quantity.map(lambda q: pd.notna(q) and not (0 <= q < MAX_DECIMAL)), 'quantity', 'Must be between 0 and 1e9.')
+
+    # --- Projects: one query ---
+    project_ids = columns['project'].where(columns['project'] != '', str(default_project_id or ''))
+    project_ids = _to_uuids(project_ids)
+    projects = Project.objects.in_bulk({p for p in project_ids if p is not None})
+    _add_errors(errors, project_ids.map(lambda p: p not in projects), 'project', 'Project not found.')
+
+    # --- Scopes: one query, missing scopes are created on insert ---
+    scope_numbers = pd.to_numeric(columns['scope_number'], errors='coerce')
+    _add_errors(errors, ~scope_numbers.isin([1, 2, 3]), 'scope_number', 'Must be 1, 2 or 3.')
+    scopes = {
+        (scope.project_id, scope.scope_number): scope
+        for scope in EmissionScope.objects.filter(project_id__in=list(projects))
+    }
+
+    # --- Scope 3 categories ---
+    category = columns['scope3_category']
+    _add_errors(errors, (scope_numbers == 3) & (category == ''), 'scope3_category', 'This field is required for Scope 3 activities.')
+    _add_errors(errors, (category != '') & ~category.isin(SCOPE3_CATEGORIES), 'scope3_category', 'Not a valid choice.')
+
+    # --- Emission factors: one query, then unit checks against the preloaded factors ---
+    factor_ids = _to_uuids(columns['emission_factor_id'])
+    factors = EmissionFactor.objects.only('factor_id', 'unit', 'emission_factor_value').in_bulk(
+        {f for f in factor_ids if f is not None}
+    )
+    factor_found = factor_ids.map(lambda f: f in factors)
+    _add_errors(errors, ~factor_found, 'emission_factor_id', 'Emission factor not found.')
+    factor_units = factor_ids.map(lambda f: factors[f].unit if f in factors else None)
+    _add_errors(
+        errors, factor_found & (columns['unit'] != '') & (columns['unit'] != factor_units), 'unit',
+        "Unit doesn't match the emission factor's unit."
+    )
+
+    # --- Emissions for all rows at once (exact decimals, kg → tonnes like EmissionActivity.save) ---
+    factor_values = factor_ids.map(lambda f: Decimal(factors[f].emission_factor_value or 0) if f in factors else None)
+    computable = quantity.notna() & factor_values.notna()
+    emissions = pd.Series(None, index=frame.index, dtype=object)
+    emissions[computable] = quantity[computable] * factor_values[computable] / Decimal('1000')
+    _add_errors(errors, emissions.map(lambda e: pd.notna(e) and abs(e) >= MAX_DECIMAL), 'quantity', 'Calculated emissions are too large.')
+
+    # --- Dates ---
+    dates = {}
+    for column in ('period_start', 'period_end'):
+        parsed = pd.to_datetime(columns[column], format='%Y-%m-%d', errors='coerce')
+        _add_errors(errors, (columns[column] != '') & parsed.isna(), column, 'Date has wrong format. Use YYYY-MM-DD.')
+        dates[column] = pd.Series([value.date() if pd.notna(value) else None for value in parsed], index=frame.index, dtype=object)
+    reversed_period = pd.Series(
+        [bool(start and end and end < start) for start, end in zip(dates['period_start'], dates['period_end'])],
+        index=frame.index
+    )
+    _add_errors(errors, reversed_period, 'period_end', 'Must not be before period_start.')
+
+    # --- Booleans ---
+    recurring_text = columns['is_recurring'].str.lower()
+    _add_errors(errors, ~recurring_text.isin(TRUE_VALUES | FALSE_VALUES | {''}), 'is_recurring', 'Must be a valid boolean.')
+    # Blank keeps the model default
+    is_recurring = recurring_text.map(lambda value: value in TRUE_VALUES if value else EmissionActivity._meta.get_field('is_recurring').default)
+
+    report_errors = [{'row': index + 1, 'errors': errors[index]} for index in sorted(errors)]
+    valid_indexes = [index for index in range(n_rows) if index not in errors]
+
+    if dry_run or (atomic and errors) or not valid_indexes:
+        return {'created': 0, 'failed': len(errors), 'errors': report_errors, 'activity_ids': []}
+
+    # Column values of the valid rows as plain lists (row access on Series is slow)
+    def valid(series):
+        return series.iloc[valid_indexes].tolist()
+
+    row_projects = [projects[project_id] for project_id in valid(project_ids)]
+    row_scope_numbers = [int(number) for number in valid(scope_numbers)]
+    row_factors = [factors[factor_id] for factor_id in valid(factor_ids)]
+    origins = valid(columns['origin_location'])
+    destinations = valid(columns['destination_location'])
+
+    # Geocoding is a table lookup, resolve each distinct location once
+    from .geocoding import get_coordinates
+    coordinates = {location: get_coordinates(location) for location in set(origins) if location}
+
+    with transaction.atomic():
+        # Create the scopes the rows refer to but that don't exist yet
+        new_scopes = {
+            (project.project_id, number)
+            for project, number in zip(row_projects, row_scope_numbers)
+            if (project.project_id, number) not in scopes
+        }
+        if new_scopes:
+            # Scopes created concurrently are skipped and picked up by the re-query
+            EmissionScope.objects.bulk_create([
+                EmissionScope(project=projects[project_id], scope_number=number)
+                for project_id, number in new_scopes
+            ], ignore_conflicts=True)
+            scopes.update({
+                (scope.project_id, scope.scope_number): scope
+                for scope in EmissionScope.objects.filter(project_id__in={project_id for project_id, _ in new_scopes})
+            })
+        row_scopes = [scopes[(project.project_id, number)] for project, number in zip(row_projects, row_scope_numbers)]
+
+        now = timezone.now()
+        activity_ids = [uuid.uuid4() for _ in valid_indexes]
+        origin_coordinates = [coordinates.get(location) or {} for location in origins]
+        values = {
+            'activity_id': activity_ids,
+            'project': [project.project_id for project in row_projects],
+            'scope': [scope.scope_id for scope in row_scopes],
+            'emission_factor': [factor.factor_id for factor in row_factors],
+            'activity_name': valid(columns['activity_name']),
+            'description': [text or None for text in valid(columns['description'])],
+            'quantity': valid(quantity),
+            'unit': valid(columns['unit']),
+            'scope3_category': [text or None for text in valid(category)],
+            'calculated_emissions': valid(emissions),
+            'period_start': valid(dates['period_start']),
+            'period_end': valid(dates['period_end']),
+            'is_recurring': valid(is_recurring),
+            'origin_location': [location or None for location in origins],
+            'origin_latitude': [origin.get('lat') for origin in origin_coordinates],
+            'origin_longitude': [origin.get('lng') for origin in origin_coordinates],
+            # Destination defaults to the project location, like EmissionActivity.save
+            'destination_location': [
+                destination or project.location for destination, project in zip(destinations, row_projects)
+            ],
+            'destination_latitude': [project.latitude for project in row_projects],
+            'destination_longitude': [project.longitude for project in row_projects],
+            'created_date': [now] * len(valid_indexes),
+            'last_modified': [now] * len(valid_indexes),
+        }
+        insert_rows(EmissionActivity, list(values), zip(*values.values()), batch_size=batch_size)
+
+        records = [
+            {
+                'activity_id': activity_id,
+                'source_type': MonthlyEmissionRollup.SOURCE_EMISSION_FACTOR,
+                'project_id': project_id,
+                'scope_number': scope.scope_number,
+                'scope3_category': scope3_category,
+                'emissions_tco2e': emissions_tco2e,
+                'period_start': period_start,
+                'period_end': period_end,
+                'is_recurring': recurring,
+                'created_date': now,
+            }
+            for activity_id, project_id, scope, scope3_category, emissions_tco2e, period_start, period_end, recurring in zip(
+                activity_ids, values['project'], row_scopes, values['scope3_category'], values['calculated_emissions'],
+                values['period_start'], values['period_end'], values['is_recurring']
+            )
+        ]
+        contributions = defaultdict(list)
+        for record, name in zip(records, values['activity_name']):
+            contributions[record['project_id']].append((str(record['activity_id']), {
+                'name': name,
+                'baseline': float(record['emissions_tco2e']),
+                'type': 'emission_factor',
+                'scope': record['scope_number'],
+            }))
+        after_bulk_activity_create(records, contributions, set(values['scope']))
+
+    return {
+        'created': len(activity_ids),
+        'failed': len(errors),
+        'errors': report_errors,
+        'activity_ids': [str(activity_id) for activity_id in activity_ids],
+    }
+
+
+def after_bulk_activity_create(records, contributions, scope_ids):
+    """
+    Do what the post_save receivers do for single activities, once for a batch.
+    records: ledger records of the new activities (see utils.ledger)
+    contributions: {project_id: [(activity_id, scenario snapshot entry)]}
+    scope_ids: scopes the activities were added to
+    """
+    from .ledger import add_to_ledger
+    from .scenarios import apply_contributions_to_scenarios
+    from .scope_totals import mark_scope_dirty
+    from .response_cache import bump_project_versions
+
+    add_to_ledger(records)
+    apply_contributions_to_scenarios(contributions)
+    mark_scope_dirty(*scope_ids)
+    bump_project_versions(*{record['project_id'] for record in records})
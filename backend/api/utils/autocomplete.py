@@ -0,0 +1,376 @@
+"""
+In-memory autocomplete over emission factors, for the factor pickers.
+
+Each process keeps an index of every factor's name, category and unit, so a
+keystroke costs a dictionary walk instead of a multi-column icontains query.
+
+Words are normalized (case and accents folded). Each word maps to the factors
+containing it, as lists kept sorted by a static rank: shorter names first,
+then alphabetical. A query matches the factors where each query word is the
+prefix of one of their words, and the factors whose name starts with the
+first query word come first. A query word that prefixes no word stands for the
+words sharing at least half of its trigrams instead, so typos still match.
+
+The words matching a prefix are a range of the sorted vocabulary, and merging
+their sorted lists yields the factors in rank order, so the top K are found
+without scoring every match. Similar words are looked up in a trigram index of
+the vocabulary (tens of thousands of words, not every factor), starting from
+the query word's rarest trigrams.
+
+The index is built on first use (or warmed at startup, see warm_factor_index).
+Factor writes bump the 'factors' data version. A request that sees a new
+version first applies the factors modified since the last sync, and drops the
+deleted ones when the factor count shows deletions. Writes made by other
+processes are therefore picked up too. Factors retired by a library
+re-import aren't offered.
+"""
+
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import namedtuple
+from datetime import timedelta
+from functools import lru_cache
+
+from django.utils import timezone
+
+from .response_cache import FACTORS_KEY, get_data_versions
+
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Share of a query word's trigrams a word must contain to stand in for it (typos)
+MIN_TRIGRAM_SHARE = 0.5
+
+# Factors examined for better ranked matches once a page of matches is found
+SCAN_BUDGET = 2000
+
+# Factors modified this long before the last sync are fetched again, for
+# transactions that committed after it
+SYNC_OVERLAP = timedelta(seconds=30)
+
+# Beyond this many changed factors a sync rebuilds the index instead
+MAX_DELTA = 2000
+
+# Sorts after every word with a given prefix
+_PREFIX_END = chr(0x10FFFF)
+
+_WORD = re.compile(r'[^\W_]+')
+
+FIELDS = ('factor_id', 'name', 'category', 'unit', 'emission_factor_value', 'applicable_scopes', 'last_modified',
+          'retired_date')
+
+Entry = namedtuple('Entry', 'factor_id name category unit value scopes first_word words')
+
+
+@lru_cache(maxsize=None)
+def _category_labels():
+    from api.models import EmissionFactor
+    return dict(EmissionFactor.CATEGORY_CHOICES)
+
+
+def normalize(text):
+    """Case and accent folded text"""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def words(text):
+    return _WORD.findall(normalize(text or ''))
+
+
+def trigrams(text):
+    """Trigrams of each word, padded like pg_trgm"""
+    grams = set()
+    for word in words(text):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class _WordIndex:
+    """
+    word -> factor keys sorted by rank, with the sorted vocabulary for prefix ranges
+    and, with fuzzy=True, the trigrams of the vocabulary for typo corrections.
+    """
+
+    def __init__(self, fuzzy=False):
+        self.postings = {}
+        self.vocabulary = []
+        self.fuzzy = fuzzy
+        self.trigram_words = {}
+
+    def add(self, word, key):
+        postings = self.postings.get(word)
+        if postings is not None:
+            insort(postings, key)
+            return
+        self.postings[word] = [key]
+        insort(self.vocabulary, word)
+        if self.fuzzy:
+            for gram in trigrams(word):
+                self.trigram_words.setdefault(gram, set()).add(word)
+
+    def remove(self, word, key):
+        postings = self.postings[word]
+        position = bisect_left(postings, key)
+        if position < len(postings) and postings[position] == key:
+            del postings[position]
+        if postings:
+            return
+        del self.postings[word]
+        del self.vocabulary[bisect_left(self.vocabulary, word)]
+        if self.fuzzy:
+            for gram in trigrams(word):
+                self.trigram_words[gram].discard(word)
+
+    def bulk_load(self, pairs):
+        """Replace the contents with (word, key) pairs, sorting once"""
+        postings = {}
+        for word, key in pairs:
+            postings.setdefault(word, []).append(key)
+        for keys in postings.values():
+            keys.sort()
+        trigram_words = {}
+        if self.fuzzy:
+            for word in postings:
+                for gram in trigrams(word):
+                    trigram_words.setdefault(gram, set()).add(word)
+        self.postings, self.vocabulary, self.trigram_words = postings, sorted(postings), trigram_words
+
+    def prefix_range(self, prefix):
+        """Vocabulary words starting with prefix"""
+        start = bisect_left(self.vocabulary, prefix)
+        return self.vocabulary[start:bisect_left(self.vocabulary, prefix + _PREFIX_END, start)]
+
+    def merged(self, vocabulary_words):
+        """Keys of the words in rank order (a key can repeat)"""
+        return heapq.merge(*(self.postings[word] for word in vocabulary_words))
+
+    def similar_words(self, word):
+        """Vocabulary words sharing at least MIN_TRIGRAM_SHARE of the word's trigrams, most similar first"""
+        grams = trigrams(word)
+        if len(word) < 3 or not grams:
+            return []
+        needed = math.ceil(len(grams) * MIN_TRIGRAM_SHARE)
+        # A word sharing `needed` trigrams has one of the len - needed + 1 rarest
+        postings = sorted((self.trigram_words.get(gram, set()) for gram in grams), key=len)
+        scored = []
+        for candidate in set().union(*postings[:len(grams) - needed + 1]):
+            shared = len(grams & trigrams(candidate))
+            if shared >= needed:
+                scored.append((-shared, candidate))
+        scored.sort()
+        return [candidate for _, candidate in scored]
+
+
+class FactorIndex:
+    def __init__(self):
+        self.entries = {}      # key -> Entry
+        self.keys = {}         # factor_id -> key
+        self.first_words = _WordIndex()
+        self.words = _WordIndex(fuzzy=True)
+        self.version = None
+        self.synced_at = None
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def make_entry(row):
+        name_words = words(row.name)
+        category_words = words(_category_labels().get(row.category, row.category))
+        return Entry(
+            factor_id=row.factor_id,
+            name=row.name,
+            category=row.category,
+            unit=row.unit,
+            value=row.emission_factor_value,
+            scopes=tuple(row.applicable_scopes or ()),
+            first_word=name_words[0] if name_words else '',
+            words=frozenset(name_words + category_words + words(row.unit)),
+        )
+
+    @staticmethod
+    def rank_key(entry):
+        return (len(entry.name), normalize(entry.name), str(entry.factor_id))
+
+    # --- Maintenance ---
+
+    def build(self, rows, version, synced_at):
+        entries = {}
+        for row in rows:
+            entry = self.make_entry(row)
+            entries[self.rank_key(entry)] = entry
+
+        first_words = _WordIndex()
+        first_words.bulk_load((entry.first_word, key) for key, entry in entries.items() if entry.first_word)
+        all_words = _WordIndex(fuzzy=True)
+        all_words.bulk_load((word, key) for key, entry in entries.items() for word in entry.words)
+
+        with self.lock:
+            self.entries = entries
+            self.keys = {entry.factor_id: key for key, entry in entries.items()}
+            self.first_words, self.words = first_words, all_words
+            self.version, self.synced_at = version, synced_at
+
+    def add(self, row):
+        """Add or replace the row's factor"""
+        entry = self.make_entry(row)
+        with self.lock:
+            key = self.keys.get(entry.factor_id)
+            if key is not None and self.entries[key] == entry:
+                return
+            self.remove(entry.factor_id)
+            key = self.rank_key(entry)
+            self.entries[key] = entry
+            self.keys[entry.factor_id] = key
+            if entry.first_word:
+                self.first_words.add(entry.first_word, key)
+            for word in entry.words:
+                self.words.add(word, key)
+
+    def remove(self, factor_id):
+        with self.lock:
+            key = self.keys.pop(factor_id, None)
+            if key is None:
+                return
+            entry = self.entries.pop(key)
+            if entry.first_word:
+                self.first_words.remove(entry.first_word, key)
+            for word in entry.words:
+                self.words.remove(word, key)
+
+    # --- Queries ---
+
+    def search(self, query, limit=DEFAULT_LIMIT, category=None, scope=None):
+        """Entries matching query, best first (see module docstring)"""
+        query_words = words(query)
+        if not query_words:
+            return []
+
+        with self.lock:
+            # Vocabulary words each query word stands for: the words it prefixes,
+            # or failing that the words similar to it
+            alternatives = []
+            for query_word in query_words:
+                matching = self.words.prefix_range(query_word)
+                if not matching:
+                    matching = self.words.similar_words(query_word)
+                if not matching:
+                    return []
+                alternatives.append((query_word, set(matching)))
+
+            def accepts(entry):
+                return (
+                    (not category or entry.category == category)
+                    and (not scope or scope in entry.scopes)
+                    and all(not entry.words.isdisjoint(matching) for _, matching in alternatives)
+                )
+
+            # Names starting with the first query word come first
+            leading_words = [word for word in alternatives[0][1] if word in self.first_words.postings]
+            leading = self._collect(self.first_words.merged(leading_words), accepts, limit, budget=SCAN_BUDGET)
+            if len(leading) == limit:
+                return leading
+
+            # Then the other matches, walking the query word with the fewest factors
+            driver = min(alternatives, key=lambda item: sum(len(self.words.postings[word]) for word in item[1]))
+            leading_keys = {self.keys[entry.factor_id] for entry in leading}
+            others = self._collect(
+                (key for key in self.words.merged(driver[1]) if key not in leading_keys),
+                accepts, limit - len(leading),
+            )
+        return leading + others
+
+    def _collect(self, keys, accepts, limit, budget=None):
+        """The first limit accepted entries of keys (in rank order), looking at up to budget keys"""
+        found, seen = [], set()
+        for scanned, key in enumerate(keys):
+            if len(found) == limit or scanned == budget:
+                break
+            if key in seen:
+                continue
+            seen.add(key)
+            entry = self.entries[key]
+            if accepts(entry):
+                found.append(entry)
+        return found
+
+
+_index = FactorIndex()
+_sync_lock = threading.Lock()
+
+
+def _rows(queryset):
+    return queryset.values_list(*FIELDS, named=True).order_by().iterator(chunk_size=5000)
+
+
+def get_factor_index():
+    """The process's factor index, synced with the database's factor version"""
+    from api.models import EmissionFactor
+
+    version = get_data_versions([FACTORS_KEY])[FACTORS_KEY]
+    if _index.version == version:
+        return _index
+
+    with _sync_lock:
+        if _index.version == version:
+            return _index
+        # Rows are read after the version, so a write made meanwhile triggers another sync
+        now = timezone.now()
+        changed = None
+        if _index.version is not None:
+            changed = list(_rows(EmissionFactor.objects.filter(last_modified__gte=_index.synced_at - SYNC_OVERLAP)))
+        # Large deltas (imports) are cheaper to rebuild
+        if changed is None or len(changed) > MAX_DELTA:
+            _index.build(_rows(EmissionFactor.objects.filter(retired_date__isnull=True)), version, now)
+            return _index
+
+        for row in changed:
+            if row.retired_date is None:
+                _index.add(row)
+            else:
+                _index.remove(row.factor_id)
+        offered = EmissionFactor.objects.filter(retired_date__isnull=True)
+        if offered.count() != len(_index.entries):
+            # Factors were deleted
+            existing = set(offered.values_list('factor_id', flat=True).iterator(chunk_size=5000))
+            for factor_id in set(_index.keys) - existing:
+                _index.remove(factor_id)
+        _index.version, _index.synced_at = version, now
+    return _index
+
+
+def search_factor_names(query, limit=DEFAULT_LIMIT, category=None, scope=None):
+    """Top matches for the factor pickers, as dicts"""
+    entries = get_factor_index().search(query, min(limit, MAX_LIMIT), category=category, scope=scope)
+    return [
+        {
+            'factor_id': entry.factor_id,
+            'name': entry.name,
+            'category': entry.category,
+            'unit': entry.unit,
+            'emission_factor_value': str(entry.value),
+        }
+        for entry in entries
+    ]
+
+
+def warm_factor_index():
+    """Build the index in a background thread, so the first picker request doesn't wait for it"""
+    def warm():
+        from django.db import connection
+        try:
+            get_factor_index()
+        except Exception as e:
+            # The first request builds it instead
+            print(f"Factor autocomplete index not warmed: {e}")
+        finally:
+            connection.close()
+
+    threading.Thread(target=warm, name='factor-index-warmup', daemon=True).start()
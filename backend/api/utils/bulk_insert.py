@@ -0,0 +1,189 @@
+"""
+Fast multi-row INSERT and UPDATE for large batches.
+
+QuerySet.bulk_create builds a model instance per row and runs every value through
+the full field preparation and SQL compilation, which dominates the cost of
+inserting tens of thousands of rows. insert_rows takes plain value tuples, prepares
+each column with the cheapest adapter that is correct for its field type and sends
+multi-row INSERT statements.
+
+QuerySet.bulk_update likewise compiles a CASE WHEN expression per row and field.
+update_rows joins the table to a VALUES list instead (UPDATE ... FROM), one
+statement per batch.
+
+increment_rows adds values to counters identified by a unique constraint with
+INSERT ... ON CONFLICT DO UPDATE, creating the missing rows in the same statement.
+
+No signals are sent and no defaults are applied: pass every column that needs a
+value (primary keys, auto_now fields...) explicitly.
+"""
+
+from django.db import connection
+
+
+def _supports_update_from():
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 33)
+    return connection.vendor == 'postgresql'
+
+
+def supports_upsert():
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 24)
+    return connection.vendor == 'postgresql'
+
+
+DEFAULT_BATCH_SIZE = 2000
+
+# Field types whose Python values are passed to the driver unchanged
+PASSTHROUGH_TYPES = {
+    'AutoField', 'BigAutoField', 'SmallAutoField', 'BooleanField', 'CharField', 'TextField',
+    'IntegerField', 'BigIntegerField', 'SmallIntegerField', 'PositiveIntegerField',
+    'PositiveBigIntegerField', 'PositiveSmallIntegerField', 'FloatField', 'DecimalField',
+}
+
+
+def _column_adapter(field):
+    """Function preparing a Python value of the field for the database driver"""
+    target = field.target_field if field.is_relation else field
+    internal_type = target.get_internal_type()
+    ops = connection.ops
+
+    if internal_type in PASSTHROUGH_TYPES:
+        return None
+    if internal_type == 'UUIDField':
+        if connection.features.has_native_uuid_field:
+            return None
+        return lambda value: value.hex if value is not None else None
+    if internal_type == 'DateField':
+        return ops.adapt_datefield_value
+    if internal_type == 'DateTimeField':
+        return ops.adapt_datetimefield_value
+    return lambda value: field.get_db_prep_save(value, connection)
+
+
+def insert_rows(model, field_names, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Insert rows (iterable of tuples in field_names order) into the model's table.
+    field_names are model field names (use 'project' or 'project_id' for foreign keys).
+    Returns the number of rows inserted.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    adapters = [_column_adapter(field) for field in fields]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+
+    # Respect the backend's limit on query parameters (e.g. 999 on SQLite)
+    max_params = connection.features.max_query_params
+    if max_params:
+        batch_size = max(1, min(batch_size, max_params // len(fields)))
+
+    placeholder = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    sql_prefix = f"INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES "
+
+    count = 0
+    batch = []
+
+    def flush():
+        params = []
+        for row in batch:
+            for adapter, value in zip(adapters, row):
+                params.append(adapter(value) if adapter is not None and value is not None else value)
+        with connection.cursor() as cursor:
+            cursor.execute(sql_prefix + ', '.join([placeholder] * len(batch)), params)
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            flush()
+            count += len(batch)
+            batch = []
+    if batch:
+        flush()
+        count += len(batch)
+
+    return count
+
+
+def update_rows(model, key_field, field_names, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Update rows identified by key_field (iterable of tuples: key, then the values
+    of field_names). Returns the number of rows sent.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+
+    if not _supports_update_from():
+        objects = [model(**dict(zip((key_field, *field_names), row))) for row in rows]
+        model.objects.bulk_update(objects, field_names, batch_size=batch_size)
+        return len(rows)
+
+    fields = [model._meta.get_field(name) for name in (key_field, *field_names)]
+    adapters = [_column_adapter(field) for field in fields]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+
+    max_params = connection.features.max_query_params
+    if max_params:
+        batch_size = max(1, min(batch_size, max_params // len(fields)))
+
+    # VALUES columns are named column1, column2... by both SQLite and PostgreSQL.
+    # The casts give them the column types (PostgreSQL would otherwise read text).
+    placeholder = '(' + ', '.join(f'CAST(%s AS {field.db_type(connection)})' for field in fields) + ')'
+    assignments = ', '.join(
+        f'{quote(field.column)} = v.column{position}' for position, field in enumerate(fields[1:], start=2)
+    )
+    sql_template = f"UPDATE {table} SET {assignments} FROM (VALUES {{values}}) AS v WHERE {table}.{quote(fields[0].column)} = v.column1"
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = []
+            for row in batch:
+                for adapter, value in zip(adapters, row):
+                    params.append(adapter(value) if adapter is not None and value is not None else value)
+            cursor.execute(sql_template.format(values=', '.join([placeholder] * len(batch))), params)
+
+    return len(rows)
+
+
+def increment_rows(model, unique_fields, field_names, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Add rows (iterable of tuples: the values of unique_fields, then the amounts
+    added to field_names) to the rows matching unique_fields, inserting those
+    that don't exist yet. unique_fields must be a unique constraint of the model
+    (see supports_upsert). Returns the number of rows sent.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+
+    fields = [model._meta.get_field(name) for name in (*unique_fields, *field_names)]
+    adapters = [_column_adapter(field) for field in fields]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+
+    max_params = connection.features.max_query_params
+    if max_params:
+        batch_size = max(1, min(batch_size, max_params // len(fields)))
+
+    columns = ', '.join(quote(field.column) for field in fields)
+    conflict = ', '.join(quote(field.column) for field in fields[:len(unique_fields)])
+    increments = ', '.join(
+        f'{quote(field.column)} = {table}.{quote(field.column)} + EXCLUDED.{quote(field.column)}'
+        for field in fields[len(unique_fields):]
+    )
+    placeholder = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    sql_template = f"INSERT INTO {table} ({columns}) VALUES {{values}} ON CONFLICT ({conflict}) DO UPDATE SET {increments}"
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = []
+            for row in batch:
+                for adapter, value in zip(adapters, row):
+                    params.append(adapter(value) if adapter is not None and value is not None else value)
+            cursor.execute(sql_template.format(values=', '.join([placeholder] * len(batch))), params)
+
+    return len(rows)
@@ -0,0 +1,254 @@
+"""
+Bulk emission factor maintenance.
+
+EmissionFactor.save() runs full_clean() and its own propagation per factor.
+upsert_factors validates a whole upload column by column instead (the same rules
+as EmissionFactor.clean() and EmissionFactorSerializer), writes it with
+bulk_create(update_conflicts=True) in batches, and propagates the value changes
+of all updated factors once at the end (see factor_propagation).
+
+Rows are complete factors: a row whose factor_id exists replaces that factor,
+any other row creates one (with its factor_id when given).
+
+delete_factors deletes many factors with one queryset delete (the usual
+post_delete signals, and the revision audit kept through its SET_NULL). Factors
+still used by activities or product exchanges are reported instead of deleted,
+since deleting them would cascade to the activities.
+"""
+
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+import pandas as pd
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from api.models import EmissionActivity, EmissionFactor, EmissionFactorRevision, ProductExchange
+from .activity_ingest import IngestFormatError, _add_errors, _text, _to_decimal, _to_uuids
+
+
+REQUIRED_COLUMNS = ('name', 'category', 'emission_factor_value', 'unit', 'source', 'year')
+TEXT_COLUMNS = ('description', 'sub_category', 'scope_3_category', 'imported_category', 'imported_sub_category')
+
+# Columns written on insert and replaced on conflict (created_date is kept)
+WRITE_FIELDS = (
+    'name', 'category', 'emission_factor_value', 'unit', 'source', 'year', 'description', 'sub_category',
+    'uncertainty_type', 'uncertainty_params', 'imported_category', 'imported_sub_category',
+    'applicable_scopes', 'scope_3_category', 'last_modified',
+)
+
+CATEGORIES = {choice for choice, _ in EmissionFactor.CATEGORY_CHOICES}
+SCOPE_3_CATEGORIES = {choice for choice, _ in EmissionFactor.SCOPE_3_CATEGORY_CHOICES}
+UNCERTAINTY_TYPES = {choice for choice, _ in EmissionFactor.UNCERTAINTY_TYPE_CHOICES}
+SCOPES = {scope for scope, _ in EmissionFactor.SCOPE_CHOICES}
+
+# emission_factor_value is DecimalField(max_digits=20, decimal_places=6)
+MAX_VALUE = Decimal('1e14')
+VALUE_QUANTUM = Decimal('0.000001')
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _max_length(field_name):
+    return EmissionFactor._meta.get_field(field_name).max_length
+
+
+def _json_column(frame, column, default):
+    """Column of JSON values (lists, objects), default for missing values"""
+    if column not in frame:
+        return pd.Series([default] * len(frame), index=frame.index, dtype=object)
+    return frame[column].map(lambda value: default if value is None or (isinstance(value, float) and pd.isna(value)) else value)
+
+
+def _valid_scopes(value):
+    return isinstance(value, list) and all(isinstance(scope, int) and scope in SCOPES for scope in value)
+
+
+def upsert_factors(frame, dry_run=False, atomic=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Validate factor rows and create or replace them.
+
+    dry_run: validate only
+    atomic: write nothing if any row is invalid
+
+    Returns {'created', 'updated', 'failed', 'errors': [{'row', 'errors': {field: message}}],
+    'factor_ids', 'revisions'} where row is the 1-based data row number and revisions
+    the number of value changes propagated to dependent rows.
+    """
+    errors = defaultdict(dict)
+    n_rows = len(frame)
+    empty = {'created': 0, 'updated': 0, 'failed': 0, 'errors': [], 'factor_ids': [], 'revisions': 0}
+    if n_rows == 0:
+        return empty
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in frame]
+    if missing:
+        raise IngestFormatError(f"Missing required columns: {', '.join(missing)}")
+
+    columns = {column: _text(frame, column) for column in REQUIRED_COLUMNS + TEXT_COLUMNS + ('factor_id', 'uncertainty_type')}
+
+    # --- Text fields ---
+    for column in ('name', 'unit', 'source'):
+        _add_errors(errors, columns[column] == '', column, 'This field is required.')
+    for column in ('name', 'unit', 'source', 'sub_category', 'imported_category', 'imported_sub_category'):
+        limit = _max_length(column)
+        _add_errors(errors, columns[column].str.len() > limit, column, f'Ensure this field has no more than {limit} characters.')
+
+    # --- Choices ---
+    _add_errors(errors, ~columns['category'].isin(CATEGORIES), 'category', 'Not a valid choice.')
+    scope_3_category = columns['scope_3_category']
+    _add_errors(errors, (scope_3_category != '') & ~scope_3_category.isin(SCOPE_3_CATEGORIES), 'scope_3_category', 'Not a valid choice.')
+
+    applicable_scopes = _json_column(frame, 'applicable_scopes', [])
+    valid_scopes = applicable_scopes.map(_valid_scopes)
+    _add_errors(errors, ~valid_scopes, 'applicable_scopes', 'Must be a list of scopes 1, 2 or 3.')
+    scope_3 = applicable_scopes.map(lambda scopes: isinstance(scopes, list) and 3 in scopes)
+    _add_errors(errors, scope_3 & (scope_3_category == ''), 'scope_3_category', 'Scope 3 category is required when scope 3 is in applicable scopes')
+
+    # --- Value ---
+    values = columns['emission_factor_value'].map(_to_decimal)
+    _add_errors(errors, values.isna(), 'emission_factor_value', 'A valid number is required.')
+    _add_errors(errors, values.map(lambda v: pd.notna(v) and v <= 0), 'emission_factor_value', 'Emission factor value must be greater than 0')
+    _add_errors(
+        errors, values.map(lambda v: pd.notna(v) and (v >= MAX_VALUE or v != v.quantize(VALUE_QUANTUM, rounding='ROUND_DOWN'))),
+        'emission_factor_value', 'Ensure that there are no more than 14 digits before and 6 after the decimal point.'
+    )
+
+    # --- Year ---
+    years = pd.to_numeric(columns['year'], errors='coerce')
+    max_year = timezone.now().year + 5
+    whole_years = years.notna() & (years % 1 == 0)
+    _add_errors(errors, ~whole_years, 'year', 'A valid integer is required.')
+    _add_errors(errors, whole_years & ((years < 1990) | (years > max_year)), 'year', f'Year must be between 1990 and {max_year}')
+
+    # --- Uncertainty: parameters required by each distribution ---
+    uncertainty_types = pd.to_numeric(columns['uncertainty_type'].where(columns['uncertainty_type'] != '', '0'), errors='coerce')
+    _add_errors(errors, ~uncertainty_types.isin(UNCERTAINTY_TYPES), 'uncertainty_type', 'Not a valid choice.')
+    uncertainty_params = _json_column(frame, 'uncertainty_params', None)
+    _add_errors(
+        errors, uncertainty_params.map(lambda params: params is not None and not isinstance(params, dict)),
+        'uncertainty_params', 'Must be an object.'
+    )
+    required_params = EmissionFactor()._get_required_uncertainty_params
+    for uncertainty_type in set(uncertainty_types[uncertainty_types.isin(UNCERTAINTY_TYPES)]) - {0}:
+        of_type = uncertainty_types == uncertainty_type
+        _add_errors(
+            errors, of_type & uncertainty_params.map(lambda params: not params),
+            'uncertainty_params', 'Uncertainty parameters are required when uncertainty type is specified'
+        )
+        required = required_params(int(uncertainty_type))
+        name = dict(EmissionFactor.UNCERTAINTY_TYPE_CHOICES)[uncertainty_type]
+        _add_errors(
+            errors, of_type & uncertainty_params.map(lambda params: isinstance(params, dict) and bool(params) and any(key not in params for key in required)),
+            'uncertainty_params', f"Missing required parameters for {name}: {', '.join(required)}"
+        )
+
+    # --- IDs: given ones must be valid and unique in the upload ---
+    given_ids = columns['factor_id'] != ''
+    factor_ids = _to_uuids(columns['factor_id'])
+    _add_errors(errors, given_ids & factor_ids.isna(), 'factor_id', 'Must be a valid UUID.')
+    _add_errors(errors, given_ids & factor_ids.notna() & factor_ids.duplicated(), 'factor_id', 'Duplicate factor_id in the upload.')
+
+    report_errors = [{'row': index + 1, 'errors': errors[index]} for index in sorted(errors)]
+    valid_indexes = [index for index in range(n_rows) if index not in errors]
+
+    if dry_run or (atomic and errors) or not valid_indexes:
+        return {**empty, 'failed': len(errors), 'errors': report_errors}
+
+    def valid(series):
+        return series.iloc[valid_indexes].tolist()
+
+    ids = [factor_id if factor_id is not None else uuid.uuid4() for factor_id in valid(factor_ids)]
+    row_values = {
+        'name': valid(columns['name']),
+        'category': valid(columns['category']),
+        'emission_factor_value': valid(values),
+        'unit': valid(columns['unit']),
+        'source': valid(columns['source']),
+        'year': [int(year) for year in valid(years)],
+        'uncertainty_type': [int(uncertainty_type) for uncertainty_type in valid(uncertainty_types)],
+        'uncertainty_params': valid(uncertainty_params),
+        'applicable_scopes': valid(applicable_scopes),
+        **{column: [text or None for text in valid(columns[column])] for column in TEXT_COLUMNS},
+    }
+    factors = [
+        EmissionFactor(factor_id=factor_id, **dict(zip(row_values, row)))
+        for factor_id, row in zip(ids, zip(*row_values.values()))
+    ]
+
+    from .factor_propagation import propagate_factor_changes
+    from .response_cache import bump_data_version, FACTORS_KEY, REFERENCE_KEY
+
+    with transaction.atomic():
+        previous = dict(
+            EmissionFactor.objects.select_for_update()
+            .filter(pk__in=ids)
+            .values_list('factor_id', 'emission_factor_value')
+        )
+        EmissionFactor.objects.bulk_create(
+            factors, batch_size=batch_size,
+            update_conflicts=True, unique_fields=['factor_id'], update_fields=list(WRITE_FIELDS),
+        )
+        # Bulk writes send no signals
+        bump_data_version(REFERENCE_KEY, FACTORS_KEY)
+
+        # Dependents of all changed factors are recalculated together
+        changes = {
+            factor.factor_id: (previous[factor.factor_id], factor.emission_factor_value)
+            for factor in factors
+            if factor.factor_id in previous and previous[factor.factor_id] != factor.emission_factor_value
+        }
+        revisions = propagate_factor_changes(changes, EmissionFactorRevision.SOURCE_BULK) if changes else []
+
+    return {
+        'created': sum(1 for factor_id in ids if factor_id not in previous),
+        'updated': len(previous),
+        'failed': len(errors),
+        'errors': report_errors,
+        'factor_ids': [str(factor_id) for factor_id in ids],
+        'revisions': len(revisions),
+    }
+
+
+def delete_factors(factor_ids):
+    """
+    Delete the factors that exist and aren't in use, in one queryset delete.
+    Returns {'deleted', 'failed', 'errors': [{'factor_id', 'error'}]}.
+    """
+    errors = []
+    ids = []
+    for value in factor_ids:
+        try:
+            ids.append(uuid.UUID(str(value)))
+        except ValueError:
+            errors.append({'factor_id': str(value), 'error': 'Must be a valid UUID.'})
+
+    with transaction.atomic():
+        existing = set(EmissionFactor.objects.select_for_update().filter(pk__in=ids).values_list('pk', flat=True))
+        activity_counts = dict(
+            EmissionActivity.objects.filter(emission_factor_id__in=existing)
+            .values('emission_factor_id').annotate(n=Count('pk')).order_by().values_list('emission_factor_id', 'n')
+        )
+        exchange_counts = dict(
+            ProductExchange.objects.filter(emission_factor_id__in=existing)
+            .values('emission_factor_id').annotate(n=Count('pk')).order_by().values_list('emission_factor_id', 'n')
+        )
+
+        to_delete = []
+        for factor_id in dict.fromkeys(ids):
+            if factor_id not in existing:
+                errors.append({'factor_id': str(factor_id), 'error': 'Emission factor not found.'})
+            elif factor_id in activity_counts or factor_id in exchange_counts:
+                errors.append({'factor_id': str(factor_id), 'error': (
+                    f"In use by {activity_counts.get(factor_id, 0)} activities and "
+                    f"{exchange_counts.get(factor_id, 0)} product exchanges."
+                )})
+            else:
+                to_delete.append(factor_id)
+
+        if to_delete:
+            EmissionFactor.objects.filter(pk__in=to_delete).delete()
+
+    return {'deleted': len(to_delete), 'failed': len(errors), 'errors': errors}
@@ -0,0 +1,174 @@
+"""
+Emission factor change propagation.
+
+EmissionActivity.calculated_emissions and ProductExchange.calculated_impact are
+computed from the factor value when they are saved. When a factor value changes
+(edited, bulk updated or re-imported), its dependents are recalculated here with
+one set-based UPDATE per dependent table, covering all changed factors at once:
+
+    calculated_emissions = quantity * new value / 1000   (activities, tCO₂e)
+    calculated_impact    = quantity * new value          (exchanges, kgCO₂e)
+
+followed by one pass over everything derived from them: LCA product totals
+(and the products using them, see lca_graph), the ledger and monthly rollup of
+the affected projects, scope totals, saved scenarios and response cache versions. Each changed factor gets an
+EmissionFactorRevision audit row with the number of rows touched.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, OuterRef, Subquery, Value, When
+from django.utils import timezone
+
+from api.models import (
+    Project, EmissionFactor, EmissionActivity, ProductExchange, LCAProduct,
+    EmissionLedgerEntry, MonthlyEmissionRollup, EmissionFactorRevision,
+)
+
+
+def _factor_value():
+    """Correlated subquery for the current value of the row's emission factor"""
+    return Subquery(
+        EmissionFactor.objects.filter(pk=OuterRef('emission_factor_id')).values('emission_factor_value')[:1],
+        output_field=DecimalField(max_digits=20, decimal_places=6)
+    )
+
+
+def _counts_by_factor(queryset):
+    return dict(
+        queryset.values('emission_factor_id').annotate(n=Count('pk')).order_by().values_list('emission_factor_id', 'n')
+    )
+
+
+def update_factor_values(new_values, source=EmissionFactorRevision.SOURCE_BULK):
+    """
+    Set new values for many factors with one UPDATE and propagate the changes.
+    new_values: {factor_id: Decimal}. Factors whose value doesn't change are left alone.
+    Returns the EmissionFactorRevision rows created.
+    """
+    with transaction.atomic():
+        current = dict(
+            EmissionFactor.objects.select_for_update()
+            .filter(pk__in=list(new_values))
+            .values_list('factor_id', 'emission_factor_value')
+        )
+        changes = {
+            factor_id: (current[factor_id], Decimal(str(value)))
+            for factor_id, value in new_values.items()
+            if factor_id in current and current[factor_id] != Decimal(str(value))
+        }
+        if not changes:
+            return []
+
+        output_field = DecimalField(max_digits=20, decimal_places=6)
+        EmissionFactor.objects.filter(pk__in=list(changes)).update(
+            emission_factor_value=Case(
+                *[When(pk=factor_id, then=Value(new, output_field=output_field)) for factor_id, (_, new) in changes.items()],
+                output_field=output_field,
+            ),
+            last_modified=timezone.now(),
+        )
+
+        # Queryset updates send no signals
+        from .response_cache import bump_data_version, FACTORS_KEY, REFERENCE_KEY
+        bump_data_version(REFERENCE_KEY, FACTORS_KEY)
+
+        return propagate_factor_changes(changes, source)
+
+
+def propagate_factor_changes(changes, source=EmissionFactorRevision.SOURCE_EDIT):
+    """
+    Recalculate everything that depends on factors whose value has already been
+    changed in the database.
+    changes: {factor_id: (old_value, new_value)}
+    Returns the EmissionFactorRevision rows created.
+    """
+    from .lca_graph import recompute_products
+    from .ledger import expand_activities, insert_ledger_rows
+    from .rollups import rebuild_rollups
+    from .scenarios import apply_contributions_to_scenarios
+    from .scope_totals import mark_scope_dirty
+    from .response_cache import bump_project_versions
+
+    factor_ids = list(changes)
+    now = timezone.now()
+
+    with transaction.atomic():
+        # --- Activities: one UPDATE (multiply by the reciprocal, SQLite would use integer division) ---
+        activities = EmissionActivity.objects.filter(emission_factor_id__in=factor_ids)
+        activity_counts = _counts_by_factor(activities)
+        activities.update(
+            calculated_emissions=F('quantity') * _factor_value() * Value(Decimal('0.001'), output_field=DecimalField()),
+            last_modified=now,
+        )
+
+        # --- Exchanges: one UPDATE, then the totals of their products and the products using them ---
+        exchanges = ProductExchange.objects.filter(emission_factor_id__in=factor_ids)
+        exchange_counts = _counts_by_factor(exchanges)
+        products_by_factor = defaultdict(set)
+        for factor_id, product_id in exchanges.values_list('emission_factor_id', 'product_id').distinct():
+            products_by_factor[factor_id].add(product_id)
+        exchanges.update(calculated_impact=F('quantity') * _factor_value())
+
+        product_ids = set().union(*products_by_factor.values()) if products_by_factor else set()
+        recompute_products(product_ids)
+
+        # --- Derived activity data: ledger rows, rollup, scope totals, scenarios ---
+        rows = list(activities.values(
+            'activity_id', 'project_id', 'scope_id', 'scope__scope_number', 'scope3_category', 'activity_name',
+            'calculated_emissions', 'period_start', 'period_end', 'is_recurring', 'created_date',
+        ).order_by())
+
+        project_ids = {row['project_id'] for row in rows}
+        if rows:
+            EmissionLedgerEntry.objects.filter(
+                source_type=MonthlyEmissionRollup.SOURCE_EMISSION_FACTOR,
+                activity_id__in=activities.values('activity_id'),
+            ).delete()
+            insert_ledger_rows(expand_activities([
+                {
+                    'activity_id': row['activity_id'],
+                    'source_type': MonthlyEmissionRollup.SOURCE_EMISSION_FACTOR,
+                    'project_id': row['project_id'],
+                    'scope_number': row['scope__scope_number'],
+                    'scope3_category': row['scope3_category'],
+                    'emissions_tco2e': row['calculated_emissions'],
+                    'period_start': row['period_start'],
+                    'period_end': row['period_end'],
+                    'is_recurring': row['is_recurring'],
+                    'created_date': row['created_date'],
+                }
+                for row in rows
+            ]))
+            rebuild_rollups(Project.objects.filter(pk__in=project_ids))
+            mark_scope_dirty(*{row['scope_id'] for row in rows})
+
+            contributions = defaultdict(list)
+            for row in rows:
+                contributions[row['project_id']].append((str(row['activity_id']), {
+                    'name': row['activity_name'],
+                    'baseline': float(row['calculated_emissions'] or 0),
+                    'type': 'emission_factor',
+                    'scope': row['scope__scope_number'],
+                }))
+            apply_contributions_to_scenarios(contributions)
+
+        product_projects = set(LCAProduct.objects.filter(pk__in=product_ids).values_list('project_id', flat=True)) if product_ids else set()
+        affected_projects = project_ids | product_projects
+        if affected_projects:
+            bump_project_versions(*affected_projects)
+
+        return EmissionFactorRevision.objects.bulk_create([
+            EmissionFactorRevision(
+                factor_id=factor_id,
+                old_value=old_value,
+                new_value=new_value,
+                source=source,
+                activities_updated=activity_counts.get(factor_id, 0),
+                exchanges_updated=exchange_counts.get(factor_id, 0),
+                products_updated=len(products_by_factor.get(factor_id, ())),
+            )
+            for factor_id, (old_value, new_value) in changes.items()
+        ])
@@ -0,0 +1,68 @@
+"""
+Ranked emission factor search.
+
+On PostgreSQL, factors carry a weighted full-text search_vector, maintained by a
+trigger (migration 0012) so that every write path keeps it current:
+
+    A  name
+    B  imported_category, imported_sub_category
+    C  source
+    D  description
+
+A search matches factors whose vector matches the query (websearch syntax:
+quoted phrases, OR, -exclusions) or whose name contains a word similar to it
+(pg_trgm word similarity, for typos). Both conditions use GIN indexes, and
+results are ranked by ts_rank plus the name's trigram word similarity.
+
+Other databases (SQLite in tests) fall back to icontains across the same fields,
+ranked by where the text appears in the name.
+"""
+
+from django.db import connection
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Cast
+
+
+SEARCH_CONFIG = 'english'
+
+# Fields searched by the fallback, in decreasing weight
+SEARCH_FIELDS = ('name', 'imported_category', 'imported_sub_category', 'source', 'description')
+
+
+def search_factors(queryset, text):
+    """
+    Filter an EmissionFactor queryset to the factors matching text, annotated with
+    search_rank (higher is more relevant). Order by '-search_rank' to rank them.
+    """
+    text = text.strip()
+    if not text:
+        return queryset
+    if connection.vendor == 'postgresql':
+        return _postgres_search(queryset, text)
+    return _fallback_search(queryset, text)
+
+
+def _postgres_search(queryset, text):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(
+        Q(search_vector=query) | Q(name__trigram_word_similar=text)
+    ).annotate(
+        search_rank=SearchRank('search_vector', query) + TrigramWordSimilarity(text, 'name')
+    )
+
+
+def _fallback_search(queryset, text):
+    matches = Q()
+    for field in SEARCH_FIELDS:
+        matches |= Q(**{f'{field}__icontains': text})
+    rank = Case(
+        When(name__iexact=text, then=Value(4)),
+        When(name__istartswith=text, then=Value(3)),
+        When(name__icontains=text, then=Value(2)),
+        When(Q(imported_category__icontains=text) | Q(imported_sub_category__icontains=text), then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return queryset.filter(matches).annotate(search_rank=Cast(rank, FloatField()))
@@ -0,0 +1,237 @@
+"""
+Background factor imports.
+
+The upload is stored under FACTOR_IMPORT_DIR and a FactorImportJob is queued;
+the request returns the job for the client to poll. start_import_job runs the
+job in a daemon thread of the web process.
+
+JobImporter commits each chunk's factors together with the job's progress
+(rows parsed, inserted, skipped and errored, and chunks_committed), so the
+counters are always those of the committed factors.
+
+While a job runs, a Heartbeat thread refreshes heartbeat_at every
+HEARTBEAT_INTERVAL, including through long phases that commit nothing (reading
+an xls file, skipping to the resume chunk, propagating value changes). A job
+whose process died stops refreshing it and is reclaimed once it is STALE_AFTER
+old: the run_factor_imports command restarts such jobs after their last
+committed chunk, and the resume action restarts failed ones. Every claim sets a
+new claim_token, and every progress and final UPDATE is conditional on it, so a
+runner whose job was reclaimed stops at its next write (rolling back that chunk)
+instead of overwriting the new runner's progress. Delta jobs commit their
+retirements (and final counts) once every chunk is committed, which a resumed
+job redoes idempotently.
+"""
+
+import os
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db import connection
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from api.models import FactorImportJob
+from .sefr_importer import SEFRExcelImporter
+
+
+# A running job whose heartbeat is this old was interrupted
+STALE_AFTER = timedelta(minutes=2)
+# How often a running job refreshes its heartbeat, well within STALE_AFTER
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+
+# Row errors and factor names kept on the job, for display
+REPORTED_ERRORS = 100
+REPORTED_FACTORS = 20
+REPORTED_VALUE_CHANGES = 100
+
+
+def create_import_job(upload, file_format, delta=False):
+    """Store the upload and queue its job (a delta re-import with delta=True)"""
+    os.makedirs(settings.FACTOR_IMPORT_DIR, exist_ok=True)
+    job_id = uuid.uuid4()
+    path = os.path.join(settings.FACTOR_IMPORT_DIR, f"{job_id}.{file_format}")
+
+    if hasattr(upload, 'temporary_file_path'):
+        # Already on disk: move it rather than copy
+        file_move_safe(upload.temporary_file_path(), path)
+    else:
+        with open(path, 'wb') as stored:
+            for chunk in upload.chunks():
+                stored.write(chunk)
+
+    return FactorImportJob.objects.create(
+        job_id=job_id, file_name=upload.name[:255], file_format=file_format, file_path=path,
+        chunk_size=SEFRExcelImporter.CHUNK_SIZE, delta=delta,
+    )
+
+
+class ImportJobLost(Exception):
+    """The job was reclaimed by another runner (its claim_token changed)"""
+
+
+def claim_job(job_id, now=None):
+    """
+    Mark the job running if it is queued, failed or interrupted and return the
+    new claim token. None if it finished or another runner has it (the UPDATE
+    is conditional, so two processes resuming the same job can't both claim it).
+    """
+    now = now or timezone.now()
+    token = uuid.uuid4()
+    claimable = Q(status__in=[FactorImportJob.STATUS_QUEUED, FactorImportJob.STATUS_FAILED]) | Q(
+        status=FactorImportJob.STATUS_RUNNING, heartbeat_at__lt=now - STALE_AFTER
+    )
+    claimed = FactorImportJob.objects.filter(claimable, pk=job_id).update(
+        status=FactorImportJob.STATUS_RUNNING, heartbeat_at=now, started_at=Coalesce('started_at', Value(now)),
+        finished_at=None, failure=None, claim_token=token,
+    )
+    return token if claimed else None
+
+
+def update_claimed_job(job_id, token, **fields):
+    """Update the job if this runner still holds its claim, else raise ImportJobLost"""
+    if not FactorImportJob.objects.filter(pk=job_id, claim_token=token).update(**fields):
+        raise ImportJobLost(f"Job {job_id} was claimed by another runner")
+
+
+class Heartbeat:
+    """Refreshes a claimed job's heartbeat_at from a daemon thread until stopped"""
+
+    def __init__(self, job_id, token, interval=HEARTBEAT_INTERVAL):
+        self.job_id = job_id
+        self.token = token
+        self.interval = interval.total_seconds()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f'factor-import-heartbeat-{job_id}', daemon=True)
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                update_claimed_job(self.job_id, self.token, heartbeat_at=timezone.now())
+        except ImportJobLost:
+            # The runner finds out at its next progress write
+            pass
+        except Exception as e:
+            print(f"Factor import job {self.job_id} heartbeat stopped: {e}")
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+class JobImporter(SEFRExcelImporter):
+    """SEFRExcelImporter recording its progress on a FactorImportJob"""
+
+    def __init__(self, job):
+        super().__init__(job.file_path, file_format=job.file_format, chunk_size=job.chunk_size, delta=job.delta)
+        self.job = job
+        self.token = job.claim_token
+        # A resumed job continues its counters
+        self.total_rows = job.rows_parsed
+        self.success_count = job.rows_inserted
+        self.skipped_count = job.rows_skipped
+        self.error_count = job.rows_errored
+        self.errors = list(job.errors)
+        self.imported_factors = list(job.imported_factors)
+        self.updated_count = job.rows_updated
+        self.unchanged_count = job.rows_unchanged
+        self.retired_count = job.factors_retired
+        self.value_changes = list(job.value_changes)
+
+    def progress(self):
+        return {
+            'rows_parsed': self.total_rows,
+            'rows_inserted': self.success_count,
+            'rows_skipped': self.skipped_count,
+            'rows_errored': self.error_count,
+            'errors': self.errors[:REPORTED_ERRORS],
+            'imported_factors': self.imported_factors[:REPORTED_FACTORS],
+            'rows_updated': self.updated_count,
+            'rows_unchanged': self.unchanged_count,
+            'factors_retired': self.retired_count,
+            'value_changes': self.value_changes[:REPORTED_VALUE_CHANGES],
+        }
+
+    def chunk_committed(self, number):
+        # Raising rolls back the chunk: the runner holding the claim writes it
+        update_claimed_job(
+            self.job.pk, self.token, chunks_committed=number + 1, heartbeat_at=timezone.now(), **self.progress()
+        )
+
+    def retirements_committed(self):
+        update_claimed_job(self.job.pk, self.token, heartbeat_at=timezone.now(), **self.progress())
+
+
+def run_import_job(job_id):
+    """Run (or resume) the job in this thread; False if it couldn't be claimed"""
+    token = claim_job(job_id)
+    if token is None:
+        return False
+
+    job = FactorImportJob.objects.get(pk=job_id)
+    importer = JobImporter(job)
+    with Heartbeat(job_id, token):
+        try:
+            success = importer.import_data(start_chunk=job.chunks_committed)
+        except Exception as e:
+            importer.add_error(f"Import failed: {str(e)}")
+            success = False
+
+    try:
+        if success:
+            update_claimed_job(
+                job_id, token, status=FactorImportJob.STATUS_COMPLETED, finished_at=timezone.now(),
+                **importer.progress()
+            )
+            try:
+                os.unlink(job.file_path)
+            except OSError:
+                pass
+        else:
+            # The counters stay those of the committed chunks, for the resume
+            update_claimed_job(
+                job_id, token, status=FactorImportJob.STATUS_FAILED, finished_at=timezone.now(),
+                failure=importer.errors[-1] if importer.errors else 'Import failed',
+            )
+    except ImportJobLost as e:
+        # The job and its file are the new runner's
+        print(str(e))
+    return True
+
+
+def start_import_job(job_id):
+    """Run the job in a background thread"""
+    def run():
+        try:
+            run_import_job(job_id)
+        except Exception as e:
+            print(f"Factor import job {job_id} crashed: {e}")
+        finally:
+            connection.close()
+
+    threading.Thread(target=run, name=f'factor-import-{job_id}', daemon=True).start()
+
+
+def is_interrupted(job):
+    return (
+        job.status == FactorImportJob.STATUS_RUNNING
+        and job.heartbeat_at is not None and job.heartbeat_at < timezone.now() - STALE_AFTER
+    )
+
+
+def interrupted_jobs():
+    """Queued jobs and running jobs whose heartbeat is stale"""
+    return FactorImportJob.objects.filter(
+        Q(status=FactorImportJob.STATUS_QUEUED)
+        | Q(status=FactorImportJob.STATUS_RUNNING, heartbeat_at__lt=timezone.now() - STALE_AFTER)
+    ).order_by('created_date')
+
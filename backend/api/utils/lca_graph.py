@@ -0,0 +1,348 @@
+"""
+Recomputation of nested LCA product footprints.
+
+LCA products form a network: a ProductExchange either takes an emission factor or
+another product (input_product) as input, so a change to one product must flow up
+to every product that uses it, directly or through intermediates. The network may
+contain loops, e.g. a recycled material fed back into the product it comes from.
+
+The footprints of a set of products are the solution of one sparse linear system
+
+    x = d + A x   <=>   (I - A) x = d
+
+where x[p] is the footprint of product p, A[p, i] is the quantity of product i used
+per unit of p, and d[p] is p's direct impact: its factor exchanges (quantity *
+factor value) and its inputs from outside the set (quantity * their footprint).
+Solving it with a sparse LU factorisation handles acyclic graphs of any depth and
+cycles alike, for thousands of products at once. A cycle only has a meaningful
+solution when going once around it needs less than one unit of the product it
+starts from (spectral radius of A below 1); other cycles raise
+ProductGraphCycleError.
+
+recompute_products solves for the products affected by a change (the changed ones
+and all their ancestors) and writes the totals and exchange impacts back with
+one multi-row UPDATE per table. recompute_all_products solves the whole network.
+
+Bulk edits can wrap their writes in suspend_product_totals() to recompute once on exit.
+"""
+
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from decimal import Decimal
+
+import numpy as np
+from django.db.models import F
+from django.utils import timezone
+from scipy import sparse
+from scipy.sparse import linalg as sparse_linalg
+
+from .bulk_insert import update_rows
+
+
+_local = threading.local()
+
+# Precision of calculated_impact and total_carbon_footprint_per_unit
+QUANTUM = Decimal('0.000001')
+
+# Loop gains closer to 1 than this are treated as non-converging
+CONVERGENCE_TOLERANCE = 1e-9
+
+# Cyclic subgraphs up to this size get their spectral radius from a dense eigensolver
+# (larger ones too when the sparse eigensolver doesn't converge)
+DENSE_EIGEN_LIMIT = 500
+
+
+class ProductGraphCycleError(ValueError):
+    """The product graph contains a cycle that doesn't converge (a product needs, indirectly, at least one unit of itself)"""
+
+    def __init__(self, product_ids):
+        self.product_ids = sorted(str(product_id) for product_id in product_ids)
+        super().__init__(f"Circular product dependency between products: {', '.join(self.product_ids)}")
+
+
+def collect_affected_products(product_ids):
+    """
+    Products whose footprint depends on the given ones: the products themselves and
+    everything that uses them as an input, directly or indirectly.
+    """
+    from api.models import ProductExchange
+
+    affected = set(product_ids)
+    frontier = set(affected)
+    # One query per level of the graph
+    while frontier:
+        parents = (
+            ProductExchange.objects
+            .filter(input_product_id__in=list(frontier))
+            .values_list('product_id', flat=True)
+            .distinct()
+        )
+        frontier = set(parents) - affected
+        affected |= frontier
+    return affected
+
+
+def cyclic_products(size, rows, cols):
+    """
+    Indices of the products in or downstream of a cycle: what remains after
+    repeatedly removing products without inputs (Kahn's algorithm).
+    rows/cols are the (product, input) index pairs of the graph's edges.
+    """
+    parents = defaultdict(list)
+    pending_inputs = np.zeros(size, dtype=np.int64)
+    for product, input_index in set(zip(rows, cols)):
+        parents[input_index].append(product)
+        pending_inputs[product] += 1
+
+    ready = deque(np.flatnonzero(pending_inputs == 0).tolist())
+    while ready:
+        input_index = ready.popleft()
+        for product in parents.get(input_index, ()):
+            pending_inputs[product] -= 1
+            if pending_inputs[product] == 0:
+                ready.append(product)
+    return np.flatnonzero(pending_inputs > 0)
+
+
+def _spectral_radius(matrix):
+    if matrix.shape[0] > DENSE_EIGEN_LIMIT:
+        try:
+            eigenvalues = sparse_linalg.eigs(matrix.astype(float), k=1, which='LM', return_eigenvectors=False)
+            return float(np.abs(eigenvalues[0]))
+        except sparse_linalg.ArpackNoConvergence:
+            # Typically several eigenvalues of the same largest magnitude: the dense solver is exact
+            pass
+    return float(np.max(np.abs(np.linalg.eigvals(matrix.toarray()))))
+
+
+def solve_footprints(product_ids, exchanges, fixed_totals):
+    """
+    Solve (I - A) x = d for the products.
+    exchanges: rows with product_id, emission_factor_id, factor_value, input_product_id,
+    quantity and calculated_impact attributes, for all exchanges of the products.
+    fixed_totals: {product id: footprint} of inputs that aren't solved for.
+    Returns {product id: footprint as float}.
+    """
+    product_ids = list(product_ids)
+    index = {product_id: position for position, product_id in enumerate(product_ids)}
+    size = len(product_ids)
+
+    direct = np.zeros(size)
+    rows, cols, quantities = [], [], []
+    for exchange in exchanges:
+        position = index[exchange.product_id]
+        if exchange.emission_factor_id:
+            direct[position] += float(exchange.quantity * exchange.factor_value)
+        elif exchange.input_product_id in index:
+            rows.append(position)
+            cols.append(index[exchange.input_product_id])
+            quantities.append(float(exchange.quantity))
+        elif exchange.input_product_id:
+            direct[position] += float(exchange.quantity * fixed_totals.get(exchange.input_product_id, Decimal('0')))
+        else:
+            direct[position] += float(exchange.calculated_impact)
+
+    # Duplicate (product, input) pairs are summed
+    usage = sparse.csr_matrix((quantities, (rows, cols)), shape=(size, size))
+
+    cyclic = cyclic_products(size, rows, cols)
+    if len(cyclic):
+        loop = usage[cyclic][:, cyclic]
+        if _spectral_radius(loop) >= 1 - CONVERGENCE_TOLERANCE:
+            raise ProductGraphCycleError(product_ids[position] for position in cyclic)
+
+    system = (sparse.identity(size, format='csc') - usage.tocsc()).tocsc()
+    try:
+        footprints = sparse_linalg.splu(system).solve(direct)
+    except RuntimeError:
+        # Singular matrix
+        raise ProductGraphCycleError(product_ids[position] for position in cyclic)
+    return dict(zip(product_ids, footprints.tolist()))
+
+
+def _recompute(product_ids):
+    """Solve for the products and write back the exchanges and totals that changed"""
+    from api.models import LCAProduct, ProductExchange
+
+    product_ids = set(product_ids)
+    exchanges = list(
+        ProductExchange.objects
+        .filter(product_id__in=list(product_ids))
+        .annotate(factor_value=F('emission_factor__emission_factor_value'))
+        .values_list(
+            'exchange_id', 'product_id', 'emission_factor_id', 'input_product_id', 'quantity', 'calculated_impact',
+            'factor_value', named=True,
+        )
+    )
+    input_ids = {exchange.input_product_id for exchange in exchanges if exchange.input_product_id}
+
+    # Current totals of the products and of the inputs they use from outside the set
+    totals = dict(
+        LCAProduct.objects.filter(pk__in=list(product_ids | input_ids))
+        .values_list('lca_id', 'total_carbon_footprint_per_unit')
+    )
+    # Products deleted meanwhile
+    product_ids &= set(totals)
+    exchanges = [exchange for exchange in exchanges if exchange.product_id in product_ids]
+    if not product_ids:
+        return 0
+
+    footprints = {
+        product_id: Decimal(repr(value)).quantize(QUANTUM)
+        for product_id, value in solve_footprints(product_ids, exchanges, totals).items()
+    }
+
+    changed_impacts = []
+    for exchange in exchanges:
+        if exchange.emission_factor_id:
+            impact = exchange.quantity * exchange.factor_value
+        elif exchange.input_product_id:
+            impact = exchange.quantity * footprints.get(exchange.input_product_id, totals.get(exchange.input_product_id, Decimal('0')))
+        else:
+            continue
+        impact = impact.quantize(QUANTUM)
+        if impact != exchange.calculated_impact:
+            changed_impacts.append((exchange.exchange_id, impact))
+
+    changed_products = {
+        product_id: total for product_id, total in footprints.items() if total != totals[product_id]
+    }
+
+    if changed_impacts:
+        update_rows(ProductExchange, 'exchange_id', ['calculated_impact'], changed_impacts)
+    if changed_products:
+        now = timezone.now()
+        update_rows(
+            LCAProduct, 'lca_id', ['total_carbon_footprint_per_unit', 'last_modified'],
+            [(product_id, total, now) for product_id, total in changed_products.items()],
+        )
+        # Raw updates send no signals
+        from .response_cache import bump_data_version, REFERENCE_KEY
+        bump_data_version(REFERENCE_KEY)
+
+    return len(changed_products)
+
+
+def recompute_products(product_ids):
+    """
+    Recompute the exchanges and totals of the products and of every product using
+    them. Returns the number of products whose total changed.
+    """
+    product_ids = {product_id for product_id in product_ids if product_id}
+    if not product_ids:
+        return 0
+
+    suspended = getattr(_local, 'suspended', None)
+    if suspended is not None:
+        suspended.update(product_ids)
+        return 0
+
+    return _recompute(collect_affected_products(product_ids))
+
+
+def recompute_all_products():
+    """Recompute every product of the network with one solve"""
+    from api.models import LCAProduct
+    return _recompute(LCAProduct.objects.values_list('lca_id', flat=True))
+
+
+@contextmanager
+def suspend_product_totals():
+    """
+    Collect the products to recompute instead of recomputing them on every exchange
+    write, for bulk edits. They are recomputed once on exit.
+    """
+    outer = getattr(_local, 'suspended', None)
+    if outer is not None:
+        # Nested: the outermost block recomputes
+        yield
+        return
+
+    _local.suspended = collected = set()
+    try:
+        yield
+    except BaseException:
+        _local.suspended = None
+        raise
+    _local.suspended = None
+    recompute_products(collected)
+
+
+def sync_product_exchanges(product, exchanges_data):
+    """
+    Make the product's exchanges match exchanges_data (the editor's list of
+    {exchange_id?, emission_factor_id | input_product_id, name, quantity, unit}).
+    Exchanges are matched by exchange_id: unmatched incoming ones are created,
+    changed ones updated and missing ones deleted; the footprints are recomputed once.
+    Call inside a transaction. Returns {'created': n, 'updated': n, 'deleted': n}.
+    """
+    from api.models import EmissionFactor, LCAProduct, ProductExchange
+    from .response_cache import bump_data_version, REFERENCE_KEY
+
+    factors = EmissionFactor.objects.in_bulk(
+        {data['emission_factor_id'] for data in exchanges_data if data.get('emission_factor_id')}
+    )
+    input_products = LCAProduct.objects.in_bulk(
+        {data['input_product_id'] for data in exchanges_data if data.get('input_product_id') and not data.get('emission_factor_id')}
+    )
+    existing = {str(exchange.pk): exchange for exchange in product.exchanges.all()}
+
+    to_create, to_update, kept = [], [], set()
+    for data in exchanges_data:
+        emission_factor = input_product = None
+        if data.get('emission_factor_id'):
+            emission_factor = factors.get(_pk_value(EmissionFactor, data['emission_factor_id']))
+            if emission_factor is None:
+                raise ValueError(f"Emission factor {data['emission_factor_id']} not found")
+        elif data.get('input_product_id'):
+            input_product = input_products.get(_pk_value(LCAProduct, data['input_product_id']))
+            if input_product is None:
+                raise ValueError(f"Product {data['input_product_id']} not found")
+
+        try:
+            quantity = Decimal(str(data.get('quantity', 0)))
+        except ArithmeticError:
+            raise ValueError(f"Invalid quantity: {data.get('quantity')!r}")
+
+        # Same name/unit rules as ProductExchange.save()
+        source = emission_factor or input_product
+        values = {
+            'emission_factor_id': emission_factor.pk if emission_factor else None,
+            'input_product_id': input_product.pk if input_product else None,
+            'quantity': quantity,
+            'name': source.name if source else data.get('name', 'Unknown'),
+            'unit': (emission_factor.unit if emission_factor else input_product.functional_unit) if source else data.get('unit', ''),
+        }
+
+        exchange = existing.get(str(data.get('exchange_id') or ''))
+        if exchange is None or exchange.pk in kept:
+            to_create.append(ProductExchange(product=product, **values))
+            continue
+        kept.add(exchange.pk)
+        if any(getattr(exchange, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(exchange, field, value)
+            to_update.append(exchange)
+
+    to_delete = [exchange.pk for exchange in existing.values() if exchange.pk not in kept]
+
+    with suspend_product_totals():
+        if to_delete:
+            ProductExchange.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            ProductExchange.objects.bulk_update(to_update, ['emission_factor', 'input_product', 'quantity', 'name', 'unit'])
+        if to_create:
+            ProductExchange.objects.bulk_create(to_create)
+        recompute_products([product.pk])
+
+    if to_create or to_update:
+        # Bulk writes send no signals
+        bump_data_version(REFERENCE_KEY)
+
+    return {'created': len(to_create), 'updated': len(to_update), 'deleted': len(to_delete)}
+
+
+def _pk_value(model, value):
+    """Incoming primary key in the type in_bulk keys use"""
+    return model._meta.pk.to_python(value)
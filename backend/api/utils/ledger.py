@@ -0,0 +1,383 @@
+"""
+Monthly emission ledger.
+
+Expands every activity into one row per month it covers:
+- activities with a period_start/period_end are prorated by day over that period
+- activities without a period_end fall entirely into their start month
+  (period_start, or created_date when missing)
+- recurring activities are additionally repeated monthly after their period, up to
+  a projection horizon, as rows flagged is_projection
+
+The expansion works on whole batches of activities with numpy date arithmetic, so
+rebuilding the ledger for thousands of activities doesn't loop over months in Python.
+Actual (non-projection) rows of an activity always sum to its calculated emissions.
+
+Projections run up to a horizon counted from the month they were expanded in, so
+refresh_projections() (manage.py refresh_emission_projections, run daily) moves
+them forward as time passes. Weekly series can't be read from the monthly ledger:
+weekly_series() prorates the activities by day with the same rules instead.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+
+# Amounts are allocated in integer micro-tonnes so the per-activity total is exact
+MICRO = 10 ** 6
+
+DEFAULT_HORIZON_MONTHS = 12
+
+LEDGER_FIELDS = ('activity_id', 'source_type', 'project_id', 'scope_number', 'scope3_category')
+
+
+def default_horizon():
+    """Last month that recurring activities are projected to"""
+    months = getattr(settings, 'EMISSION_LEDGER_HORIZON_MONTHS', DEFAULT_HORIZON_MONTHS)
+    return np.datetime64(timezone.localdate(), 'M') + months
+
+
+def _to_day(value):
+    if value is None:
+        return None
+    if hasattr(value, 'tzinfo'):
+        # created_date is a datetime, bucket it by local date like TruncDate does
+        value = timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _segments(counts):
+    """Row -> owning record index and position within the record, for repeated records"""
+    owners = np.repeat(np.arange(counts.size), counts)
+    first = np.cumsum(counts) - counts
+    positions = np.arange(owners.size) - np.repeat(first, counts)
+    return owners, positions, first
+
+
+def expand_activities(records, horizon=None):
+    """
+    Expand activity records into monthly ledger rows.
+
+    records: dicts with activity_id, source_type, project_id, scope_number,
+        scope3_category, emissions_tco2e, period_start, period_end, is_recurring,
+        created_date
+    horizon: last projected month (numpy datetime64[M] or date), defaults to
+        EMISSION_LEDGER_HORIZON_MONTHS after the current month
+
+    Returns a list of row dicts with the record's identifying fields plus
+    month (date), emissions_tco2e (Decimal) and is_projection.
+    """
+    if not records:
+        return []
+
+    horizon = np.datetime64(horizon or default_horizon(), 'M')
+
+    start = np.array(
+        [_to_day(r['period_start']) or _to_day(r['created_date']) or timezone.localdate() for r in records],
+        dtype='datetime64[D]'
+    )
+    end = np.array(
+        [_to_day(r['period_end']) if r['period_end'] else np.datetime64('NaT') for r in records],
+        dtype='datetime64[D]'
+    )
+    micro = np.array(
+        [int(Decimal(r['emissions_tco2e'] or 0) * MICRO) for r in records],
+        dtype=np.int64
+    )
+    recurring = np.array([bool(r['is_recurring']) for r in records])
+
+    start_month = start.astype('datetime64[M]')
+
+    # Without a usable period_end the whole amount falls into the start month
+    no_end = np.isnat(end) | (end < start)
+    end = np.where(no_end, (start_month + 1).astype('datetime64[D]') - 1, end)
+    end_month = end.astype('datetime64[M]')
+
+    n_months = (end_month - start_month).astype(np.int64) + 1
+    period_days = (end - start).astype(np.int64) + 1
+
+    # --- Actual rows: prorate by the number of days of the period in each month ---
+    owners, positions, first = _segments(n_months)
+    months = start_month[owners] + positions
+    bucket_start = np.maximum(months.astype('datetime64[D]'), start[owners])
+    bucket_end = np.minimum((months + 1).astype('datetime64[D]') - 1, end[owners])
+    days = (bucket_end - bucket_start).astype(np.int64) + 1
+
+    allocated = np.floor(micro[owners] * (days / period_days[owners])).astype(np.int64)
+    # Put the rounding remainder on each activity's last month so its total is exact
+    allocated[first + n_months - 1] += micro - np.add.reduceat(allocated, first)
+
+    # --- Projected rows: recurring activities repeat their monthly rate up to the horizon ---
+    projected_counts = np.where(recurring, np.maximum((horizon - end_month).astype(np.int64), 0), 0)
+    proj_owners, proj_positions, _ = _segments(projected_counts)
+    proj_months = end_month[proj_owners] + 1 + proj_positions
+    proj_amounts = (micro // n_months)[proj_owners]
+
+    rows = []
+    for owner_array, month_array, amount_array, is_projection in (
+        (owners, months, allocated, False),
+        (proj_owners, proj_months, proj_amounts, True),
+    ):
+        for owner, month, amount in zip(owner_array.tolist(), month_array.astype('datetime64[D]').tolist(), amount_array.tolist()):
+            if amount == 0:
+                continue
+            record = records[owner]
+            row = {field: record[field] for field in LEDGER_FIELDS}
+            row['scope3_category'] = row['scope3_category'] or ''
+            row['month'] = month
+            row['emissions_tco2e'] = Decimal(amount).scaleb(-6)
+            row['is_projection'] = is_projection
+            rows.append(row)
+
+    return rows
+
+
+def _week_numbers(days):
+    """Week of each day (datetime64[D]), weeks starting on Monday (1970-01-01 is a Thursday)"""
+    return (days.astype(np.int64) + 3) // 7
+
+
+def weekly_series(records, start_date, end_date):
+    """
+    Weekly emissions (tCO₂e) of activity records between start_date and end_date,
+    prorated by day over each activity's period like the ledger's actual rows
+    (activities without a usable period_end fall on their start day, within their
+    start month). Returns {monday: Decimal}.
+    """
+    if not records:
+        return {}
+
+    start = np.array(
+        [_to_day(r['period_start']) or _to_day(r['created_date']) or timezone.localdate() for r in records],
+        dtype='datetime64[D]'
+    )
+    end = np.array(
+        [_to_day(r['period_end']) if r['period_end'] else np.datetime64('NaT') for r in records],
+        dtype='datetime64[D]'
+    )
+    micro = np.array([int(Decimal(r['emissions_tco2e'] or 0) * MICRO) for r in records], dtype=np.int64)
+
+    end = np.where(np.isnat(end) | (end < start), start, end)
+    period_days = (end - start).astype(np.int64) + 1
+
+    # Only the part of each period inside the range
+    first_day = np.maximum(start, np.datetime64(start_date, 'D'))
+    last_day = np.minimum(end, np.datetime64(end_date, 'D'))
+    inside = first_day <= last_day
+    first_day, last_day, micro, period_days = first_day[inside], last_day[inside], micro[inside], period_days[inside]
+
+    first_week = _week_numbers(first_day)
+    owners, positions, _ = _segments(_week_numbers(last_day) - first_week + 1)
+    weeks = first_week[owners] + positions
+    monday = weeks * 7 - 3
+    bucket_start = np.maximum(monday, first_day.astype(np.int64)[owners])
+    bucket_end = np.minimum(monday + 6, last_day.astype(np.int64)[owners])
+    days = bucket_end - bucket_start + 1
+
+    amounts = np.floor(micro[owners] * (days / period_days[owners])).astype(np.int64)
+    totals = defaultdict(int)
+    for week, amount in zip(weeks.tolist(), amounts.tolist()):
+        totals[week] += amount
+
+    epoch = np.datetime64('1970-01-01', 'D')
+    return {(epoch + (week * 7 - 3)).item(): Decimal(amount).scaleb(-6) for week, amount in totals.items()}
+
+
+def activity_source_type(activity):
+    """Ledger source type of an activity instance"""
+    from api.models import LCAActivity, MonthlyEmissionRollup
+
+    if isinstance(activity, LCAActivity):
+        return MonthlyEmissionRollup.SOURCE_LCA
+    return MonthlyEmissionRollup.SOURCE_EMISSION_FACTOR
+
+
+def activity_record(activity):
+    """Ledger record for a single activity instance"""
+    from api.models import MonthlyEmissionRollup
+
+    source_type = activity_source_type(activity)
+    emissions = Decimal(activity.calculated_emissions or 0)
+    if source_type == MonthlyEmissionRollup.SOURCE_LCA:
+        # LCA results are stored in kgCO₂e
+        emissions = emissions / Decimal('1000')
+
+    return {
+        'activity_id': activity.activity_id,
+        'source_type': source_type,
+        'project_id': activity.project_id,
+        'scope_number': activity.scope.scope_number,
+        'scope3_category': activity.scope3_category,
+        'emissions_tco2e': emissions,
+        'period_start': activity.period_start,
+        'period_end': activity.period_end,
+        'is_recurring': activity.is_recurring,
+        'created_date': activity.created_date,
+    }
+
+
+def queryset_records(queryset, source_type):
+    """Ledger records for an activity queryset, in one query"""
+    from api.models import MonthlyEmissionRollup
+
+    to_tco2e = Decimal('0.001') if source_type == MonthlyEmissionRollup.SOURCE_LCA else Decimal('1')
+    records = []
+    for row in queryset.values(
+        'activity_id', 'project_id', 'scope__scope_number', 'scope3_category', 'calculated_emissions',
+        'period_start', 'period_end', 'is_recurring', 'created_date'
+    ).order_by():
+        records.append({
+            'activity_id': row['activity_id'],
+            'source_type': source_type,
+            'project_id': row['project_id'],
+            'scope_number': row['scope__scope_number'],
+            'scope3_category': row['scope3_category'],
+            'emissions_tco2e': Decimal(row['calculated_emissions'] or 0) * to_tco2e,
+            'period_start': row['period_start'],
+            'period_end': row['period_end'],
+            'is_recurring': row['is_recurring'],
+            'created_date': row['created_date'],
+        })
+    return records
+
+
+def rollup_deltas(old_rows, new_rows):
+    """Per-bucket rollup deltas for replacing old ledger rows by new ones (actual rows only)"""
+    deltas = defaultdict(Decimal)
+    for rows, sign in ((old_rows, -1), (new_rows, 1)):
+        for row in rows:
+            if row['is_projection']:
+                continue
+            key = (row['project_id'], row['scope_number'], row['scope3_category'] or '', row['month'], row['source_type'])
+            deltas[key] += sign * row['emissions_tco2e']
+    return deltas
+
+
+def sync_activity_ledger(activity, deleted=False):
+    """
+    Replace an activity's ledger rows and move the difference into the monthly rollup.
+    """
+    from api.models import EmissionLedgerEntry
+    from .rollups import apply_rollup_deltas
+
+    source_type = activity_source_type(activity)
+    new_rows = [] if deleted else expand_activities([activity_record(activity)])
+
+    with transaction.atomic():
+        existing = EmissionLedgerEntry.objects.filter(activity_id=activity.activity_id, source_type=source_type)
+        old_rows = list(existing.values(*LEDGER_FIELDS, 'month', 'emissions_tco2e', 'is_projection'))
+        existing.delete()
+        EmissionLedgerEntry.objects.bulk_create([EmissionLedgerEntry(**row) for row in new_rows])
+        apply_rollup_deltas(rollup_deltas(old_rows, new_rows))
+
+
+def add_to_ledger(records):
+    """
+    Expand the records of newly created activities (e.g. bulk inserted, which sends
+    no signals) into the ledger and add them to the monthly rollup.
+    """
+    from .rollups import apply_rollup_deltas
+
+    rows = expand_activities(records)
+
+    with transaction.atomic():
+        insert_ledger_rows(rows)
+        apply_rollup_deltas(rollup_deltas([], rows))
+
+    return len(rows)
+
+
+def insert_ledger_rows(rows, batch_size=2000):
+    """Insert ledger row dicts with a fast multi-row INSERT"""
+    from api.models import EmissionLedgerEntry
+    from .bulk_insert import insert_rows
+
+    fields = LEDGER_FIELDS + ('month', 'emissions_tco2e', 'is_projection')
+    return insert_rows(
+        EmissionLedgerEntry, fields, ([row[field] for field in fields] for row in rows), batch_size=batch_size
+    )
+
+
+def rebuild_ledger(projects_queryset=None, horizon=None, batch_size=2000):
+    """
+    Re-expand all activities (optionally limited to some projects) into the ledger.
+    Returns the number of ledger rows written.
+    """
+    from api.models import EmissionActivity, LCAActivity, EmissionLedgerEntry, MonthlyEmissionRollup
+
+    records = []
+    for model, source_type in (
+        (EmissionActivity, MonthlyEmissionRollup.SOURCE_EMISSION_FACTOR),
+        (LCAActivity, MonthlyEmissionRollup.SOURCE_LCA),
+    ):
+        queryset = model.objects.all()
+        if projects_queryset is not None:
+            queryset = queryset.filter(project__in=projects_queryset)
+        records.extend(queryset_records(queryset, source_type))
+
+    rows = expand_activities(records, horizon)
+
+    with transaction.atomic():
+        existing = EmissionLedgerEntry.objects.all()
+        if projects_queryset is not None:
+            existing = existing.filter(project__in=projects_queryset)
+        existing.delete()
+        insert_ledger_rows(rows, batch_size=batch_size)
+
+    return len(rows)
+
+
+def refresh_projections(horizon=None, batch_size=2000):
+    """
+    Re-expand the projections of recurring activities up to the horizon (default:
+    EMISSION_LEDGER_HORIZON_MONTHS after the current month). Actual rows and the
+    rollup don't depend on the date and are left alone.
+    Returns the number of projection rows written.
+    """
+    from api.models import EmissionActivity, LCAActivity, EmissionLedgerEntry, MonthlyEmissionRollup
+
+    records = []
+    for model, source_type in (
+        (EmissionActivity, MonthlyEmissionRollup.SOURCE_EMISSION_FACTOR),
+        (LCAActivity, MonthlyEmissionRollup.SOURCE_LCA),
+    ):
+        records.extend(queryset_records(model.objects.filter(is_recurring=True), source_type))
+
+    rows = [row for row in expand_activities(records, horizon) if row['is_projection']]
+
+    with transaction.atomic():
+        EmissionLedgerEntry.objects.filter(is_projection=True).delete()
+        insert_ledger_rows(rows, batch_size=batch_size)
+
+    return len(rows)
+
+
+def ledger_series(projects_queryset=None, start_date=None, end_date=None, include_projections=False, group_by=None):
+    """
+    Monthly emissions (tCO₂e) from the ledger in one query.
+    group_by: optional extra ledger field (e.g. 'scope_number', 'source_type').
+    Returns {month: Decimal} or {(month, group_value): Decimal}.
+    """
+    from api.models import EmissionLedgerEntry
+    from django.db.models import Sum
+
+    queryset = EmissionLedgerEntry.objects.all()
+    if projects_queryset is not None:
+        queryset = queryset.filter(project__in=projects_queryset)
+    if not include_projections:
+        queryset = queryset.filter(is_projection=False)
+    if start_date is not None:
+        queryset = queryset.filter(month__gte=start_date.replace(day=1))
+    if end_date is not None:
+        queryset = queryset.filter(month__lte=end_date)
+
+    fields = ['month'] + ([group_by] if group_by else [])
+    rows = queryset.values(*fields).annotate(total=Sum('emissions_tco2e')).order_by()
+
+    if group_by:
+        return {(row['month'], row[group_by]): row['total'] or Decimal('0') for row in rows}
+    return {row['month']: row['total'] or Decimal('0') for row in rows}
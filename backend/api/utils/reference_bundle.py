@@ -0,0 +1,124 @@
+"""
+Reference-data bundle: the data the frontend loads once at startup (settings,
+factor categories, Brightway impact methods and databases) in one response.
+
+Listing Brightway methods and databases opens the Brightway project and counts
+every database's activities, so the bundle is built once and cached under the
+'brightway' data version, which the BW2 admin actions bump when they change
+databases. The bundle is identified by a hash of its content: rebuilding it
+after an unrelated change (or after the cache expired) keeps the same hash, so
+clients holding it still get a 304.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .response_cache import BRIGHTWAY_KEY, get_data_versions
+
+
+# Impact methods offered in the LCA method pickers
+NOTABLE_METHODS = 4
+
+
+def app_settings():
+    from api.models import EmissionFactor
+    return {
+        'PAGE_SIZE': settings.REST_FRAMEWORK['PAGE_SIZE'],
+        'AVAILABLE_SCOPES': [1, 2, 3],
+        'TOTAL_CATEGORIES': len(EmissionFactor.CATEGORY_CHOICES),
+    }
+
+
+def factor_categories():
+    from api.models import EmissionFactor
+    return [
+        {'category': category_key, 'category_label': category_label}
+        for category_key, category_label in EmissionFactor.CATEGORY_CHOICES
+    ]
+
+
+def _score_method(method_tuple):
+    name = ' '.join(method_tuple).lower()
+    score = 0
+
+    # Must be climate change / GWP
+    if not ('climate change' in name and ('gwp' in name or 'global warming potential' in name)):
+        return -1
+
+    # Prefer IPCC, newest first
+    if 'ipcc' in name:
+        score += 100
+        if '2021' in name:
+            score += 50
+        elif '2013' in name:
+            score += 40
+
+    # Prefer standard timeframes
+    if '100a' in name or '100 years' in name:
+        score += 10
+    elif '20a' in name or '20 years' in name:
+        score += 5
+
+    return score
+
+
+def notable_impact_methods():
+    """The best scored climate change methods (IPCC GWP100 first), or any methods if none qualifies"""
+    import bw2data as bd
+    from .bw2_setup import BW2LCA
+    bd.projects.set_current(BW2LCA.PROJECT_NAME)
+
+    scored_methods = [(score, method) for method in bd.methods if (score := _score_method(method)) > 0]
+    scored_methods.sort(key=lambda item: item[0], reverse=True)
+    methods = [method for _, method in scored_methods[:NOTABLE_METHODS]] or list(bd.methods)[:NOTABLE_METHODS]
+    return [{'method': list(method), 'name': ' - '.join(method)} for method in methods]
+
+
+def brightway_databases():
+    from .bw2_setup import BW2LCA
+    return BW2LCA().list_databases()
+
+
+def content_hash(data):
+    serialized = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()[:32]
+
+
+def build_reference_bundle():
+    """
+    (bundle, complete). A Brightway section that fails to load is empty and its
+    error is reported under 'errors', and the bundle is not complete.
+    """
+    bundle = {'settings': app_settings(), 'categories': factor_categories()}
+    errors = {}
+    for section, load in (('impact_methods', notable_impact_methods), ('databases', brightway_databases)):
+        try:
+            bundle[section] = load()
+        except Exception as e:
+            bundle[section] = []
+            errors[section] = str(e)
+    if errors:
+        bundle['errors'] = errors
+    return bundle, not errors
+
+
+def get_reference_bundle():
+    """(bundle, content hash), cached until Brightway data or the static lists change"""
+    # The static sections are part of the key, so a deploy changing them isn't served a stale bundle
+    static_hash = content_hash([app_settings(), factor_categories()])
+    version = get_data_versions([BRIGHTWAY_KEY])[BRIGHTWAY_KEY]
+    cache_key = f"reference-bundle:{version}:{static_hash}"
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    bundle, complete = build_reference_bundle()
+    result = (bundle, content_hash(bundle))
+    if complete:
+        # Incomplete bundles are rebuilt on the next request, once Brightway is reachable again
+        cache.set(cache_key, result, settings.RESPONSE_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,184 @@
+"""
+Versioned response cache.
+
+Every write to project data bumps that project's DataVersion counter once its
+transaction commits, after the scope totals it changed are recomputed (so a reader
+can't cache the new version with the old totals). 'projects', the version of
+responses covering every project, is the sum of the project counters rather than
+a row of its own, so concurrent writers to different projects don't all update
+one row. Writes to emission factors and LCA products bump 'reference',
+and writes to emission factors also 'factors' (see utils.autocomplete). The BW2
+admin actions that change Brightway databases bump 'brightway' (see
+utils.reference_bundle).
+Cached views key their response on (endpoint, query parameters, versions), so a
+write invalidates exactly the responses that could have changed, without any
+explicit cache deletes.
+
+The ETag is derived from the same key, so a request whose If-None-Match still
+matches is answered with a 304 after a single version lookup, before the cache
+or the data tables are touched.
+"""
+
+import hashlib
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F, Max, Q, Sum
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# Derived from the project counters, see get_data_versions
+PROJECTS_KEY = 'projects'
+PROJECT_KEY_PREFIX = 'project:'
+REFERENCE_KEY = 'reference'
+FACTORS_KEY = 'factors'
+BRIGHTWAY_KEY = 'brightway'
+
+
+_local = threading.local()
+
+
+def project_key(project_id):
+    return f"{PROJECT_KEY_PREFIX}{project_id}"
+
+
+def bump_data_version(*keys):
+    """Increment the version counters for keys, creating missing ones"""
+    from api.models import DataVersion
+
+    with transaction.atomic():
+        updated = DataVersion.objects.filter(key__in=keys).update(
+            version=F('version') + 1, last_modified=timezone.now()
+        )
+        if updated == len(keys):
+            return
+        existing = set(DataVersion.objects.filter(key__in=keys).values_list('key', flat=True))
+        for key in keys:
+            if key in existing:
+                continue
+            try:
+                with transaction.atomic():
+                    DataVersion.objects.create(key=key, version=1)
+            except IntegrityError:
+                # Created concurrently, fall back to the increment
+                DataVersion.objects.filter(key=key).update(version=F('version') + 1)
+
+
+def _pending_project_keys(using=None):
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        _local.pending = pending = {}
+    return pending.setdefault(using or DEFAULT_DB_ALIAS, set())
+
+
+def flush_project_versions(using=None):
+    """Bump the versions of the projects written in this thread's transaction (run on commit)"""
+    from .scope_totals import flush_scope_totals
+
+    pending = _pending_project_keys(using)
+    if not pending:
+        return
+    keys = sorted(pending)
+    pending.clear()
+    # Totals first: a response built after the bump must see them
+    flush_scope_totals(using)
+    bump_data_version(*keys)
+
+
+def bump_project_versions(*project_ids, using=None):
+    """
+    Bump the projects' versions when the transaction commits (right away in
+    autocommit mode). Like scope totals, every call registers a flush and the first
+    one to run bumps all the pending projects.
+    """
+    keys = {project_key(project_id) for project_id in project_ids if project_id}
+    if not keys:
+        return
+    _pending_project_keys(using).update(keys)
+    transaction.on_commit(lambda: flush_project_versions(using), using=using)
+
+
+def get_data_versions(keys):
+    """
+    {key: version} in one query (0 for keys never written). PROJECTS_KEY is the sum
+    of the project counters, which grows with every bump (counters are never
+    deleted).
+    """
+    from api.models import DataVersion
+
+    if PROJECTS_KEY not in keys:
+        versions = dict(DataVersion.objects.filter(key__in=keys).values_list('key', 'version'))
+        return {key: versions.get(key, 0) for key in keys}
+
+    # One aggregate row: each key's version, and the sum of the project counters
+    projects = Q(key__startswith=PROJECT_KEY_PREFIX)
+    aggregates = {
+        f'version_{index}': Sum('version', filter=projects) if key == PROJECTS_KEY else Max('version', filter=Q(key=key))
+        for index, key in enumerate(keys)
+    }
+    versions = DataVersion.objects.filter(Q(key__in=keys) | projects).aggregate(**aggregates)
+    return {key: versions[f'version_{index}'] or 0 for index, key in enumerate(keys)}
+
+
+def etag_matches(request, etag):
+    """Whether the request's If-None-Match matches etag"""
+    # If-None-Match uses the weak comparison, so W/"..." matches too
+    client_etags = [tag.removeprefix('W/') for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))]
+    return etag in client_etags or '*' in client_etags
+
+
+def response_cache_key(endpoint, params, versions):
+    """Cache key and strong ETag for an endpoint's response"""
+    raw = '|'.join([
+        endpoint,
+        '&'.join(f"{name}={value}" for name, value in sorted(params.items())),
+        ','.join(f"{key}={version}" for key, version in sorted(versions.items())),
+    ])
+    digest = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+    return f"response:{endpoint}:{digest}", quote_etag(digest)
+
+
+def versioned_response_cache(endpoint, version_keys, per_day=False):
+    """
+    Cache a DRF view's successful responses by (endpoint, query params, data versions).
+
+    version_keys: callable(request, **kwargs) returning the DataVersion keys the response
+        depends on, or None to bypass the cache (e.g. invalid parameters)
+    per_day: also key on the current date, for responses relative to today
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            keys = version_keys(request, **kwargs)
+            if keys is None:
+                return view_func(request, *args, **kwargs)
+
+            params = {name: ','.join(request.GET.getlist(name)) for name in request.GET}
+            params.update({f"url:{name}": str(value) for name, value in kwargs.items()})
+            if per_day:
+                params['today'] = timezone.localdate().isoformat()
+
+            cache_key, etag = response_cache_key(endpoint, params, get_data_versions(keys))
+            headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+            if etag_matches(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+            data = cache.get(cache_key)
+            if data is not None:
+                return Response(data, headers=headers)
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(cache_key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+                for name, value in headers.items():
+                    response[name] = value
+            return response
+        return wrapper
+    return decorator
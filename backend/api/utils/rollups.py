@@ -0,0 +1,137 @@
+"""
+Monthly emission rollups.
+
+MonthlyEmissionRollup holds emissions (tCO₂e) pre-aggregated per project, scope,
+Scope 3 category, month and source type. It is the sum of the actual rows of the
+emission ledger (see ledger.py): activity saves and deletes replace the activity's
+ledger rows and apply the difference to the rollup as deltas; rebuild_rollups()
+recomputes everything from the ledger.
+"""
+
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum, DateField
+from django.db.models.functions import Trunc
+
+from api.models import EmissionLedgerEntry, MonthlyEmissionRollup
+from .bulk_insert import increment_rows, supports_upsert
+
+
+ROLLUP_KEY_FIELDS = ('project_id', 'scope_number', 'scope3_category', 'month', 'source_type')
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Add each delta to its rollup bucket, creating missing buckets, with one
+    INSERT ... ON CONFLICT statement (per row on databases without upserts).
+    deltas: {(project_id, scope_number, scope3_category, month, source_type): Decimal}
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    if supports_upsert():
+        increment_rows(
+            MonthlyEmissionRollup, ROLLUP_KEY_FIELDS, ('emissions_tco2e',),
+            (key + (delta,) for key, delta in deltas.items()),
+        )
+        return
+
+    with transaction.atomic():
+        for (project_id, scope_number, scope3_category, month, source_type), delta in deltas.items():
+            lookup = {
+                'project_id': project_id,
+                'scope_number': scope_number,
+                'scope3_category': scope3_category,
+                'month': month,
+                'source_type': source_type,
+            }
+            updated = MonthlyEmissionRollup.objects.filter(**lookup).update(
+                emissions_tco2e=F('emissions_tco2e') + delta
+            )
+            if updated:
+                continue
+            try:
+                with transaction.atomic():
+                    MonthlyEmissionRollup.objects.create(emissions_tco2e=delta, **lookup)
+            except IntegrityError:
+                # Created concurrently, fall back to the increment
+                MonthlyEmissionRollup.objects.filter(**lookup).update(
+                    emissions_tco2e=F('emissions_tco2e') + delta
+                )
+
+
+def rebuild_rollups(projects_queryset=None):
+    """
+    Recompute the rollup table from the actual (non-projection) ledger rows with one
+    aggregate query. Returns the number of rollup rows written.
+    """
+    ledger = EmissionLedgerEntry.objects.filter(is_projection=False)
+    if projects_queryset is not None:
+        ledger = ledger.filter(project__in=projects_queryset)
+
+    totals = (
+        ledger
+        .values('project_id', 'scope_number', 'scope3_category', 'month', 'source_type')
+        .annotate(total=Sum('emissions_tco2e'))
+        .order_by()
+    )
+
+    rollups = [
+        MonthlyEmissionRollup(
+            project_id=row['project_id'],
+            scope_number=row['scope_number'],
+            scope3_category=row['scope3_category'],
+            month=row['month'],
+            source_type=row['source_type'],
+            emissions_tco2e=row['total'] or Decimal('0'),
+        )
+        for row in totals
+    ]
+
+    with transaction.atomic():
+        existing = MonthlyEmissionRollup.objects.all()
+        if projects_queryset is not None:
+            existing = existing.filter(project__in=projects_queryset)
+        existing.delete()
+        MonthlyEmissionRollup.objects.bulk_create(rollups, batch_size=1000)
+
+    return len(rollups)
+
+
+def rollup_queryset(projects_queryset=None, start_date=None, end_date=None):
+    """Rollup rows filtered by projects and an optional month range"""
+    queryset = MonthlyEmissionRollup.objects.all()
+    if projects_queryset is not None:
+        queryset = queryset.filter(project__in=projects_queryset)
+    if start_date is not None:
+        queryset = queryset.filter(month__gte=start_date.replace(day=1))
+    if end_date is not None:
+        queryset = queryset.filter(month__lte=end_date)
+    return queryset
+
+
+def rollup_totals_by_scope(projects_queryset=None, start_date=None, end_date=None):
+    """{scope_number: Decimal tCO₂e} from the rollup table in one query"""
+    rows = (
+        rollup_queryset(projects_queryset, start_date, end_date)
+        .values('scope_number')
+        .annotate(total=Sum('emissions_tco2e'))
+        .order_by()
+    )
+    return {row['scope_number']: row['total'] or Decimal('0') for row in rows}
+
+
+def rollup_series(projects_queryset=None, start_date=None, end_date=None, granularity='month'):
+    """{bucket_date: Decimal tCO₂e} per month or quarter from the rollup table in one query"""
+    if granularity not in ('month', 'quarter'):
+        raise ValueError("Rollups are monthly: granularity must be 'month' or 'quarter'")
+    rows = (
+        rollup_queryset(projects_queryset, start_date, end_date)
+        .annotate(bucket=Trunc('month', granularity, output_field=DateField()))
+        .values('bucket')
+        .annotate(total=Sum('emissions_tco2e'))
+        .order_by()
+    )
+    return {row['bucket']: row['total'] or Decimal('0') for row in rows}
@@ -0,0 +1,191 @@
+"""
+Saved sensitivity scenarios.
+
+A scenario keeps a snapshot of every activity's baseline contribution (tCO₂e),
+so that editing one activity only needs that activity's delta to be applied to
+the scenario totals instead of re-running the whole analysis.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+
+from api.models import EmissionActivity, LCAActivity, Scenario
+
+
+def activity_contribution(activity):
+    """
+    Baseline contribution of a single activity in tCO₂e, or None if the activity
+    should not take part in the analysis (e.g. an LCA activity that has not been
+    calculated yet).
+    Returns (key, entry) where entry matches a baseline_snapshot value.
+    """
+    scope_number = activity.scope.scope_number if activity.scope_id else None
+
+    if isinstance(activity, LCAActivity):
+        # LCA results are stored in kgCO₂e
+        if activity.calculated_emissions is None or activity.calculated_emissions == 0:
+            return str(activity.activity_id), None
+        impact = float(activity.calculated_emissions) / 1000
+        activity_type = 'lca'
+    else:
+        if not activity.emission_factor_id:
+            return str(activity.activity_id), None
+        impact = float(activity.quantity * activity.emission_factor.emission_factor_value) / 1000
+        activity_type = 'emission_factor'
+
+    return str(activity.activity_id), {
+        'name': activity.activity_name,
+        'baseline': impact,
+        'type': activity_type,
+        'scope': scope_number,
+    }
+
+
+def collect_baseline_contributions(project):
+    """
+    Baseline contribution of every activity in the project, keyed by activity_id.
+    Runs two queries regardless of the number of activities.
+    """
+    contributions = {}
+
+    emission_activities = EmissionActivity.objects.filter(project=project).select_related('scope', 'emission_factor')
+    lca_activities = LCAActivity.objects.filter(project=project).select_related('scope')
+
+    for activity in list(emission_activities) + list(lca_activities):
+        key, entry = activity_contribution(activity)
+        if entry is not None:
+            contributions[key] = entry
+
+    return contributions
+
+
+def adjustment_factor(adjustments, activity_id):
+    """Multiplier for an activity given the scenario's percent adjustments"""
+    adjustment_pct = (adjustments or {}).get(activity_id, 0) or 0
+    return 1 + (float(adjustment_pct) / 100)
+
+
+def build_analysis(contributions, adjustments, timeline_years=5, growth_rate=0.0, growth_curve=None):
+    """
+    Build the sensitivity analysis payload (totals, tornado and timeline) from
+    per-activity baseline contributions.
+
+    growth_curve, if given, is a list of annual growth rates (year 1, year 2, ...);
+    years beyond the end of the curve keep using its last rate. Otherwise a constant
+    growth_rate is applied every year.
+    """
+    adjustments = adjustments or {}
+
+    baseline_total = 0.0
+    adjusted_total = 0.0
+    tornado_data = []
+
+    for activity_id, activity_data in contributions.items():
+        adjusted_impact = activity_data['baseline'] * adjustment_factor(adjustments, activity_id)
+        baseline_total += activity_data['baseline']
+        adjusted_total += adjusted_impact
+
+        # Calculate impact of this activity on total
+        impact_change = adjusted_impact - activity_data['baseline']
+
+        tornado_data.append({
+            'activity': activity_data['name'][:40],  # Truncate for readability
+            'activity_id': activity_id,
+            'baseline': round(activity_data['baseline'], 4),
+            'adjusted': round(adjusted_impact, 4),
+            'impact': round(impact_change, 4),
+            'scope': activity_data['scope']
+        })
+
+    # Generate timeline projection
+    timeline = []
+    year_factor = 1.0
+    for year in range(timeline_years + 1):
+        if year > 0:
+            if growth_curve:
+                rate = growth_curve[min(year, len(growth_curve)) - 1]
+            else:
+                rate = growth_rate
+            year_factor *= (1 + float(rate))
+        timeline.append({
+            'year': year,
+            'baseline': round(baseline_total * year_factor, 4),
+            'adjusted': round(adjusted_total * year_factor, 4)
+        })
+
+    return {
+        'baseline_total': round(baseline_total, 4),
+        'adjusted_total': round(adjusted_total, 4),
+        'impact_change': round(adjusted_total - baseline_total, 4),
+        'impact_change_pct': round((adjusted_total - baseline_total) / baseline_total * 100, 2) if baseline_total > 0 else 0,
+        'tornado': tornado_data,
+        'timeline': timeline,
+        'timeline_years': timeline_years,
+        'growth_rate': growth_rate
+    }
+
+
+def apply_activity_delta(activity, deleted=False, previous_project_id=None):
+    """
+    Apply the change of a single activity to every saved scenario of its project.
+
+    Only the difference between the activity's stored baseline contribution and its
+    new contribution is added to the scenario totals, the rest of the snapshot is
+    left untouched. An activity moved from previous_project_id (its project before
+    the save) leaves the scenarios of that project.
+    """
+    key, entry = activity_contribution(activity) if not deleted else (str(activity.activity_id), None)
+    project_ids = {activity.project_id, previous_project_id} - {None}
+    if not project_ids:
+        return
+
+    with transaction.atomic():
+        scenarios = Scenario.objects.select_for_update().filter(project_id__in=project_ids)
+        for scenario in scenarios:
+            contribution = entry if scenario.project_id == activity.project_id else None
+            if apply_contributions(scenario, [(key, contribution)]):
+                scenario.save(update_fields=['baseline_snapshot', 'baseline_total', 'adjusted_total', 'last_modified'])
+
+
+def apply_contributions_to_scenarios(contributions):
+    """
+    Apply many activity contributions to the saved scenarios of their projects,
+    locking the scenarios once and saving each at most once.
+    contributions: {project_id: [(activity_id, entry or None)]}
+    """
+    if not contributions:
+        return
+
+    with transaction.atomic():
+        scenarios = Scenario.objects.select_for_update().filter(project_id__in=list(contributions))
+        for scenario in scenarios:
+            if apply_contributions(scenario, contributions[scenario.project_id]):
+                scenario.save(update_fields=['baseline_snapshot', 'baseline_total', 'adjusted_total', 'last_modified'])
+
+
+def apply_contributions(scenario, contributions):
+    """
+    Replace snapshot entries and move the totals by the difference.
+    contributions: [(key, entry or None)]. Returns whether the scenario changed.
+    """
+    changed = False
+    for key, entry in contributions:
+        previous = scenario.baseline_snapshot.get(key)
+        if previous is None and entry is None:
+            continue
+
+        old_baseline = previous['baseline'] if previous else 0.0
+        new_baseline = entry['baseline'] if entry else 0.0
+        factor = adjustment_factor(scenario.adjustments, key)
+
+        baseline_delta = Decimal(str(new_baseline)) - Decimal(str(old_baseline))
+        scenario.baseline_total += baseline_delta
+        scenario.adjusted_total += baseline_delta * Decimal(str(factor))
+
+        if entry is None:
+            scenario.baseline_snapshot.pop(key, None)
+        else:
+            scenario.baseline_snapshot[key] = entry
+        changed = True
+    return changed
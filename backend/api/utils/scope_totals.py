@@ -0,0 +1,114 @@
+"""
+Coalesced scope total recomputation.
+
+Activity writes mark their scope as dirty instead of recomputing its total right
+away. Inside a transaction the dirty scopes are collected in a per-thread set and
+recomputed once when it commits; in autocommit mode they are recomputed immediately. Recomputing is a
+single UPDATE with correlated aggregate subqueries, whatever the number of scopes.
+
+Bulk operations can wrap their writes in suspend_scope_totals() to collect the
+dirty scopes and recompute them once on exit, even outside a transaction.
+"""
+
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+_local = threading.local()
+
+
+def _scope_sum(model, multiplier=None):
+    """Correlated subquery summing the model's calculated_emissions for the outer scope"""
+    total = (
+        model.objects
+        .filter(scope_id=OuterRef('pk'))
+        .order_by()
+        .values('scope_id')
+        .annotate(total=Sum('calculated_emissions'))
+        .values('total')
+    )
+    output_field = DecimalField(max_digits=20, decimal_places=6)
+    expression = Coalesce(Subquery(total, output_field=output_field), Value(Decimal('0'), output_field=output_field))
+    if multiplier is not None:
+        # Multiply by the reciprocal rather than dividing: SQLite would use integer division
+        expression = expression * Value(multiplier, output_field=output_field)
+    return expression
+
+
+def recompute_scope_totals(scope_ids):
+    """Recompute total_emissions_tco2e of the given scopes with one UPDATE"""
+    from api.models import EmissionScope, EmissionActivity, LCAActivity
+
+    scope_ids = list(scope_ids)
+    if not scope_ids:
+        return 0
+    # LCA activities are stored in kgCO₂e
+    return EmissionScope.objects.filter(pk__in=scope_ids).update(
+        total_emissions_tco2e=_scope_sum(EmissionActivity) + _scope_sum(LCAActivity, Decimal('0.001'))
+    )
+
+
+def _pending(using=None):
+    """Scopes marked dirty in this thread's transaction on the database alias, until it commits"""
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        _local.pending = pending = {}
+    return pending.setdefault(using or DEFAULT_DB_ALIAS, set())
+
+
+def flush_scope_totals(using=None):
+    """Recompute the scopes marked dirty in this thread's transaction (run on commit)"""
+    pending = _pending(using)
+    if pending:
+        scope_ids = set(pending)
+        pending.clear()
+        recompute_scope_totals(scope_ids)
+
+
+def mark_scope_dirty(*scope_ids, using=None):
+    """Schedule a recomputation of the scopes' totals"""
+    scope_ids = {scope_id for scope_id in scope_ids if scope_id}
+    if not scope_ids:
+        return
+
+    suspended = getattr(_local, 'suspended', None)
+    if suspended is not None:
+        suspended.update(scope_ids)
+        return
+
+    if not transaction.get_connection(using).in_atomic_block:
+        recompute_scope_totals(scope_ids)
+        return
+
+    # Every mark registers a flush: the first one to run recomputes all the pending
+    # scopes and the others find nothing left. A flush registered in a rolled back
+    # savepoint is dropped, but the scopes it would have recomputed stay pending for
+    # the next one (recomputing a scope that didn't change is harmless).
+    _pending(using).update(scope_ids)
+    transaction.on_commit(lambda: flush_scope_totals(using), using=using)
+
+
+@contextmanager
+def suspend_scope_totals():
+    """
+    Collect dirty scopes instead of recomputing them, for bulk operations.
+    The collected scopes are recomputed once on exit (at commit if inside a transaction).
+    """
+    outer = getattr(_local, 'suspended', None)
+    if outer is not None:
+        # Nested: the outermost block recomputes
+        yield
+        return
+
+    _local.suspended = collected = set()
+    try:
+        yield
+    finally:
+        # Also on errors: writes that were already committed must be reflected
+        _local.suspended = None
+        mark_scope_dirty(*collected)
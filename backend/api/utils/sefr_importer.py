@@ -1,16 +1,57 @@
+import hashlib
+import os
 import pandas as pd
-from decimal import Decimal, ROUND_DOWN
-from django.core.exceptions import ValidationError
-from api.models import EmissionFactor
+from collections import defaultdict
+from itertools import islice
 from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from api.models import EmissionFactor, EmissionFactorRevision
 
 
 class SEFRExcelImporter:
     """
-    Utility class to import SEFR emission factors from Excel
+    Utility class to import SEFR emission factors from Excel (or CSV)
     Updated to work with the new clean EmissionFactor model
+
+    The file is streamed in chunks of CHUNK_SIZE rows (openpyxl read-only mode
+    for .xlsx, pandas chunks for .csv), so memory doesn't grow with the file.
+    Each chunk is mapped and validated column by column (the rules of
+    EmissionFactor.clean() and the field lengths), its duplicates are found
+    against one query preloading the existing SEFR (name, category, year) keys,
+    and its new factors are written with batched bulk_create in a transaction
+    of its own. Legacy .xls workbooks can't be streamed and are read whole.
+
+    Each factor keeps a hash of its mapped row (source_row_hash). With
+    delta=True, a re-import of the library preloads the (name, category) keys,
+    years and hashes of the SEFR factors in one query and classifies each row:
+    new keys are inserted, rows whose hash changed update their factor (value
+    changes are propagated to the activities using it, in the chunk's
+    transaction), and the other rows are left alone. The year is one of the
+    compared columns, so a yearly republish of the library updates its factors
+    in place (a key with factors of several years updates the one of the row's
+    year, or else the latest). Factors imported before hashes were kept have
+    their stored fields hashed instead. Once the whole file is imported, the
+    imported factors whose key it no longer contains are retired.
     """
     
+    SOURCE = 'SEFR'
+    DEFAULT_YEAR = 2023
+    DEFAULT_CATEGORY = 'purchased_goods_services'
+    DEFAULT_SCOPES = [3]
+    BATCH_SIZE = 1000
+    CHUNK_SIZE = 5000
+    # Errors and factor names kept for the summary, whatever the file size
+    MAX_REPORTED = 1000
+    VALUE_QUANTUM = Decimal('0.000001')
+    # emission_factor_value is DecimalField(max_digits=20, decimal_places=6)
+    MAX_VALUE = 1e14
+    # Fields a delta import rewrites on a changed factor
+    DELTA_UPDATE_FIELDS = [
+        'description', 'emission_factor_value', 'unit', 'imported_category', 'imported_sub_category',
+        'year', 'applicable_scopes', 'source_row_hash', 'retired_date', 'last_modified',
+    ]
+    
     EXCEL_COLUMN_MAPPING = {
         'Category': 'category',
         'Sub-Category': 'sub_category', 
@@ -48,25 +89,84 @@ class SEFRExcelImporter:
         'Other': {'applicable_scopes': [1, 2, 3]},  # Could apply to any scope
     }
     
-    def __init__(self, excel_file_path):
+    def __init__(self, excel_file_path, file_format=None, chunk_size=None, delta=False):
+        """
+        excel_file_path: path or binary file object
+        file_format: 'xlsx', 'xls' or 'csv' (default: from the file name)
+        chunk_size: rows per chunk (default CHUNK_SIZE)
+        delta: update changed factors and retire dropped ones instead of skipping existing keys
+        """
         self.excel_file_path = excel_file_path
+        if chunk_size:
+            self.CHUNK_SIZE = chunk_size
+        if file_format is None:
+            name = excel_file_path if isinstance(excel_file_path, (str, os.PathLike)) else getattr(excel_file_path, 'name', '')
+            file_format = os.path.splitext(str(name or ''))[1].lstrip('.').lower() or 'xlsx'
+        self.file_format = file_format
         self.df = None
+        self.total_rows = 0
         self.errors = []
+        self.error_count = 0
         self.success_count = 0
         self.skipped_count = 0
         self.imported_factors = []
+        self.delta = delta
+        self.updated_count = 0
+        self.unchanged_count = 0
+        self.retired_count = 0
+        self.value_changes = []
+        # Delta state: {(name, category): {year: factor}} of the SEFR factors, and the keys met in the file
+        self.library = None
+        self.seen_keys = set()
+    
+    def add_error(self, error_msg):
+        print(error_msg)
+        self.error_count += 1
+        if len(self.errors) < self.MAX_REPORTED:
+            self.errors.append(error_msg)
+    
+    def read_chunks(self, skip_chunks=0):
+        """
+        DataFrames of up to CHUNK_SIZE rows of the first sheet, after the first
+        skip_chunks chunks. A file without data rows yields one empty DataFrame
+        with the header's columns.
+        """
+        size = self.CHUNK_SIZE
+        if self.file_format == 'csv':
+            reader = pd.read_csv(self.excel_file_path, chunksize=size, encoding='utf-8-sig')
+            with reader:
+                yield from islice(reader, skip_chunks, None)
+            return
+        if self.file_format == 'xls':
+            frame = pd.read_excel(self.excel_file_path)
+            for start in range(skip_chunks * size, len(frame), size):
+                yield frame.iloc[start:start + size]
+            if frame.empty and not skip_chunks:
+                yield frame
+            return
         
-    def load_excel(self):
-        """Load Excel file into DataFrame"""
+        from openpyxl import load_workbook
+        workbook = load_workbook(self.excel_file_path, read_only=True, data_only=True)
         try:
-            self.df = pd.read_excel(self.excel_file_path)
-            print(f"Loaded Excel with {len(self.df)} rows and columns: {list(self.df.columns)}")
-            return True
-        except Exception as e:
-            error_msg = f"Failed to load Excel file: {str(e)}"
-            print(error_msg)
-            self.errors.append(error_msg)
-            return False
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            columns = [str(name) if name is not None else f'Unnamed: {number}' for number, name in enumerate(header)]
+            width = len(columns)
+            # Skipped rows are still parsed, but not turned into DataFrames
+            for _ in islice(rows, skip_chunks * size):
+                pass
+            first = not skip_chunks
+            while True:
+                # Read-only sheets can yield rows shorter or longer than the header
+                chunk = [row[:width] + (None,) * (width - len(row)) for row in islice(rows, size)]
+                if not chunk and not first:
+                    break
+                first = False
+                yield pd.DataFrame.from_records(chunk, columns=columns)
+                if len(chunk) < size:
+                    break
+        finally:
+            workbook.close()
     
     def validate_columns(self):
         """Check if required columns exist"""
@@ -74,9 +174,7 @@ class SEFRExcelImporter:
         missing_columns = [col for col in required_columns if col not in self.df.columns]
         
         if missing_columns:
-            error_msg = f"Missing required columns: {missing_columns}"
-            print(error_msg)
-            self.errors.append(error_msg)
+            self.add_error(f"Missing required columns: {missing_columns}")
             return False
         return True
     
@@ -96,119 +194,339 @@ class SEFRExcelImporter:
         self.df = self.df.replace('', None)
         self.df = self.df.replace('nan', None)
         
-    def process_row(self, row):
-        """Process a single row from the Excel file using new clean model"""
-        try:
-            # Map SEFR category to our clean categories
-            sefr_category = row['Category']
-            sefr_sub_category = row.get('Sub-Category', None)
-            clean_category = self.CATEGORY_MAPPING.get(sefr_category, 'purchased_goods_services')
-            
-            # Get scope mapping
-            scope_mapping = self.CATEGORY_TO_SCOPE_MAPPING.get(sefr_category, {'applicable_scopes': [3]})
-            applicable_scopes = scope_mapping['applicable_scopes']
-
-            # Determine year early so we can include it in duplicate detection
-            raw_year = row.get('Year')
-            if pd.notna(raw_year) and str(raw_year).isdigit():
-                year_value = int(raw_year)
-            else:
-                year_value = 2023  # default
-            
-            # Check for existing factor (avoid duplicates) – now includes year so different years are allowed
-            existing = EmissionFactor.objects.filter(
-                name=row['Activity'],
-                category=clean_category,
-                source='SEFR',
-                year=year_value
-            ).first()
-            
-            if existing:
-                self.skipped_count += 1
-                return f"Skipped duplicate (same year {year_value}): {row['Activity']}"
-            
-            # Validate emission factor value
-            try:
-                ef_value = float(row['EF (kg CO2-eq per unit)'])
-                if ef_value <= 0:
-                    raise ValueError("Emission factor must be positive")
-            except (ValueError, TypeError) as e:
-                raise ValueError(f"Invalid emission factor value: {row['EF (kg CO2-eq per unit)']} - {str(e)}")
-            
-            # Unit - no validation, allow any unit
-            unit = str(row['Unit']).strip()
-            
-            # Create new emission factor with clean model structure
-            # Extract original description only (no injected prefix)
-            raw_desc = row.get('Description')
-            if raw_desc is not None:
-                desc_clean = str(raw_desc).strip()
-                if desc_clean.lower() in ('', 'nan', 'none'):
-                    desc_clean = None
-            else:
-                desc_clean = None
-            factor_data = {
-                'name': str(row['Activity']).strip(),
-                'category': clean_category,
-                'description': desc_clean,
-                'emission_factor_value': Decimal(str(ef_value)).quantize(Decimal('0.000001')),
-                'unit': unit,
-                'source': 'SEFR',
-                'year': year_value,
-                'imported_category': sefr_category,
-                'imported_sub_category': sefr_sub_category,
-                'applicable_scopes': applicable_scopes,
+    @staticmethod
+    def _optional_text(df, column):
+        """Stripped strings, None for blank values or a missing column"""
+        if column not in df:
+            return pd.Series([None] * len(df), index=df.index, dtype=object)
+        return df[column].map(
+            lambda value: None if pd.isna(value) or str(value).strip().lower() in ('', 'nan', 'none') else str(value).strip()
+        )
+    
+    def map_keys(self, df):
+        """Names, SEFR categories, mapped categories and years of the rows"""
+        names = df['Activity'].astype(str).str.strip()
+        sefr_categories = df['Category'].astype(str).str.strip()
+        categories = sefr_categories.map(self.CATEGORY_MAPPING).fillna(self.DEFAULT_CATEGORY)
+        
+        # Whole, non-negative years; anything else falls back to the default year
+        if 'Year' in df:
+            raw_years = pd.to_numeric(df['Year'], errors='coerce')
+            years = raw_years.where(raw_years.notna() & (raw_years % 1 == 0) & (raw_years >= 0), self.DEFAULT_YEAR).astype(int)
+        else:
+            years = pd.Series(self.DEFAULT_YEAR, index=df.index)
+        return names, sefr_categories, categories, years
+    
+    def find_duplicates(self, names, keys):
+        """
+        Rows to skip: duplicates of an earlier row of the file (different years of
+        the same factor are allowed, except in delta imports where the year is a
+        compared column) or, outside delta imports, of an existing SEFR factor
+        (one query, earlier chunks included)
+        """
+        if self.delta:
+            keys = keys.map(lambda key: key[:2])
+            duplicates = keys.duplicated() | keys.map(self.seen_keys.__contains__)
+            # Invalid rows count as seen too: a row failing validation doesn't retire its factor
+            self.seen_keys.update(keys)
+            return duplicates
+        existing = set(
+            EmissionFactor.objects.filter(
+                source=self.SOURCE, name__in=names.unique().tolist(), year__in=[int(key[2]) for key in keys.unique()]
+            ).values_list('name', 'category', 'year')
+        )
+        return keys.map(existing.__contains__) | keys.duplicated()
+    
+    @staticmethod
+    def row_hash(*fields):
+        """Hash of a row's mapped fields"""
+        return hashlib.sha1(repr(fields).encode('utf-8')).hexdigest()
+    
+    def stored_row_hashes(self, factor_ids):
+        """Row hashes of the factors' stored fields, for factors imported without one"""
+        return {
+            factor_id: self.row_hash(
+                name, category, description or None, str(value), unit, year, sefr_category, sub_category or None,
+                list(applicable_scopes),
+            )
+            for factor_id, name, category, description, value, unit, year, sefr_category, sub_category, applicable_scopes
+            in EmissionFactor.objects.filter(pk__in=factor_ids).values_list(
+                'factor_id', 'name', 'category', 'description', 'emission_factor_value', 'unit', 'year',
+                'imported_category', 'imported_sub_category', 'applicable_scopes',
+            )
+        }
+    
+    def build_factors(self):
+        """
+        Map and validate all rows at once. Returns the EmissionFactor objects of
+        the valid rows (existing factors included in delta imports, see
+        write_factors); duplicates are counted as skipped and invalid rows
+        recorded as errors.
+        """
+        df = self.df
+        names, sefr_categories, categories, years = self.map_keys(df)
+        scopes = sefr_categories.map(
+            lambda category: self.CATEGORY_TO_SCOPE_MAPPING.get(category, {'applicable_scopes': self.DEFAULT_SCOPES})['applicable_scopes']
+        )
+        
+        keys = pd.Series(list(zip(names, categories, years)), index=df.index)
+        duplicates = self.find_duplicates(names, keys)
+        self.skipped_count += int(duplicates.sum())
+        
+        errors = defaultdict(list)
+        
+        def add_errors(mask, message):
+            for index in mask[mask & ~duplicates].index:
+                errors[index].append(message(index) if callable(message) else message)
+        
+        # Emission factor value
+        raw_values = df['EF (kg CO2-eq per unit)']
+        values = pd.to_numeric(raw_values, errors='coerce')
+        add_errors(values.isna(), lambda index: f"Invalid emission factor value: {raw_values[index]} - not a number")
+        add_errors(values <= 0, lambda index: f"Invalid emission factor value: {raw_values[index]} - Emission factor must be positive")
+        add_errors(values >= self.MAX_VALUE, 'emission_factor_value: Ensure that there are no more than 20 digits in total.')
+        
+        # Year range (EmissionFactor.clean)
+        max_year = timezone.now().year + 5
+        add_errors((years < 1990) | (years > max_year), f'year: Year must be between 1990 and {max_year}')
+        
+        # Field lengths
+        units = df['Unit'].astype(str).str.strip()
+        descriptions = self._optional_text(df, 'Description')
+        sub_categories = self._optional_text(df, 'Sub-Category')
+        for field, column in (('name', names), ('unit', units), ('imported_category', sefr_categories), ('imported_sub_category', sub_categories)):
+            limit = EmissionFactor._meta.get_field(field).max_length
+            add_errors(column.map(lambda text: len(text or '')) > limit, f'{field}: Ensure this value has at most {limit} characters.')
+        
+        for index, messages in errors.items():
+            self.add_error(f"Failed to import '{names[index]}': {'; '.join(messages)}")
+        
+        valid = ~duplicates & ~df.index.isin(list(errors))
+        factors = []
+        for name, category, description, value, unit, year, sefr_category, sub_category, applicable_scopes in zip(
+            names[valid], categories[valid], descriptions[valid], values[valid], units[valid],
+            years[valid], sefr_categories[valid], sub_categories[valid], scopes[valid],
+        ):
+            value = Decimal(str(value)).quantize(self.VALUE_QUANTUM)
+            year, applicable_scopes = int(year), list(applicable_scopes)
+            factors.append(EmissionFactor(
+                name=name,
+                category=category,
+                description=description,
+                emission_factor_value=value,
+                unit=unit,
+                source=self.SOURCE,
+                year=year,
+                imported_category=sefr_category,
+                imported_sub_category=sub_category,
+                applicable_scopes=applicable_scopes,
+                source_row_hash=self.row_hash(
+                    name, category, description, str(value), unit, year, sefr_category, sub_category, applicable_scopes
+                ),
+            ))
+        return factors
+    
+    def load_library(self):
+        """The SEFR factors by (name, category) and year, for delta imports (one query)"""
+        if self.library is None:
+            self.library = defaultdict(dict)
+            for name, category, year, factor_id, row_hash, retired_date, imported in EmissionFactor.objects.filter(
+                source=self.SOURCE
+            ).values_list(
+                'name', 'category', 'year', 'factor_id', 'source_row_hash', 'retired_date', 'imported_category'
+            ).order_by().iterator(chunk_size=self.BATCH_SIZE):
+                self.library[(name, category)][year] = (factor_id, row_hash, retired_date, imported)
+        return self.library
+    
+    def library_factor(self, factor):
+        """The library factor a delta row updates: the one of its year, or else the latest; None for a new key"""
+        versions = self.load_library().get((factor.name, factor.category))
+        if not versions:
+            return None
+        return versions.get(factor.year) or versions[max(versions)]
+    
+    def write_factors(self, factors):
+        """
+        Write the chunk's factors (inside its transaction). Delta imports insert
+        the new keys, update the factors whose row hash changed (or that were
+        retired) and propagate their value changes.
+        """
+        from .response_cache import bump_data_version, FACTORS_KEY, REFERENCE_KEY
+        
+        inserts, updates = factors, []
+        if self.delta:
+            inserts, unhashed = [], []
+            for factor in factors:
+                existing = self.library_factor(factor)
+                if existing is None:
+                    inserts.append(factor)
+                    continue
+                factor.factor_id = existing[0]
+                if existing[2] is not None:
+                    updates.append(factor)
+                elif existing[1] is None:
+                    unhashed.append(factor)
+                elif existing[1] == factor.source_row_hash:
+                    self.unchanged_count += 1
+                else:
+                    updates.append(factor)
+            if unhashed:
+                # Imported before hashes were kept: compare the stored fields, and keep their hash
+                stored = self.stored_row_hashes([factor.factor_id for factor in unhashed])
+                hashed = [factor for factor in unhashed if stored.get(factor.factor_id) == factor.source_row_hash]
+                updates.extend(factor for factor in unhashed if stored.get(factor.factor_id) != factor.source_row_hash)
+                EmissionFactor.objects.bulk_update(hashed, ['source_row_hash'], batch_size=self.BATCH_SIZE)
+                self.unchanged_count += len(hashed)
+            now = timezone.now()
+            for factor in updates:
+                factor.retired_date = None
+                factor.last_modified = now
+        
+        if inserts:
+            EmissionFactor.objects.bulk_create(inserts, batch_size=self.BATCH_SIZE)
+        if updates:
+            # Values as of now, under lock (they may have been edited since the library was loaded)
+            current = dict(
+                EmissionFactor.objects.select_for_update()
+                .filter(pk__in=[factor.factor_id for factor in updates])
+                .values_list('factor_id', 'emission_factor_value')
+            )
+            updates = [factor for factor in updates if factor.factor_id in current]
+            EmissionFactor.objects.bulk_update(updates, self.DELTA_UPDATE_FIELDS, batch_size=self.BATCH_SIZE)
+            changes = {
+                factor.factor_id: (current[factor.factor_id], factor.emission_factor_value)
+                for factor in updates
+                if current[factor.factor_id] != factor.emission_factor_value
             }
-            
-            # Create and save the factor
-            factor = EmissionFactor(**factor_data)
-            factor.full_clean()  # This will run our model validation
-            factor.save()
-            
-            self.success_count += 1
-            self.imported_factors.append(row['Activity'])
-            return f"Successfully imported: {row['Activity']} → {clean_category} (Scopes {applicable_scopes})"
-            
+            if changes:
+                from .factor_propagation import propagate_factor_changes
+                propagate_factor_changes(changes, EmissionFactorRevision.SOURCE_IMPORT)
+            for factor in updates:
+                if factor.factor_id in changes and len(self.value_changes) < self.MAX_REPORTED:
+                    old_value, new_value = changes[factor.factor_id]
+                    self.value_changes.append({
+                        'factor_id': str(factor.factor_id),
+                        'name': factor.name,
+                        'old_value': str(old_value),
+                        'new_value': str(new_value),
+                    })
+        if inserts or updates:
+            # Bulk writes send no signals
+            bump_data_version(REFERENCE_KEY, FACTORS_KEY)
+        
+        self.success_count += len(inserts)
+        self.updated_count += len(updates)
+        self.imported_factors.extend(factor.name for factor in inserts[:self.MAX_REPORTED - len(self.imported_factors)])
+    
+    def retire_missing(self):
+        """
+        Retire the imported SEFR factors the file no longer contains (delta
+        imports, once every chunk is committed). Retired factors keep their
+        activities; running it again retires nothing more.
+        """
+        library = self.load_library()
+        retired_ids = [
+            factor_id
+            for key, versions in library.items() if key not in self.seen_keys
+            for factor_id, _, retired_date, imported in versions.values()
+            if imported and retired_date is None
+        ]
+        if not retired_ids:
+            return
+        
+        from .response_cache import bump_data_version, FACTORS_KEY, REFERENCE_KEY
+        now = timezone.now()
+        with transaction.atomic():
+            for start in range(0, len(retired_ids), self.BATCH_SIZE):
+                EmissionFactor.objects.filter(
+                    pk__in=retired_ids[start:start + self.BATCH_SIZE], retired_date__isnull=True
+                ).update(retired_date=now, last_modified=now)
+            # Queryset updates send no signals
+            bump_data_version(REFERENCE_KEY, FACTORS_KEY)
+            self.retired_count += len(retired_ids)
+            self.retirements_committed()
+    
+    def retirements_committed(self):
+        """Called inside the transaction retiring the factors a delta import dropped"""
+    
+    def chunk_committed(self, number):
+        """Called inside the transaction of chunk number (0-based), after its factors are written"""
+    
+    def import_chunk(self, number):
+        """Validate self.df and write its new factors; False if they couldn't be saved"""
+        self.clean_data()
+        factors = self.build_factors()
+        
+        try:
+            with transaction.atomic():
+                self.write_factors(factors)
+                self.chunk_committed(number)
         except Exception as e:
-            error_msg = f"Failed to import '{row.get('Activity', 'Unknown')}': {str(e)}"
-            print(error_msg)
-            self.errors.append(error_msg)
-            return error_msg
+            self.add_error(f"Failed to save {len(factors)} factors: {str(e)}")
+            return False
+        return True
     
-    def import_data(self):
-        """Main import process"""
+    def import_data(self, start_chunk=0):
+        """
+        Main import process. Chunks are committed as they are imported, so a
+        failure leaves the earlier chunks' factors in place; start_chunk resumes
+        after them.
+        """
         print(f"Starting SEFR import from: {self.excel_file_path}")
         
-        if not self.load_excel():
-            return False
-            
-        if not self.validate_columns():
+        if self.delta and start_chunk:
+            # The keys of the committed chunks, so their factors aren't retired
+            committed = self.read_chunks()
+            try:
+                for chunk in islice(committed, start_chunk):
+                    self.df = chunk
+                    if not chunk.empty and self.validate_columns():
+                        self.clean_data()
+                        names, _, categories, _ = self.map_keys(self.df)
+                        self.seen_keys.update(zip(names, categories))
+            finally:
+                committed.close()
+        
+        chunks = self.read_chunks(skip_chunks=start_chunk)
+        try:
+            for number, chunk in enumerate(chunks, start=start_chunk):
+                self.df = chunk
+                if number == start_chunk and not self.validate_columns():
+                    return False
+                if chunk.empty:
+                    continue
+                self.total_rows += len(chunk)
+                if not self.import_chunk(number):
+                    return False
+                print(f"Processed {self.total_rows} rows: {self.success_count} imported, {self.skipped_count} skipped")
+        except Exception as e:
+            self.add_error(f"Failed to read file: {str(e)}")
             return False
-            
-        self.clean_data()
-        print(f"Processing {len(self.df)} rows...")
+        finally:
+            chunks.close()
         
-        # Process each row
-        for index, row in self.df.iterrows():
+        if self.delta:
             try:
-                result = self.process_row(row)
-                if index % 10 == 0:  # Progress indicator every 10 rows
-                    print(f"Processed {index + 1}/{len(self.df)} rows...")
+                self.retire_missing()
             except Exception as e:
-                error_msg = f"Row {index + 1}: {str(e)}"
-                print(error_msg)
-                self.errors.append(error_msg)
+                self.add_error(f"Failed to retire dropped factors: {str(e)}")
+                return False
+            print(f"Delta: {self.updated_count} updated, {self.unchanged_count} unchanged, {self.retired_count} retired")
         
-        print(f"Import completed: {self.success_count} success, {self.skipped_count} skipped, {len(self.errors)} errors")
+        print(f"Import completed: {self.success_count} success, {self.skipped_count} skipped, {self.error_count} errors")
         return True
     
     def get_import_summary(self):
         """Return summary of import results"""
         return {
-            'total_rows': len(self.df) if self.df is not None else 0,
+            'total_rows': self.total_rows,
             'success_count': self.success_count,
             'skipped_count': self.skipped_count,
-            'error_count': len(self.errors),
+            'error_count': self.error_count,
             'errors': self.errors[:10],  # Limit errors to first 10 to avoid overwhelming
             'imported_factors': self.imported_factors[:20],  # Limit to first 20 for display
+            'updated_count': self.updated_count,
+            'unchanged_count': self.unchanged_count,
+            'retired_count': self.retired_count,
+            'value_changes': self.value_changes[:20],
         }
\ No newline at end of file
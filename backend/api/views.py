@@ -2,16 +2,22 @@ from rest_framework import generics
 from rest_framework import viewsets
 
 from django.conf import settings
+from django.db import transaction
 from django.http import JsonResponse
 
 from django.contrib.auth.models import User
-from .serializer import UserSerializer, ProjectSerializer
+from .serializer import UserSerializer, ProjectSerializer, ProjectSummarySerializer
+from .fieldsets import SparseFieldsetMixin
+from .pagination import KeysetPagination
+from .utils.factor_search import search_factors
 
-from .models import Project, EmissionScope, EmissionFactor, EmissionActivity, LCAProduct, LCAActivity, ProductExchange
-from django.db.models import Q
+from .models import Project, EmissionScope, EmissionFactor, EmissionActivity, LCAProduct, LCAActivity, ProductExchange, Scenario
+from .models import FactorImportJob
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
 from .serializer import EmissionScopeSerializer, EmissionFactorSerializer, EmissionActivitySerializer
-from .serializer import CategoryInfoSerializer
-from .serializer import LCAProductSerializer, LCAActivitySerializer, ProductExchangeSerializer
+from .serializer import CategoryInfoSerializer, EmissionFactorRevisionSerializer, FactorImportJobSerializer
+from .serializer import LCAProductSerializer, LCAActivitySerializer, ProductExchangeSerializer, ScenarioSerializer
 from google import genai
 import json
 import os
@@ -41,12 +47,64 @@ class CreateUserView(generics.CreateAPIView):
 #     serializer_class = ProjectSerializer
 #     permission_classes = [AllowAny]
 
-class ProjectViewSet(viewsets.ModelViewSet):
+def _row_count(model, field):
+    """Correlated COUNT of the model's rows whose field points to the outer row"""
+    counts = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def _scopes_with_counts():
+    return EmissionScope.objects.annotate(
+        activity_count=_row_count(EmissionActivity, 'scope'),
+        lca_activity_count=_row_count(LCAActivity, 'scope'),
+    )
+
+
+class ProjectViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    """
+    Projects. The list returns a summary of each project (scope totals and activity
+    counts); pass nested=true, or expand=scopes,lca_products, to get every scope's
+    activities and the LCA products as on the detail endpoint.
+    Supports ?fields= (see api.fieldsets); the queries made stay constant
+    whatever the number of projects (3 for a summary page, 6 for a nested one).
+    """
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     lookup_field = "project_id"
     permission_classes = [AllowAny]
 
+    # Computed from the (summary) scopes or annotated
+    field_dependencies = {'total_emissions_tco2e': [], 'activity_count': [], 'lca_product_count': []}
+
+    def is_nested(self):
+        if self.action != 'list':
+            return True
+        return self.request.query_params.get('nested', '').lower() in ('1', 'true', 'yes')
+
+    def get_field_relations(self, name, field):
+        # The scopes are always annotated with their counts, so that one prefetch
+        # serves both the summary fields and the nested scopes
+        scopes = Prefetch('scopes', queryset=_scopes_with_counts())
+        if name == 'scopes' and isinstance(field.child, ProjectSerializer.ScopeWithActivitiesSerializer):
+            return {'prefetch_related': [
+                scopes,
+                Prefetch('scopes__activities', queryset=EmissionActivity.objects.select_related('emission_factor')),
+                'scopes__lca_activities',
+            ]}
+        if name in ('scopes', 'total_emissions_tco2e', 'activity_count'):
+            return {'prefetch_related': [scopes]}
+        if name == 'lca_products':
+            return {'prefetch_related': ['lca_products', 'lca_products__exchanges']}
+        if name == 'lca_product_count':
+            return {'annotate': {'lca_product_count': _row_count(LCAProduct, 'project')}}
+        return {}
+
+    def get_queryset(self):
+        return self.apply_fieldset(Project.objects.order_by('-created_date'))
+
+    def get_serializer_class(self):
+        return ProjectSerializer if self.is_nested() else ProjectSummarySerializer
+
 
 class EmissionScopeViewSet(viewsets.ModelViewSet):
     queryset = EmissionScope.objects.all()
@@ -54,15 +112,25 @@ class EmissionScopeViewSet(viewsets.ModelViewSet):
     lookup_field = "scope_id"
     permission_classes = [AllowAny]
     
-class EmissionFactorViewSet(viewsets.ModelViewSet):
+class EmissionFactorViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     Clean, user-focused emission factor management.
     All emission factors use the unified model with uncertainty analysis support.
+    Supports ?fields= (see api.fieldsets). Listings are cursor paginated (see api.pagination).
     """
     queryset = EmissionFactor.objects.all()
     serializer_class = EmissionFactorSerializer
     lookup_field = "factor_id"
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
+
+    field_dependencies = {
+        'category_display': ['category'],
+        'scope_3_category_display': ['scope_3_category'],
+        'uncertainty_type_display': ['uncertainty_type'],
+        'has_uncertainty': ['uncertainty_type', 'uncertainty_params'],
+        'uncertainty_description': ['uncertainty_type', 'uncertainty_params'],
+    }
     
     def get_queryset(self):
         """Filter emission factors based on query parameters"""
@@ -70,6 +138,10 @@ class EmissionFactorViewSet(viewsets.ModelViewSet):
 
         params = self.request.query_params
 
+        # Factors retired by a library re-import stay retrievable (activities use them), but aren't listed
+        if self.action == 'list' and params.get('include_retired', '').lower() not in ('true', '1'):
+            queryset = queryset.filter(retired_date__isnull=True)
+
         # Category: allow comma-separated list
         category = params.get('category')
         if category:
@@ -123,35 +195,52 @@ class EmissionFactorViewSet(viewsets.ModelViewSet):
         if unit:
             queryset = queryset.filter(unit__icontains=unit)
 
-        # General search across several text fields
-        search = params.get('search') or params.get('q')
+        # General search across several text fields, ranked by relevance
+        search = (params.get('search') or params.get('q') or '').strip()
         if search:
-            search = search.strip()
-            if search:
-                queryset = queryset.filter(
-                    Q(name__icontains=search) |
-                    Q(description__icontains=search) |
-                    Q(source__icontains=search) |
-                    Q(imported_category__icontains=search) |
-                    Q(imported_sub_category__icontains=search)
-                )
+            queryset = search_factors(queryset, search)
 
-        # Sorting
+        # Sorting (search results default to relevance)
         sort = params.get('sort')
         allowed_sort_fields = {
             'name', 'year', 'emission_factor_value', 'category', 'source', 'created_date', 'last_modified'
         }
+        default_order = ('-search_rank', 'name') if search else ('category', 'name')
         if sort:
             base = sort.lstrip('-')
-            if base in allowed_sort_fields:
+            if base in allowed_sort_fields or (search and base == 'search_rank'):
                 queryset = queryset.order_by(sort)
             else:
-                queryset = queryset.order_by('category', 'name')
+                queryset = queryset.order_by(*default_order)
         else:
-            queryset = queryset.order_by('category', 'name')
+            queryset = queryset.order_by(*default_order)
 
-        return queryset
+        return self.apply_fieldset(queryset)
     
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Top matches for a factor picker, from the in-memory index (see utils.autocomplete).
+
+        Query Parameters:
+        - q: text typed so far (word prefixes, typos tolerated)
+        - limit: number of matches (default 10, at most 50)
+        - category: only factors of this category
+        - scope: only factors applicable to this scope (1, 2 or 3)
+        """
+        from .utils.autocomplete import DEFAULT_LIMIT, search_factor_names
+
+        params = request.query_params
+        try:
+            limit = max(1, int(params.get('limit', DEFAULT_LIMIT)))
+            scope = int(params['scope']) if params.get('scope') else None
+        except ValueError:
+            return Response({'error': 'limit and scope must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(search_factor_names(
+            params.get('q', ''), limit, category=params.get('category') or None, scope=scope,
+        ))
+
     @action(detail=False, methods=['get'])
     def categories(self, request):
         """Get all categories with their information"""
@@ -165,6 +254,75 @@ class EmissionFactorViewSet(viewsets.ModelViewSet):
         
         return Response(categories_info)
     
+    @action(detail=True, methods=['get'])
+    def revisions(self, request, factor_id=None):
+        """Value changes of this factor and how many dependent rows each one recalculated"""
+        factor = self.get_object()
+        serializer = EmissionFactorRevisionSerializer(factor.revisions.all(), many=True)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_upsert(self, request):
+        """
+        Create or replace many emission factors at once.
+
+        Body: a JSON array of factors (or {"rows": [...]}) with the serializer's fields.
+        A row whose factor_id exists replaces that factor, any other row creates one.
+        Value changes are propagated to the dependent activities and products once.
+
+        Query Parameters:
+        - dry_run: 'true' to only validate
+        - atomic: 'true' to write nothing if any row is invalid
+
+        Returns created/updated/failed counts, a per-row error report and the factor IDs.
+        """
+        import pandas as pd
+        from .utils.activity_ingest import IngestFormatError
+        from .utils.factor_bulk import upsert_factors
+
+        rows = request.data.get('rows') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return Response({
+                'success': False,
+                'error': 'Send a JSON array of factors or {"rows": [...]}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        params = request.query_params
+        dry_run = params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        try:
+            report = upsert_factors(
+                pd.DataFrame.from_records(rows),
+                dry_run=dry_run,
+                atomic=params.get('atomic', '').lower() in ('1', 'true', 'yes'),
+            )
+        except IngestFormatError as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if report['created']:
+            response_status = status.HTTP_201_CREATED
+        elif report['failed'] and not report['updated']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_200_OK
+        return Response({'success': not report['failed'], 'dry_run': dry_run, **report}, status=response_status)
+
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request):
+        """
+        Delete many emission factors at once.
+        Body: {"factor_ids": [...]}. Factors still used by activities or product
+        exchanges are not deleted and reported in errors.
+        """
+        from .utils.factor_bulk import delete_factors
+
+        factor_ids = request.data.get('factor_ids') if isinstance(request.data, dict) else None
+        if not isinstance(factor_ids, list):
+            return Response({'success': False, 'error': 'factor_ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = delete_factors(factor_ids)
+        response_status = status.HTTP_400_BAD_REQUEST if report['failed'] and not report['deleted'] else status.HTTP_200_OK
+        return Response({'success': not report['failed'], **report}, status=response_status)
+
     @action(detail=False, methods=['delete'])
     def delete_all(self, request):
         """Delete all emission factors (admin function)"""
@@ -177,7 +335,15 @@ class EmissionFactorViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def import_excel(self, request):
-        """Import emission factors from SEFR Excel file - Updated for clean model"""
+        """
+        Import emission factors from a SEFR Excel (.xlsx, .xls) or CSV file - Updated for clean model.
+        The import runs in the background (see utils.import_jobs): the response is the queued job,
+        whose progress is polled at /api/factor-import-jobs/<job_id>/.
+
+        With mode=delta (form field or query parameter) the file is a new release of the library:
+        changed factors are updated (their activities recalculated) and the imported factors it
+        no longer contains are retired, instead of skipping every existing factor.
+        """
         
         if 'file' not in request.FILES:
             return Response(
@@ -188,136 +354,202 @@ class EmissionFactorViewSet(viewsets.ModelViewSet):
         file = request.FILES['file']
         
         # Validate file type
-        if not file.name.lower().endswith(('.xlsx', '.xls')):
+        file_format = os.path.splitext(file.name)[1].lstrip('.').lower()
+        if file_format not in ('xlsx', 'xls', 'csv'):
+            return Response(
+                {'error': 'File must be Excel (.xlsx or .xls) or CSV format'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Validate file size
+        max_size_mb = settings.FACTOR_IMPORT_MAX_UPLOAD_MB
+        if file.size > max_size_mb * 1024 * 1024:
             return Response(
-                {'error': 'File must be Excel format (.xlsx or .xls)'}, 
+                {'error': f'File size must be less than {max_size_mb}MB'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Validate file size (limit to 10MB)
-        if file.size > 10 * 1024 * 1024:  # 10MB
+        mode = request.data.get('mode') or request.query_params.get('mode') or 'insert'
+        if mode not in ('insert', 'delta'):
             return Response(
-                {'error': 'File size must be less than 10MB'}, 
+                {'error': "mode must be 'insert' or 'delta'"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        from .utils.import_jobs import create_import_job, start_import_job
         try:
-            import tempfile
-            import os
-            
-            # Create temp file with proper extension
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
-                for chunk in file.chunks():
-                    temp_file.write(chunk)
-                temp_path = temp_file.name
-            
-            # Import data using updated importer
-            from .utils.sefr_importer import SEFRExcelImporter
-            importer = SEFRExcelImporter(temp_path)
-            
-            success = importer.import_data()
-            summary = importer.get_import_summary()
-            
-            # Clean up temp file
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
-            
-            # Return detailed response
-            if success:
-                return Response({
-                    'success': True,
-                    'message': f'Import completed: {summary["success_count"]} imported, {summary["skipped_count"]} skipped, {summary["error_count"]} errors',
-                    'summary': summary
-                }, status=status.HTTP_200_OK)
-            else:
-                return Response({
-                    'success': False,
-                    'message': 'Import failed - see errors for details',
-                    'summary': summary
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-        except Exception as e:
-            # Clean up temp file if it exists
-            try:
-                if 'temp_path' in locals():
-                    os.unlink(temp_path)
-            except:
-                pass
-                
-            error_message = str(e)
-            
+            job = create_import_job(file, file_format, delta=mode == 'delta')
+        except OSError as e:
             return Response({
                 'success': False,
-                'error': f'Import failed: {error_message}',
-                'summary': {
-                    'total_rows': 0,
-                    'success_count': 0,
-                    'skipped_count': 0,
-                    'error_count': 1,
-                    'errors': [error_message]
-                }
+                'error': f'Could not store the upload: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        transaction.on_commit(lambda: start_import_job(job.job_id))
+        return Response({
+            'success': True,
+            'message': 'Import started',
+            'job': FactorImportJobSerializer(job).data,
+        }, status=status.HTTP_202_ACCEPTED)
 
-class EmissionActivityViewSet(viewsets.ModelViewSet):
+
+class FactorImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Background factor imports, newest first, with their progress (see utils.import_jobs).
+    """
+    queryset = FactorImportJob.objects.all()
+    serializer_class = FactorImportJobSerializer
+    lookup_field = 'job_id'
+    permission_classes = [AllowAny]
+    
+    @action(detail=True, methods=['post'])
+    def resume(self, request, job_id=None):
+        """Restart a failed or interrupted job after its last committed chunk"""
+        from .utils.import_jobs import is_interrupted, start_import_job
+        job = self.get_object()
+        if job.status != FactorImportJob.STATUS_FAILED and not is_interrupted(job):
+            return Response(
+                {'error': f'Job is {job.status} and not interrupted'}, 
+                status=status.HTTP_409_CONFLICT
+            )
+        # The thread claims the job, so concurrent resumes run it once
+        transaction.on_commit(lambda: start_import_job(job.job_id))
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class EmissionActivityViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    """
+    Emission activities, newest first. Supports ?fields= and ?expand=scope (see
+    api.fieldsets); listings are cursor paginated (see api.pagination).
+    """
     queryset = EmissionActivity.objects.all()
     serializer_class = EmissionActivitySerializer
     lookup_field = "activity_id"
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
 
-class LCAProductViewSet(viewsets.ModelViewSet):
+    field_relations = {
+        'emission_factor': {'select_related': ['emission_factor']},
+        'scope': {'select_related': ['scope']},
+    }
+
+    def get_queryset(self):
+        return self.apply_fieldset(EmissionActivity.objects.order_by('-created_date'))
+
+    BULK_CONTENT_TYPES = {
+        'text/csv': 'csv',
+        'application/csv': 'csv',
+        'application/x-ndjson': 'jsonl',
+        'application/jsonl': 'jsonl',
+        'application/x-jsonlines': 'jsonl',
+        'application/json': 'json',
+    }
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many activities at once from CSV, JSON lines or a JSON array.
+        
+        Send the rows either as the request body (Content-Type text/csv,
+        application/x-ndjson or application/json) or as a multipart 'file' upload
+        (.csv, .jsonl/.ndjson or .json; use this for large uploads).
+        
+        Query Parameters:
+        - project: default project ID for rows without a project column
+        - dry_run: 'true' to only validate
+        - atomic: 'true' to create nothing if any row is invalid
+        
+        Returns created/failed counts, a per-row error report and the created activity IDs.
+        """
+        from django.core.exceptions import RequestDataTooBig
+        from .utils.activity_ingest import read_activity_rows, ingest_activities, IngestFormatError
+
+        params = request.query_params
+        try:
+            if request.content_type.startswith('multipart/form-data'):
+                if 'file' not in request.FILES:
+                    return Response({'success': False, 'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+                upload = request.FILES['file']
+                extension = upload.name.lower().rsplit('.', 1)[-1]
+                fmt = {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl', 'json': 'json'}.get(extension)
+                content = upload.read()
+            else:
+                fmt = self.BULK_CONTENT_TYPES.get(request.content_type.split(';')[0].strip())
+                content = request.body
+        except RequestDataTooBig:
+            return Response({
+                'success': False,
+                'error': 'Request body too large, upload the rows as a multipart file instead'
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        if fmt is None:
+            return Response({
+                'success': False,
+                'error': 'Unsupported upload, send CSV, JSON lines or a JSON array'
+            }, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        dry_run = params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        try:
+            frame = read_activity_rows(content, fmt)
+            report = ingest_activities(
+                frame,
+                default_project_id=params.get('project'),
+                dry_run=dry_run,
+                atomic=params.get('atomic', '').lower() in ('1', 'true', 'yes'),
+            )
+        except IngestFormatError as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if report['created']:
+            response_status = status.HTTP_201_CREATED
+        elif report['failed']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_200_OK
+        return Response({'success': not report['failed'], 'dry_run': dry_run, **report}, status=response_status)
+
+class LCAProductViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    """LCA products with their exchanges. Supports ?fields= (see api.fieldsets)."""
     queryset = LCAProduct.objects.all()
     serializer_class = LCAProductSerializer
     lookup_field = "lca_id"
     permission_classes = [AllowAny]
 
+    field_relations = {'exchanges': {'prefetch_related': ['exchanges']}}
+
+    def get_queryset(self):
+        return self.apply_fieldset(LCAProduct.objects.all())
+
     @action(detail=True, methods=['post'])
     def update_graph(self, request, lca_id=None):
         """
         Update the product graph (exchanges) from the editor.
         Expects a list of exchanges in 'exchanges' key.
         """
+        from django.db import transaction
+        from .utils.lca_graph import sync_product_exchanges
+
         product = self.get_object()
         exchanges_data = request.data.get('exchanges', [])
         
         try:
-            # 1. Update product details if provided
-            if 'name' in request.data:
-                product.name = request.data['name']
-            if 'description' in request.data:
-                product.description = request.data['description']
-            if 'functional_unit' in request.data:
-                product.functional_unit = request.data['functional_unit']
-            product.save()
-
-            # 2. Sync exchanges
-            # Strategy: Delete all existing and recreate. 
-            # (Simple but effective for this scale. Preserving IDs would be better for complex apps but maybe overkill here)
-            product.exchanges.all().delete()
-            
-            for ex_data in exchanges_data:
-                # Resolve relationships
-                emission_factor = None
-                input_product = None
-                
-                if ex_data.get('emission_factor_id'):
-                    emission_factor = EmissionFactor.objects.get(pk=ex_data['emission_factor_id'])
-                elif ex_data.get('input_product_id'):
-                    input_product = LCAProduct.objects.get(pk=ex_data['input_product_id'])
-                
-                ProductExchange.objects.create(
-                    product=product,
-                    emission_factor=emission_factor,
-                    input_product=input_product,
-                    name=ex_data.get('name', 'Unknown'),
-                    quantity=ex_data.get('quantity', 0),
-                    unit=ex_data.get('unit', '')
-                )
-            
-            # 3. Recalculate total
-            product.calculate_total_footprint()
-            
+            with transaction.atomic():
+                # 1. Update product details if provided
+                if 'name' in request.data:
+                    product.name = request.data['name']
+                if 'description' in request.data:
+                    product.description = request.data['description']
+                if 'functional_unit' in request.data:
+                    product.functional_unit = request.data['functional_unit']
+                product.save()
+
+                # 2. Sync exchanges: matched by exchange_id, only changed rows are written
+                # and the footprints are recomputed once
+                sync_product_exchanges(product, exchanges_data)
+
+            # 3. Reload the recalculated total
+            product.refresh_from_db()
+
             # Return updated product
             serializer = self.get_serializer(product)
             return Response(serializer.data)
@@ -333,14 +565,23 @@ class ProductExchangeViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
 
 
-class LCAActivityViewSet(viewsets.ModelViewSet):
+class LCAActivityViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet for LCA activities that use Brightway2 processes
     Allows full LCA calculations with supply chain impacts
+    Supports ?fields= and ?expand=scope (see api.fieldsets); listings are cursor
+    paginated (see api.pagination).
     """
     queryset = LCAActivity.objects.all()
     serializer_class = LCAActivitySerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
+
+    field_relations = {'scope': {'select_related': ['scope']}}
+    field_dependencies = {'emissions_tco2e': ['calculated_emissions'], 'impact_method_display': ['impact_method']}
+
+    def get_queryset(self):
+        return self.apply_fieldset(LCAActivity.objects.all())
     
     def perform_create(self, serializer):
         """
@@ -490,71 +731,24 @@ class LCAActivityViewSet(viewsets.ModelViewSet):
 class BW2AdminViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
     
+    # Actions changing the Brightway databases listed in the reference-data bundle
+    DATABASE_WRITE_ACTIONS = {
+        'import_ecoinvent', 'delete_database', 'reset_project',
+        'create_custom_product', 'update_custom_product', 'delete_custom_product',
+    }
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self.action in self.DATABASE_WRITE_ACTIONS and status.is_success(response.status_code):
+            from .utils.response_cache import bump_data_version, BRIGHTWAY_KEY
+            bump_data_version(BRIGHTWAY_KEY)
+        return super().finalize_response(request, response, *args, **kwargs)
+    
     @action(detail=False, methods=['GET'])
     def list_impact_methods(self, request):
         """List notable impact methods for environmental assessment"""
         try:
-            import bw2data as bd
-            bd.projects.set_current("ZeroScope_LCA")
-            
-            # Define notable impact assessment methods
-            # Define keywords to look for, in order of priority
-            # We want to find IPCC methods first
-            
-            methods_list = []
-            
-            # Helper to score methods
-            def score_method(method_tuple):
-                name = ' '.join(method_tuple).lower()
-                score = 0
-                
-                # Must be climate change / GWP
-                if not ('climate change' in name and ('gwp' in name or 'global warming potential' in name)):
-                    return -1
-                
-                # Prefer IPCC
-                if 'ipcc' in name:
-                    score += 100
-                    if '2021' in name:
-                        score += 50  # Newest
-                    elif '2013' in name:
-                        score += 40
-                
-                # Prefer standard timeframes
-                if '100a' in name or '100 years' in name:
-                    score += 10
-                elif '20a' in name or '20 years' in name:
-                    score += 5
-                
-                # Penalize "no lt" (no long term) if we have standard ones, or maybe prefer them?
-                # Usually standard is better.
-                
-                return score
-
-            # Score all methods
-            scored_methods = []
-            for method in bd.methods:
-                s = score_method(method)
-                if s > 0:
-                    scored_methods.append((s, method))
-            
-            # Sort by score descending
-            scored_methods.sort(key=lambda x: x[0], reverse=True)
-            
-            # Take top 4
-            for _, method in scored_methods[:4]:
-                methods_list.append({
-                    'method': list(method),
-                    'name': ' - '.join(method)
-                })
-            
-            # If still empty (unlikely if database has methods), fallback to any
-            if not methods_list and len(bd.methods) > 0:
-                 for method in list(bd.methods)[:4]:
-                    methods_list.append({
-                        'method': list(method),
-                        'name': ' - '.join(method)
-                    })
+            from .utils.reference_bundle import notable_impact_methods
+            methods_list = notable_impact_methods()
             
             return Response({
                 'success': True,
@@ -1064,12 +1258,38 @@ class BW2AdminViewSet(viewsets.ViewSet):
 @permission_classes([AllowAny])
 def get_settings(request):
     """Get application settings"""
-    data = {
-        'PAGE_SIZE': settings.REST_FRAMEWORK['PAGE_SIZE'],
-        'AVAILABLE_SCOPES': [1, 2, 3],
-        'TOTAL_CATEGORIES': len(EmissionFactor.CATEGORY_CHOICES),
-    }
-    return Response(data, status=status.HTTP_200_OK)
+    from .utils.reference_bundle import app_settings
+    return Response(app_settings(), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def reference_data(request):
+    """
+    Settings, factor categories, impact methods and Brightway databases in one response,
+    for the frontend to load at startup instead of four requests.
+
+    'version' (also the ETag) is a hash of the content. The plain URL must be revalidated
+    (a matching If-None-Match gets a 304); requested with ?v=<version> it is cacheable
+    for a year, since that URL's content never changes.
+    """
+    from .utils.reference_bundle import get_reference_bundle
+    from .utils.response_cache import etag_matches
+    from django.utils.http import quote_etag
+
+    bundle, version = get_reference_bundle()
+    etag = quote_etag(version)
+    complete = 'errors' not in bundle
+    if request.query_params.get('v') == version and complete:
+        cache_control = 'public, max-age=31536000, immutable'
+    elif complete:
+        cache_control = 'public, no-cache'
+    else:
+        cache_control = 'no-store'
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+
+    if complete and etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response({'version': version, **bundle}, headers=headers)
 
 # DEPRECATED CRUD
 
@@ -1457,49 +1677,11 @@ class SensitivityAnalysisViewSet(viewsets.ViewSet):
                 impact_method = tuple(impact_method)
             
             # Calculate baseline emissions for each activity
-            activity_impacts = {}
-            baseline_total = 0.0
-            
-            scopes = project.scopes.all()
-            logger.info(f"Processing {scopes.count()} scopes")
-            
-            for scope in scopes:
-                logger.info(f"Processing Scope {scope.scope_number}")
-                # Process emission factor activities
-                for activity in scope.activities.all():
-                    if activity.emission_factor:
-                        impact = float(activity.quantity * activity.emission_factor.emission_factor_value) / 1000  # to tCO2e
-                        activity_impacts[str(activity.activity_id)] = {
-                            'name': activity.activity_name,
-                            'baseline': impact,
-                            'type': 'emission_factor',
-                            'scope': scope.scope_number
-                        }
-                        baseline_total += impact
-                
-                # Process LCA activities
-                for lca_activity in scope.lca_activities.all():
-                    try:
-                        # Check if LCA activity has been calculated
-                        if lca_activity.calculated_emissions is None or lca_activity.calculated_emissions == 0:
-                            # Skip uncalculated activities with a warning
-                            print(f"Warning: LCA activity '{lca_activity.activity_name}' has not been calculated (emissions = {lca_activity.calculated_emissions}). Skipping.")
-                            continue
-                        
-                        # Use the calculated_emissions from the model (in kgCO2e)
-                        impact = float(lca_activity.calculated_emissions) / 1000  # to tCO2e
-                        activity_impacts[str(lca_activity.activity_id)] = {
-                            'name': lca_activity.activity_name,
-                            'baseline': impact,
-                            'type': 'lca',
-                            'scope': scope.scope_number
-                        }
-                        baseline_total += impact
-                    except Exception as e:
-                        print(f"Error processing LCA activity {lca_activity.activity_name}: {e}")
+            from .utils.scenarios import collect_baseline_contributions
+            activity_impacts = collect_baseline_contributions(project)
             
             # Check if we have any activities to analyze
-            logger.info(f"Total activities found: {len(activity_impacts)}, baseline_total: {baseline_total}")
+            logger.info(f"Total activities found: {len(activity_impacts)}")
             
             if not activity_impacts:
                 logger.warning("No activities with emissions found")
@@ -1538,48 +1720,13 @@ class SensitivityAnalysisViewSet(viewsets.ViewSet):
                     }
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Calculate adjusted emissions
-            adjusted_total = 0.0
-            tornado_data = []
-            
-            for activity_id, activity_data in activity_impacts.items():
-                adjustment_pct = adjustments.get(activity_id, 0)
-                adjustment_factor = 1 + (adjustment_pct / 100)
-                adjusted_impact = activity_data['baseline'] * adjustment_factor
-                adjusted_total += adjusted_impact
-                
-                # Calculate impact of this activity on total
-                impact_change = adjusted_impact - activity_data['baseline']
-                
-                tornado_data.append({
-                    'activity': activity_data['name'][:40],  # Truncate for readability
-                    'activity_id': activity_id,
-                    'baseline': round(activity_data['baseline'], 4),
-                    'adjusted': round(adjusted_impact, 4),
-                    'impact': round(impact_change, 4),
-                    'scope': activity_data['scope']
-                })
-            
-            # Generate timeline projection
-            timeline = []
-            for year in range(timeline_years + 1):
-                year_factor = (1 + growth_rate) ** year
-                timeline.append({
-                    'year': year,
-                    'baseline': round(baseline_total * year_factor, 4),
-                    'adjusted': round(adjusted_total * year_factor, 4)
-                })
+            # Calculate adjusted emissions and timeline projection
+            from .utils.scenarios import build_analysis
+            analysis = build_analysis(activity_impacts, adjustments, timeline_years, growth_rate)
             
             return Response({
                 'success': True,
-                'baseline_total': round(baseline_total, 4),
-                'adjusted_total': round(adjusted_total, 4),
-                'impact_change': round(adjusted_total - baseline_total, 4),
-                'impact_change_pct': round((adjusted_total - baseline_total) / baseline_total * 100, 2) if baseline_total > 0 else 0,
-                'tornado': tornado_data,
-                'timeline': timeline,
-                'timeline_years': timeline_years,
-                'growth_rate': growth_rate
+                **analysis
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -1712,3 +1859,60 @@ class SensitivityAnalysisViewSet(viewsets.ViewSet):
                 'error': str(e),
                 'traceback': traceback.format_exc()
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ScenarioViewSet(viewsets.ModelViewSet):
+    """
+    Saved sensitivity scenarios.
+    The baseline snapshot is built once on create and then kept current by applying
+    per-activity deltas whenever an activity in the project changes.
+    Query params: project_id (optional filter)
+    """
+    queryset = Scenario.objects.all()
+    serializer_class = ScenarioSerializer
+    lookup_field = "scenario_id"
+    permission_classes = [AllowAny]
+
+    def get_queryset(self):
+        queryset = Scenario.objects.all()
+        project_id = self.request.query_params.get('project_id')
+        if project_id:
+            queryset = queryset.filter(project_id=project_id)
+        return queryset
+
+    def perform_create(self, serializer):
+        scenario = serializer.save()
+        scenario.rebuild_baseline()
+
+    def perform_update(self, serializer):
+        previous_project_id = serializer.instance.project_id
+        scenario = serializer.save()
+        if scenario.project_id != previous_project_id:
+            # Moved to another project, snapshot no longer applies
+            scenario.rebuild_baseline()
+        else:
+            # Adjustments may have changed, totals are recomputed from the snapshot only
+            scenario.recalculate_totals()
+            scenario.save(update_fields=['baseline_total', 'adjusted_total', 'last_modified'])
+
+    @action(detail=True, methods=['GET'])
+    def analysis(self, request, scenario_id=None):
+        """
+        Tornado chart data and timeline projections for the saved scenario,
+        computed from the stored baseline snapshot
+        """
+        scenario = self.get_object()
+        return Response({
+            'success': True,
+            'scenario_id': str(scenario.scenario_id),
+            'name': scenario.name,
+            **scenario.get_analysis()
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['POST'])
+    def rebaseline(self, request, scenario_id=None):
+        """Rebuild the baseline snapshot from the project's current activities"""
+        scenario = self.get_object()
+        scenario.rebuild_baseline()
+        serializer = self.get_serializer(scenario)
+        return Response(serializer.data, status=status.HTTP_200_OK)
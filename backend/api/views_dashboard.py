@@ -7,69 +7,91 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
 
-from django.db.models import Sum, Q
+from django.db.models import Sum, Q, F, Value, DecimalField
+from django.db.models.functions import Coalesce
 from datetime import timedelta, datetime
 from django.utils import timezone
 from decimal import Decimal
 from collections import defaultdict
 import calendar
 
-from .models import Project, EmissionScope, EmissionActivity, LCAActivity
+from .models import Project, EmissionActivity, LCAActivity, MonthlyEmissionRollup
+from .utils.ledger import ledger_series, queryset_records, weekly_series
+from .utils.rollups import rollup_series, rollup_totals_by_scope
+from .utils.response_cache import versioned_response_cache, project_key, PROJECTS_KEY, REFERENCE_KEY
+
+
+def dashboard_version_keys(request, project_id=None):
+    return [project_key(project_id) if project_id else PROJECTS_KEY, REFERENCE_KEY]
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@versioned_response_cache('dashboard_stats', dashboard_version_keys, per_day=True)
 def dashboard_stats(request, project_id=None):
     """
     Aggregate dashboard statistics with time-period support
     
     Query Parameters:
     - period: '3months', '6months', or '1year' (default: '6months')
+    - start / end: explicit date range (YYYY-MM-DD), overrides period
+    - granularity: 'week', 'month' or 'quarter' (default: 'month')
+    - include_projections: 'true' to add projected emissions of recurring activities
+      to monthly/quarterly buckets
     
     Returns:
     - total_emissions: Total emissions for the project (tCO₂e)
     - total_projects: 1 (or count if filtered by list)
-    - monthly_emissions: Array of {month, emissions, target} for chart
+    - monthly_emissions: Array of {month_name, period_start, emissions, target} per bucket for chart
+      (plus projected_emissions when include_projections is set)
     - emissions_by_scope: {scope_number: emissions} for pie chart
     - period: The period used for filtering
     """
     try:
         # Query parameters
-        period = request.GET.get('period', '6months')
+        granularity = request.GET.get('granularity', 'month')
+        if granularity not in GRANULARITIES:
+            return Response({
+                'success': False,
+                'error': f"granularity must be one of: {', '.join(GRANULARITIES)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        include_projections = request.GET.get('include_projections', '').lower() in ('1', 'true', 'yes')
+        if include_projections and granularity == 'week':
+            return Response({
+                'success': False,
+                'error': "Projections are monthly: use granularity 'month' or 'quarter'"
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Calculate date range
-        end_date = timezone.now().date()
-        if period == '3months':
-            start_date = end_date - timedelta(days=90)
-            months_back = 3
-        elif period == '1year':
-            start_date = end_date - timedelta(days=365)
-            months_back = 12
-        else:  # 6months default
-            start_date = end_date - timedelta(days=180)
-            months_back = 6
+        try:
+            start_date, end_date, period = parse_date_range(request)
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': f'Invalid date range: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get Projects
+        # Get Projects (None aggregates the whole portfolio without a project filter)
         if project_id:
             projects = Project.objects.filter(pk=project_id)
+            total_projects = projects.count()
         else:
-            projects = Project.objects.all()
-            
-        total_projects = projects.count()
+            projects = None
+            total_projects = Project.objects.count()
         
-        # Calculate total emissions (all time)
-        total_emissions = Decimal('0')
-        for project in projects:
-            for scope in project.scopes.all():
-                total_emissions += scope.total_emissions_tco2e or Decimal('0')
+        # Emissions by scope and total (all time), read from the monthly rollup table
+        scope_totals = rollup_totals_by_scope(projects)
+        total_emissions = sum(scope_totals.values(), Decimal('0'))
+        emissions_by_scope = {
+            scope_num: float(round(emissions, 2))
+            for scope_num, emissions in sorted(scope_totals.items())
+        }
         
-        # Monthly emissions (within period)
-        # Note: calculate_monthly_emissions needs to filter by project now too
-        monthly_data = calculate_monthly_emissions(start_date, end_date, months_back, projects)
-        
-        # Emissions by scope
-        emissions_by_scope = calculate_emissions_by_scope(projects)
+        # Emissions per time bucket (within period)
+        monthly_data = calculate_monthly_emissions(start_date, end_date, projects, granularity, include_projections)
         
         # Calculate monthly change (if we have at least 2 months of data)
         monthly_change = None
@@ -85,7 +107,10 @@ def dashboard_stats(request, project_id=None):
             'monthly_emissions': monthly_data,
             'emissions_by_scope': emissions_by_scope,
             'monthly_change': round(monthly_change, 1) if monthly_change is not None else None,
-            'period': period
+            'period': period,
+            'granularity': granularity,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
         })
         
     except Exception as e:
@@ -97,114 +122,270 @@ def dashboard_stats(request, project_id=None):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-def calculate_monthly_emissions(start_date, end_date, months_back, projects_queryset=None):
-    """
-    Calculate emissions for each month in the period.
-    Groups activities by their period_start month.
-    For activities without period_start, uses created_date.
+class PortfolioPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+# Sortable per-project summary fields (prefix with '-' for descending)
+PORTFOLIO_SORT_FIELDS = ('name', 'created_date', 'last_modified', 'total_emissions', 'scope_1', 'scope_2', 'scope_3')
+
+
+def portfolio_projects_queryset():
+    """Projects annotated with their all-time emissions per scope (tCO₂e) from the rollup table"""
+    decimal_zero = Value(Decimal('0'), output_field=DecimalField(max_digits=20, decimal_places=6))
+    scope_sums = {
+        f'scope_{number}': Coalesce(
+            Sum('monthly_rollups__emissions_tco2e', filter=Q(monthly_rollups__scope_number=number)),
+            decimal_zero
+        )
+        for number in (1, 2, 3)
+    }
+    return Project.objects.annotate(**scope_sums).annotate(
+        total_emissions=F('scope_1') + F('scope_2') + F('scope_3')
+    )
+
+
+def project_summary(project):
+    return {
+        'project_id': str(project.project_id),
+        'name': project.name,
+        'location': project.location,
+        'total_emissions': float(round(project.total_emissions, 2)),
+        'emissions_by_scope': {
+            number: float(round(getattr(project, f'scope_{number}'), 2)) for number in (1, 2, 3)
+        },
+        'last_modified': project.last_modified.isoformat() if project.last_modified else None,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@versioned_response_cache('dashboard_portfolio', lambda request: [PROJECTS_KEY, REFERENCE_KEY], per_day=True)
+def dashboard_portfolio(request):
     """
-    # Generate list of months
-    months = []
-    current = end_date
-    for i in range(months_back):
-        months.insert(0, {
-            'year': current.year,
-            'month': current.month,
-            'month_name': calendar.month_abbr[current.month],
-            'emissions': 0,
-            'target': 2000  # TODO: Make this configurable per project
-        })
-        # Go back one month
-        if current.month == 1:
-            current = current.replace(year=current.year - 1, month=12)
-        else:
-            current = current.replace(month=current.month - 1)
+    Portfolio-wide dashboard across all projects, computed with grouped aggregate
+    queries on the monthly rollup table (constant query count, however many projects).
     
-    # Base filters
-    ea_filter = Q()
-    lca_filter = Q()
-    
-    if projects_queryset is not None:
-        ea_filter &= Q(project__in=projects_queryset)
-        lca_filter &= Q(project__in=projects_queryset)
+    Query Parameters:
+    - period / start / end / granularity: time-series range, as for dashboard_stats
+      (granularity 'week' reads the activity tables)
+    - sort: per-project summary ordering, one of name, created_date, last_modified,
+      total_emissions, scope_1, scope_2, scope_3; prefix with '-' for descending
+      (default: '-total_emissions')
+    - page / page_size: pagination of the per-project summaries (default 50, max 500)
+    - top: number of highest-emitting projects to return (default: 5, max 100)
     
-    # Aggregate emissions by month
-    for month_data in months:
-        year = month_data['year']
-        month = month_data['month']
+    Returns:
+    - total_emissions / total_projects / emissions_by_scope: portfolio totals (all time, tCO₂e)
+    - top_projects: the `top` highest-emitting project summaries
+    - monthly_emissions: portfolio time series, as for dashboard_stats
+    - projects: paginated {count, next, previous, results} per-project summaries
+    """
+    try:
+        granularity = request.GET.get('granularity', 'month')
+        if granularity not in GRANULARITIES:
+            return Response({
+                'success': False,
+                'error': f"granularity must be one of: {', '.join(GRANULARITIES)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get first and last day of this month
-        first_day = datetime(year, month, 1).date()
-        last_day = datetime(year, month, calendar.monthrange(year, month)[1]).date()
+        sort = request.GET.get('sort', '-total_emissions')
+        if sort.lstrip('-') not in PORTFOLIO_SORT_FIELDS:
+            return Response({
+                'success': False,
+                'error': f"sort must be one of: {', '.join(PORTFOLIO_SORT_FIELDS)} (optionally prefixed with '-')"
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        monthly_total = Decimal('0')
+        try:
+            top = min(max(int(request.GET.get('top', 5)), 0), 100)
+            start_date, end_date, period = parse_date_range(request)
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': f'Invalid parameter: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Sum EmissionActivity emissions for this month
-        # Activities with period_start in this month
-        emission_activities = EmissionActivity.objects.filter(
-            ea_filter,
-            period_start__gte=first_day,
-            period_start__lte=last_day
-        )
-        for activity in emission_activities:
-            monthly_total += activity.calculated_emissions or Decimal('0')
+        # Portfolio totals: one grouped query on the rollup table
+        scope_totals = rollup_totals_by_scope()
+        total_emissions = sum(scope_totals.values(), Decimal('0'))
         
-        # Activities without period_start but created in this month
-        emission_activities_no_period = EmissionActivity.objects.filter(
-            ea_filter,
-            period_start__isnull=True,
-            created_date__date__gte=first_day,
-            created_date__date__lte=last_day
-        )
-        for activity in emission_activities_no_period:
-            monthly_total += activity.calculated_emissions or Decimal('0')
+        # Per-project summaries: one annotated query per page (plus the paginator's count)
+        projects = portfolio_projects_queryset()
+        paginator = PortfolioPagination()
+        try:
+            page = paginator.paginate_queryset(projects.order_by(sort, 'project_id'), request)
+        except NotFound as e:
+            return Response({'success': False, 'error': str(e.detail)}, status=status.HTTP_404_NOT_FOUND)
         
-        # Sum LCAActivity emissions for this month (convert from kgCO₂e to tCO₂e)
-        lca_activities = LCAActivity.objects.filter(
-            lca_filter,
-            period_start__gte=first_day,
-            period_start__lte=last_day
-        )
-        for activity in lca_activities:
-            monthly_total += (activity.calculated_emissions or Decimal('0')) / Decimal('1000')
+        top_projects = list(projects.order_by('-total_emissions', 'project_id')[:top]) if top else []
         
-        # LCA activities without period_start but created in this month
-        lca_activities_no_period = LCAActivity.objects.filter(
-            lca_filter,
-            period_start__isnull=True,
-            created_date__date__gte=first_day,
-            created_date__date__lte=last_day
-        )
-        for activity in lca_activities_no_period:
-            monthly_total += (activity.calculated_emissions or Decimal('0')) / Decimal('1000')
+        return Response({
+            'total_emissions': float(round(total_emissions, 2)),
+            'total_projects': paginator.page.paginator.count,
+            'emissions_by_scope': {
+                scope_num: float(round(emissions, 2))
+                for scope_num, emissions in sorted(scope_totals.items())
+            },
+            'top_projects': [project_summary(project) for project in top_projects],
+            'monthly_emissions': calculate_monthly_emissions(start_date, end_date, granularity=granularity),
+            'projects': {
+                'count': paginator.page.paginator.count,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+                'results': [project_summary(project) for project in page],
+            },
+            'sort': sort,
+            'period': period,
+            'granularity': granularity,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        })
         
-        month_data['emissions'] = float(round(monthly_total, 2))
-    
-    return months
+    except Exception as e:
+        import traceback
+        return Response({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 
+GRANULARITIES = ('week', 'month', 'quarter')
 
-def calculate_emissions_by_scope(projects_queryset=None):
+
+def parse_date_range(request):
     """
-    Calculate total emissions grouped by scope number.
-    Returns dict like {1: 45.2, 2: 67.8, 3: 10.45}
+    Resolve the date range for the time-series from query parameters.
+    Explicit start/end (YYYY-MM-DD) take precedence over the period shortcut.
+    Returns (start_date, end_date, period).
     """
-    emissions_by_scope = {}
+    period = request.GET.get('period', '6months')
+    # Whole months: the current month is included up to its last day
+    today = timezone.now().date()
+    end_date = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+    
+    if period == '3months':
+        months_back = 3
+    elif period == '1year':
+        months_back = 12
+    else:  # 6months default
+        months_back = 6
     
-    # Get all scopes
+    # First day of the month (months_back - 1) months ago, so the current month is included
+    start_date = end_date.replace(day=1)
+    for _ in range(months_back - 1):
+        start_date = (start_date - timedelta(days=1)).replace(day=1)
+    
+    start_param = request.GET.get('start')
+    end_param = request.GET.get('end')
+    if start_param:
+        start_date = datetime.strptime(start_param, '%Y-%m-%d').date()
+        period = 'custom'
+    if end_param:
+        end_date = datetime.strptime(end_param, '%Y-%m-%d').date()
+        period = 'custom'
+    
+    if start_date > end_date:
+        raise ValueError('start must be before end')
+    
+    return start_date, end_date, period
+
+
+def bucket_start(day, granularity):
+    """First day of the week (Monday), month or quarter containing day"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'quarter':
+        return day.replace(month=3 * ((day.month - 1) // 3) + 1, day=1)
+    return day.replace(day=1)
+
+
+def next_bucket(day, granularity):
+    """First day of the bucket following the one starting on day"""
+    if granularity == 'week':
+        return day + timedelta(days=7)
+    months = 3 if granularity == 'quarter' else 1
+    month_index = day.month - 1 + months
+    return day.replace(year=day.year + month_index // 12, month=month_index % 12 + 1, day=1)
+
+
+def bucket_label(day, granularity):
+    """Short chart label for a bucket"""
+    if granularity == 'week':
+        return f"W{day.isocalendar()[1]:02d} {day.year}"
+    if granularity == 'quarter':
+        return f"Q{(day.month - 1) // 3 + 1} {day.year}"
+    return calendar.month_abbr[day.month]
+
+
+def activities_in_range(model, start_date, end_date, projects_queryset=None):
+    """
+    Activities of model whose period overlaps start_date..end_date (inclusive): by
+    period_start/period_end, or by created_date (local date) when period_start is
+    missing. The two cases are separate range conditions so each can use its index.
+    """
+    queryset = model.objects.all()
     if projects_queryset is not None:
-        scopes = EmissionScope.objects.filter(project__in=projects_queryset)
+        queryset = queryset.filter(project__in=projects_queryset)
+
+    created_from = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+    created_until = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return queryset.filter(
+        Q(period_start__lte=end_date) & (Q(period_start__gte=start_date) | Q(period_end__gte=start_date)) |
+        Q(period_start__isnull=True, created_date__gte=created_from, created_date__lt=created_until)
+    )
+
+
+def calculate_monthly_emissions(start_date, end_date, projects_queryset=None, granularity='month', include_projections=False):
+    """
+    Calculate emissions (tCO₂e) for each week, month or quarter between start_date and end_date.
+    Months and quarters are read from the monthly rollup table in one query, where activities
+    are prorated over their period_start/period_end (see utils.ledger). Weeks read the
+    activities overlapping the range (one query per activity type) and prorate them by day
+    with the ledger's rules, so every granularity gives the same totals.
+    With include_projections, each bucket also gets projected_emissions from the projected
+    repetitions of recurring activities (one more query).
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    if include_projections and granularity == 'week':
+        raise ValueError("Projections are monthly: granularity must be 'month' or 'quarter'")
+    
+    if granularity == 'week':
+        records = []
+        for model, source_type in (
+            (EmissionActivity, MonthlyEmissionRollup.SOURCE_EMISSION_FACTOR),
+            (LCAActivity, MonthlyEmissionRollup.SOURCE_LCA),
+        ):
+            records.extend(queryset_records(activities_in_range(model, start_date, end_date, projects_queryset), source_type))
+        totals = weekly_series(records, start_date, end_date)
     else:
-        scopes = EmissionScope.objects.all()
+        totals = rollup_series(projects_queryset, start_date, end_date, granularity)
     
-    for scope in scopes:
-        scope_num = scope.scope_number
-        if scope_num not in emissions_by_scope:
-            emissions_by_scope[scope_num] = Decimal('0')
-        
-        emissions_by_scope[scope_num] += scope.total_emissions_tco2e or Decimal('0')
+    projected = defaultdict(Decimal)
+    if include_projections:
+        series = ledger_series(projects_queryset, start_date, end_date, include_projections=True, group_by='is_projection')
+        for (month, is_projection), total in series.items():
+            if is_projection:
+                projected[bucket_start(month, granularity)] += total
     
-    # Convert to float and round
-    return {
-        scope_num: float(round(emissions, 2))
-        for scope_num, emissions in emissions_by_scope.items()
-    }
+    # Emit every bucket in the range, including empty ones
+    buckets = []
+    current = bucket_start(start_date, granularity)
+    while current <= end_date:
+        buckets.append({
+            'year': current.year,
+            'month': current.month,
+            'month_name': bucket_label(current, granularity),
+            'period_start': current.isoformat(),
+            'emissions': float(round(totals.get(current, Decimal('0')), 2)),
+            'target': 2000  # TODO: Make this configurable per project
+        })
+        if include_projections:
+            buckets[-1]['projected_emissions'] = float(round(projected.get(current, Decimal('0')), 2))
+        current = next_bucket(current, granularity)
+    
+    return buckets
+
@@ -14,9 +14,20 @@ from decimal import Decimal
 import json
 
 from .models import Project, EmissionScope, EmissionActivity, LCAActivity
+from .utils.rollups import rollup_totals_by_scope
+from .utils.response_cache import versioned_response_cache, project_key, REFERENCE_KEY
+
+
+def report_version_keys(request):
+    project_id = request.GET.get('project_id')
+    if not project_id:
+        return None
+    return [project_key(project_id), REFERENCE_KEY]
+
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@versioned_response_cache('generate_report', report_version_keys, per_day=True)
 def generate_report(request):
     """
     Generate a report for a specific project and standard.
@@ -54,13 +65,16 @@ def generate_report(request):
         # Fetch Data (Scopes and Activities)
         scopes = project.scopes.all().prefetch_related('activities', 'lca_activities')
         
+        # All-time scope totals (like the activity details), read from the monthly rollup table
+        scope_totals = rollup_totals_by_scope(Project.objects.filter(pk=project.pk))
+        
         # Generate Standard-Specific Report
         if standard == 'ghg':
-            report_data.update(generate_ghg_report(scopes))
+            report_data.update(generate_ghg_report(scopes, scope_totals))
         elif standard == 'iso':
             report_data.update(generate_iso_report(scopes))
         elif standard == 'tcfd':
-            report_data.update(generate_tcfd_report(scopes))
+            report_data.update(generate_tcfd_report(scopes, scope_totals))
         else:
             return Response({'error': 'Invalid standard. Choose ghg, iso, or tcfd.'}, status=status.HTTP_400_BAD_REQUEST)
             
@@ -75,20 +89,28 @@ def generate_report(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-def generate_ghg_report(scopes):
+def generate_ghg_report(scopes, scope_totals=None):
     """
     Generates data for GHG Protocol Corporate Standard.
     Focus: Scope 1, 2, and 3 breakdown.
+    scope_totals ({scope_number: tCO₂e}) comes from the monthly rollup; falls back to
+    the stored scope totals when not given.
     """
     scope_data = {1: 0, 2: 0, 3: 0}
     scope_details = {1: [], 2: [], 3: []}
     total_emissions = 0
     
+    if scope_totals is not None:
+        for s_num, s_total in scope_totals.items():
+            scope_data[s_num] = float(s_total or 0)
+        total_emissions = sum(scope_data.values())
+    
     for scope in scopes:
         s_num = scope.scope_number
-        s_total = float(scope.total_emissions_tco2e or 0)
-        scope_data[s_num] = s_total
-        total_emissions += s_total
+        if scope_totals is None:
+            s_total = float(scope.total_emissions_tco2e or 0)
+            scope_data[s_num] = s_total
+            total_emissions += s_total
         
         def get_emissions(act):
             if hasattr(act, 'get_emissions_tco2e'):
@@ -166,13 +188,13 @@ def generate_iso_report(scopes):
     }
 
 
-def generate_tcfd_report(scopes):
+def generate_tcfd_report(scopes, scope_totals=None):
     """
     Generates data for TCFD (Task Force on Climate-related Financial Disclosures).
     Focus: Governance, Strategy, Risk Management, Metrics & Targets.
     """
     # Reuse GHG calculation for Metrics
-    ghg_data = generate_ghg_report(scopes)
+    ghg_data = generate_ghg_report(scopes, scope_totals)
     
     return {
         'governance': {
@@ -2,8 +2,10 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
 from .models import Project, EmissionActivity, LCAActivity
 from .utils.geocoding import get_coordinates
+from .utils.response_cache import versioned_response_cache, project_key
 import math
 
 from rest_framework.permissions import AllowAny
@@ -15,6 +17,9 @@ class GlobeDataView(APIView):
     """
     permission_classes = [AllowAny]
     
+    @method_decorator(versioned_response_cache(
+        'globe_data', lambda request, project_id: [project_key(project_id)]
+    ))
     def get(self, request, project_id):
         project = get_object_or_404(Project, pk=project_id)
         
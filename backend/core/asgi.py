@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
 application = get_asgi_application()
+
+# Build the factor autocomplete index before the first picker request (api.utils.autocomplete)
+from api.utils.autocomplete import warm_factor_index  # noqa: E402
+
+warm_factor_index()
@@ -43,6 +43,11 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES" : [
         "rest_framework.permissions.IsAuthenticated"
     ],
+    # orjson when installed, see api.renderers
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 20, 
 }
@@ -61,12 +66,15 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     'corsheaders',
     'api',
     'rest_framework',
 ]
 
 MIDDLEWARE = [
+    # First, so that it compresses the final response (gzip, or Brotli for JSON when installed)
+    "api.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -81,6 +89,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # React dev server
 ]
 
+# Let the frontend read ETags of cached responses
+CORS_EXPOSE_HEADERS = ['ETag']
+
 # CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOWS_CREDENTIALS = True
 
@@ -119,6 +130,38 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default; set REDIS_URL (e.g. redis://localhost:6379/1) to share the
+# response cache between worker processes (requires the redis package)
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'zeroscope',
+        }
+    }
+
+# Seconds a cached dashboard/globe/report response is kept (entries are also
+# invalidated by the data version in their key)
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 60 * 60))
+
+# Largest emission factor file accepted by the import endpoint, in MB. Imports
+# are streamed in chunks (see api.utils.sefr_importer), so memory use doesn't
+# grow with the file
+FACTOR_IMPORT_MAX_UPLOAD_MB = int(os.environ.get('FACTOR_IMPORT_MAX_UPLOAD_MB', 500))
+
+# Where uploaded factor files are kept while their import job runs (see api.utils.import_jobs)
+FACTOR_IMPORT_DIR = os.environ.get('FACTOR_IMPORT_DIR', str(BASE_DIR / 'data' / 'imports'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -25,7 +25,9 @@ import {
   Tab,
   Chip,
   Pagination,
-  Tooltip
+  Tooltip,
+  Checkbox,
+  FormControlLabel
 } from "@mui/material";
 import {
   Add as AddIcon,
@@ -76,6 +78,8 @@ function Data() {
   const [importStatus, setImportStatus] = useState("");
   const [importLoading, setImportLoading] = useState(false);
   const [importSummary, setImportSummary] = useState(null);
+  // Delta re-import: update changed factors and retire dropped ones
+  const [deltaImport, setDeltaImport] = useState(false);
 
   // Add Emission Factor Dialog state
   const [addFactorDialogOpen, setAddFactorDialogOpen] = useState(false);
@@ -202,6 +206,25 @@ function Data() {
     setImportSummary(null);
   };
 
+  // Poll a background import job until it finishes, resuming it if its server process stopped
+  const pollImportJob = async (jobId) => {
+    for (;;) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const response = await fetch(`/api/factor-import-jobs/${jobId}/`);
+      const job = await response.json();
+      if (!response.ok) {
+        throw new Error(job.detail || "Could not read the import progress");
+      }
+      if (job.status === "completed" || job.status === "failed") {
+        return job;
+      }
+      if (job.interrupted) {
+        await fetch(`/api/factor-import-jobs/${jobId}/resume/`, { method: "POST" });
+      }
+      setImportStatus(`Importing... ${job.rows_parsed} rows processed, ${job.rows_inserted} imported`);
+    }
+  };
+
   const handleImportClick = async () => {
     if (!excelFile) {
       setImportStatus("Please select an Excel file.");
@@ -213,6 +236,9 @@ function Data() {
     try {
       const formData = new FormData();
       formData.append("file", excelFile);
+      if (deltaImport) {
+        formData.append("mode", "delta");
+      }
 
       const response = await fetch("/api/emission-factors/import_excel/", {
         method: "POST",
@@ -227,10 +253,15 @@ function Data() {
       const data = await response.json();
 
       if (response.ok && data.success) {
-        setImportStatus("Import successful!");
-        setImportSummary(data.summary);
-        // Reset import dialog state for next import
-        setExcelFile(null);
+        const job = await pollImportJob(data.job.job_id);
+        setImportSummary(job.summary);
+        if (job.status === "completed") {
+          setImportStatus("Import successful!");
+          // Reset import dialog state for next import
+          setExcelFile(null);
+        } else {
+          setImportStatus("Import failed: " + (job.failure || "Unknown error"));
+        }
       } else {
         setImportStatus("Import failed: " + (data.error || data.message || "Unknown error"));
         setImportSummary(data.summary || null);
@@ -341,7 +372,7 @@ function Data() {
           </Button>
           <input
             type="file"
-            accept=".xlsx,.xls"
+            accept=".xlsx,.xls,.csv"
             style={{ display: "none" }}
             ref={fileInputRef}
             onChange={handleFileChange}
@@ -445,10 +476,20 @@ function Data() {
             <Typography>
               {excelFile ? `Selected file: ${excelFile.name}` : "No file selected."}
             </Typography>
+            <FormControlLabel
+              control={
+                <Checkbox
+                  checked={deltaImport}
+                  onChange={(e) => setDeltaImport(e.target.checked)}
+                  disabled={importLoading}
+                />
+              }
+              label="New release of the library (update changed factors, retire dropped ones)"
+            />
             {importLoading && (
               <Box sx={{ display: "flex", alignItems: "center", mt: 2 }}>
                 <CircularProgress size={24} sx={{ mr: 2 }} />
-                <Typography>Importing...</Typography>
+                <Typography>{importStatus || "Importing..."}</Typography>
               </Box>
             )}
             {importStatus && !importLoading && (
@@ -464,7 +505,26 @@ function Data() {
                   <li>Successfully imported: {importSummary.success_count}</li>
                   <li>Skipped (duplicates): {importSummary.skipped_count}</li>
                   <li>Errors: {importSummary.error_count}</li>
+                  {(importSummary.updated_count > 0 || importSummary.unchanged_count > 0 || importSummary.retired_count > 0) && (
+                    <>
+                      <li>Updated: {importSummary.updated_count}</li>
+                      <li>Unchanged: {importSummary.unchanged_count}</li>
+                      <li>Retired: {importSummary.retired_count}</li>
+                    </>
+                  )}
                 </ul>
+                {importSummary.value_changes && importSummary.value_changes.length > 0 && (
+                  <div>
+                    <strong>Value changes:</strong>
+                    <ul>
+                      {importSummary.value_changes.map((change) => (
+                        <li key={change.factor_id}>
+                          {change.name}: {change.old_value} → {change.new_value}
+                        </li>
+                      ))}
+                    </ul>
+                  </div>
+                )}
                 {importSummary.errors && importSummary.errors.length > 0 && (
                   <div>
                     <strong>Errors:</strong>
@@ -239,7 +239,7 @@ function Projects() {
                   </Typography>
                 </Box>
                 <Chip
-                  label={`${(project.scopes || []).reduce((acc, s) => acc + (s.activities?.length || 0) + (s.lca_activities?.length || 0), 0)} Activities`}
+                  label={`${project.activity_count ?? (project.scopes || []).reduce((acc, s) => acc + (s.activities?.length || 0) + (s.lca_activities?.length || 0), 0)} Activities`}
                   size="small"
                   variant="outlined"
                 />